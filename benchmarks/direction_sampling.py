@@ -0,0 +1,69 @@
+"""Benchmark the sampling of water parcel step directions.
+
+Compares the time to pick the step direction of all parcels at every step
+of an iteration, with each of the :obj:`~pyDeltaRCM.DeltaModel.water_sampling`
+modes of :obj:`~pyDeltaRCM.water_tools._choose_next_direction_from_table`:
+searching the cumulative sum of the weights of the cell (``search``),
+searching precomputed cumulative weights (``cumulative``), and picking from
+a precomputed Walker alias table (``alias``). The time to build the tables,
+once per iteration, is reported separately.
+
+Weights are random, with the weights of the cell itself and of one neighbor
+set to zero, and parcels are spread over the domain at random.
+
+Run with ``python benchmarks/direction_sampling.py``.
+"""
+import time
+
+import numpy as np
+
+from pyDeltaRCM import shared_tools
+from pyDeltaRCM import water_tools
+
+
+Np_water = 2000
+stepmax = 1000
+domain_shape = (200, 200)
+
+
+def make_tables(sampling, weights):
+    start = time.perf_counter()
+    if sampling == 'cumulative':
+        table = shared_tools.get_cumulative_table(weights)
+        alias = np.zeros((0, 9), dtype=np.int64)
+    elif sampling == 'alias':
+        table, alias = shared_tools.get_alias_table(weights)
+    else:
+        table = weights
+        alias = np.zeros((0, 9), dtype=np.int64)
+    return table, alias, time.perf_counter() - start
+
+
+def time_sampling(sampling, table, alias, inds):
+    _sampling = water_tools._WATER_SAMPLING[sampling]
+    start = time.perf_counter()
+    for _step in range(stepmax):
+        water_tools._choose_next_direction_from_table(
+            inds, table, alias, _sampling)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    n_cells = domain_shape[0] * domain_shape[1]
+    weights = np.random.uniform(0, 1, (n_cells, 9))
+    weights[:, 4] = 0
+    weights[:, 0] = 0
+    weights = weights / weights.sum(axis=1)[:, None]
+    inds = np.random.randint(1, n_cells, Np_water).astype(np.int64)
+
+    print('{:>11} {:>11} {:>11}'.format('sampling', 'tables', 'picks'))
+    for sampling in ['search', 'cumulative', 'alias']:
+        # compile the jitted functions
+        table, alias, _ = make_tables(sampling, weights[:10])
+        time_sampling(sampling, table, alias, inds[:10] % 10)
+
+        table, alias, t_table = make_tables(sampling, weights)
+        t_pick = time_sampling(sampling, table, alias, inds)
+        print('{:>11} {:>10.3f}s {:>10.3f}s'.format(
+            sampling, t_table, t_pick))
@@ -0,0 +1,84 @@
+"""Benchmark loop detection for water parcels against the walk length.
+
+Compares the time to check all steps of an iteration for looped parcels
+by searching the entire walk of each parcel at every step (the check that
+the hash set replaced), and with the visited-cell hash set of
+:obj:`~pyDeltaRCM.water_tools._record_visits` and
+:obj:`~pyDeltaRCM.water_tools._check_for_visited_loops`, which is updated
+in constant time per step.
+
+Parcels take distinct steps, so that no loops are found and every parcel
+is checked for the full `stepmax` steps.
+
+Run with ``python benchmarks/loop_detection.py``.
+"""
+import time
+
+import numpy as np
+from numba import njit
+
+from pyDeltaRCM import water_tools
+
+
+Np_water = 200
+domain_shape = (1000, 1000)
+
+
+@njit
+def check_walk_for_loops(walks, new_indices, _step, L0, looped,
+                         domain_shape, CTR, flag):
+    if (_step > L0):
+        for p in range(walks.shape[0]):
+            walk = walks[p, :]
+            _walk = walk[walk > 0]
+            if (new_indices[p] > 0) and (len(_walk) != len(set(_walk))):
+                looped[p] += 1
+                new_indices[p] = water_tools._relocate_looped_parcel(
+                    new_indices[p], L0, domain_shape, CTR)
+                flag[p] = -1
+    return new_indices, looped, flag
+
+
+def time_walk_matrix(stepmax):
+    walks = np.zeros((Np_water, stepmax + 1), dtype=np.int64)
+    walks[:, 0] = np.arange(Np_water) * (stepmax + 1) + 1
+    looped = np.zeros(Np_water, dtype=np.int64)
+    flag = np.zeros(Np_water, dtype=np.int64)
+
+    start = time.perf_counter()
+    for _step in range(1, stepmax + 1):
+        new_indices = walks[:, 0] + _step
+        check_walk_for_loops(
+            walks, new_indices, _step, 0, looped, domain_shape, 1, flag)
+        walks[:, _step] = new_indices
+    return time.perf_counter() - start
+
+
+def time_visited_set(stepmax):
+    start_indices = np.arange(Np_water) * (stepmax + 1) + 1
+    looped = np.zeros(Np_water, dtype=np.int64)
+    flag = np.zeros(Np_water, dtype=np.int64)
+    n_cells = domain_shape[0] * domain_shape[1]
+
+    start = time.perf_counter()
+    has_repeat = np.zeros(Np_water, dtype=np.bool_)
+    visited, n_visited = water_tools._record_visits(
+        start_indices, np.zeros(0, dtype=np.int64), 0, has_repeat, n_cells)
+    for _step in range(1, stepmax + 1):
+        new_indices = start_indices + _step
+        water_tools._check_for_visited_loops(
+            new_indices, has_repeat, _step, 0, looped, domain_shape, 1, flag)
+        visited, n_visited = water_tools._record_visits(
+            new_indices, visited, n_visited, has_repeat, n_cells)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    # compile the jitted functions
+    time_walk_matrix(2)
+    time_visited_set(2)
+
+    print('{:>8} {:>14} {:>14}'.format('stepmax', 'walk matrix', 'visited set'))
+    for stepmax in [250, 500, 1000, 2000, 4000]:
+        print('{:>8} {:>13.3f}s {:>13.3f}s'.format(
+            stepmax, time_walk_matrix(stepmax), time_visited_set(stepmax)))
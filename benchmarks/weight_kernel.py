@@ -0,0 +1,91 @@
+"""Benchmark the computation of the step direction weights of a cell.
+
+Compares the time per call of computing the weights of a cell with
+:obj:`~pyDeltaRCM.shared_tools.get_weight_sfc_int` followed by
+:obj:`~pyDeltaRCM.shared_tools.get_weight_at_cell`, which create temporary
+arrays for the neighbors of the cell, and with the allocation-free
+:obj:`~pyDeltaRCM.shared_tools.fill_weight_at_cell`, in the precision of the
+sediment routers.
+
+Fields are random, with some dry and land cells, and every cell of the
+domain is visited once per repetition.
+
+Run with ``python benchmarks/weight_kernel.py``.
+"""
+import time
+
+import numpy as np
+from numba import njit
+
+from pyDeltaRCM import shared_tools
+
+
+repeats = 20
+domain_shape = (200, 200)
+
+
+@njit
+def arrays(weights, stage, pad_stage, pad_depth, pad_cell_type, qx, qy,
+           ivec, jvec, distances, dry_depth, gamma, theta):
+    L, W = stage.shape
+    for i in range(L):
+        for j in range(W):
+            weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
+                stage[i, j], pad_stage[i:i + 3, j:j + 3].ravel(), qx[i, j],
+                qy[i, j], ivec, jvec, distances)
+            weights[i, j] = shared_tools.get_weight_at_cell(
+                (i, j), weight_sfc, weight_int,
+                pad_depth[i:i + 3, j:j + 3].ravel(),
+                pad_cell_type[i:i + 3, j:j + 3].ravel(), dry_depth, gamma,
+                theta)
+
+
+@njit
+def scalar(weights, stage, pad_stage, pad_depth, pad_cell_type, qx, qy,
+           ivec, jvec, distances, dry_depth, gamma, theta):
+    L, W = stage.shape
+    for i in range(L):
+        for j in range(W):
+            shared_tools.fill_weight_at_cell(
+                weights[i, j], i, j, stage, pad_stage, pad_depth,
+                pad_cell_type, qx, qy, ivec, jvec, distances, dry_depth,
+                gamma, theta)
+
+
+def time_kernel(kernel, weights, *args):
+    kernel(weights, *args)  # compile
+    start = time.perf_counter()
+    for _ in range(repeats):
+        kernel(weights, *args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    stage = np.random.uniform(0.5, 1, domain_shape).astype(np.float32)
+    depth = (stage - np.random.uniform(0, 0.85, domain_shape)).clip(0)
+    cell_type = np.random.choice([-2, 0, 1], domain_shape, p=[.1, .2, .7])
+    qx = np.random.uniform(-1, 1, domain_shape)
+    qy = np.random.uniform(-1, 1, domain_shape)
+    sqrt2 = np.sqrt(2)
+    sqrt05 = np.sqrt(0.5)
+    distances = np.array([sqrt2, 1, sqrt2, 1, 1, 1, sqrt2, 1, sqrt2],
+                         dtype=np.float32)
+    ivec = np.array([-sqrt05, 0, sqrt05, -1, 0, 1, -sqrt05, 0, sqrt05],
+                    dtype=np.float32)
+    jvec = np.array([-sqrt05, -1, -sqrt05, 0, 0, 0, sqrt05, 1, sqrt05],
+                    dtype=np.float32)
+    args = (stage, np.pad(stage, 1, 'edge'),
+            np.pad(depth.astype(np.float32), 1, 'edge'),
+            np.pad(cell_type, 1, 'edge'), qx, qy, ivec, jvec, distances,
+            np.float32(0.1), np.float32(0.001962), np.float32(1.))
+
+    n_calls = repeats * domain_shape[0] * domain_shape[1]
+    results = []
+    print('{:>8} {:>11}'.format('kernel', 'per call'))
+    for name, kernel in [('arrays', arrays), ('scalar', scalar)]:
+        weights = np.zeros(domain_shape + (9,))
+        elapsed = time_kernel(kernel, weights, *args)
+        results.append(weights)
+        print('{:>8} {:>9.1f}ns'.format(name, elapsed / n_calls * 1e9))
+    assert np.all(results[0] == results[1])
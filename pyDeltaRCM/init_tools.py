@@ -5,8 +5,9 @@ import warnings
 
 from math import floor, sqrt, pi
 import numpy as np
+from numba import typed
 
-from scipy.sparse import lil_matrix, csr_matrix
+from scipy.sparse import csr_matrix
 from scipy import ndimage
 
 from netCDF4 import Dataset
@@ -17,10 +18,18 @@ import abc
 
 from . import shared_tools
 from . import sed_tools
+from . import water_tools
+from . import iteration_tools
 
 # tools for initiating deltaRCM model domain
 
 
+# parameters that can be forced over time, and those of the inlet conditions
+_FORCING_INLET_PARAMETERS = ('u0', 'h0', 'N0_meters', 'C0_percent',
+                             'f_bedload')
+_FORCING_PARAMETERS = _FORCING_INLET_PARAMETERS + ('H_SL',)
+
+
 class init_tools(abc.ABC):
 
     def init_output_infrastructure(self):
@@ -153,6 +162,10 @@ class init_tools(abc.ABC):
         # handle a not implemented setup
         if self.save_checkpoint and self._toggle_subsidence:
             raise NotImplementedError('Cannot handle checkpointing with subsidence.')
+        if (self.save_strata and self.stream_strata
+                and self._toggle_subsidence):
+            raise NotImplementedError(
+                'Cannot handle streaming stratigraphy with subsidence.')
 
         # write the input file values to the log
         if not self._resume_checkpoint:
@@ -238,65 +251,33 @@ class init_tools(abc.ABC):
         self.theta_sand = self._coeff_theta_sand * self._theta_water
         self.theta_mud = self._coeff_theta_mud * self._theta_water
 
-        self.U_dep_mud = self._coeff_U_dep_mud * self._u0
-        self.U_ero_sand = self._coeff_U_ero_sand * self._u0
-        self.U_ero_mud = self._coeff_U_ero_mud * self._u0
-
         self.L = int(round(self._Length / self._dx))        # num cells in x
         self.W = int(round(self._Width / self._dx))         # num cells in y
 
-        # inlet length and width
+        # inlet length
         self.L0 = max(
             1, min(int(round(self._L0_meters / self._dx)), self.L // 4))
-        self.N0 = max(
-            3, min(int(round(self._N0_meters / self._dx)), self.W // 4))
 
         self.set_constants()
 
-        self.u_max = 2.0 * self._u0  # maximum allowed flow velocity
-        self.C0 = self._C0_percent * 1 / 100.  # sediment concentration
-
-        # (m) critial depth to switch to "dry" node
-        self.dry_depth = min(0.1, 0.1 * self._h0)
         self.CTR = floor(self.W / 2.) - 1
         if self.CTR <= 1:
             self.CTR = floor(self.W / 2.)
 
-        self.gamma = self.g * self._S0 * self._dx / (self._u0**2)
-
-        # (m^3) reference volume, volume to fill cell to characteristic depth
-        self.V0 = self.h0 * (self._dx**2)
-        self.Qw0 = self._u0 * self.h0 * self.N0 * self._dx    # const discharge
-
-        # at inlet
-        self.qw0 = self._u0 * self.h0  # water unit input discharge
-        self.Qp_water = self.Qw0 / self._Np_water    # volume each water parcel
-        self.qs0 = self.qw0 * self.C0  # sed unit discharge
-        # total amount of sed added to domain per timestep
-        self.dVs = 0.1 * self.N0**2 * self.V0
-        self.Qs0 = self.Qw0 * self.C0  # sediment total input discharge
-        self.Vp_sed = self.dVs / self._Np_sed   # volume of each sediment parcel
-
         # max number of jumps for parcel
         if self.stepmax is None:
             self.stepmax = 2 * (self.L + self.W)
         else:
             self.stepmax = int(self.stepmax)
 
-        # initial width of self.free_surf_walk_indices
+        # initial number of steps recorded in self.free_surf_walks
         self.size_indices = int(self.stepmax / 2)
 
-        self._dt = self.dVs / self.Qs0  # time step size
-
         self.omega_flow_iter = 2. / self._itermax
 
-        # number of times to repeat topo diffusion
-        self.N_crossdiff = int(round(self.dVs / self.V0))
-
         self._lambda = self._sed_lag  # sedimentation lag
 
-        self.diffusion_multiplier = (self._dt / self.N_crossdiff * self._alpha
-                                     * 0.5 / self._dx**2)
+        self.set_inlet_variables()
 
         self._save_any_grids = (self._save_eta_grids or
                                 self._save_depth_grids or
@@ -316,6 +297,88 @@ class init_tools(abc.ABC):
             self._save_metadata = True
         self._is_finalized = False
 
+    def set_inlet_variables(self):
+        """Model variables derived from the inlet boundary conditions.
+
+        Computes the variables that depend on the inlet flow conditions,
+        `channel_flow_velocity`, `channel_width`, `channel_flow_depth`, and
+        `influx_sediment_concentration`. This method is run by
+        :obj:`create_other_variables`, and by
+        :obj:`update_boundary_conditions` when an inlet flow condition is
+        changed.
+        """
+        self.U_dep_mud = self._coeff_U_dep_mud * self._u0
+        self.U_ero_sand = self._coeff_U_ero_sand * self._u0
+        self.U_ero_mud = self._coeff_U_ero_mud * self._u0
+
+        # inlet width
+        self.N0 = max(
+            3, min(int(round(self._N0_meters / self._dx)), self.W // 4))
+
+        self.u_max = 2.0 * self._u0  # maximum allowed flow velocity
+        self.C0 = self._C0_percent * 1 / 100.  # sediment concentration
+
+        # (m) critial depth to switch to "dry" node
+        self.dry_depth = min(0.1, 0.1 * self._h0)
+
+        self.gamma = self.g * self._S0 * self._dx / (self._u0**2)
+
+        # (m^3) reference volume, volume to fill cell to characteristic depth
+        self.V0 = self.h0 * (self._dx**2)
+        self.Qw0 = self._u0 * self.h0 * self.N0 * self._dx    # const discharge
+
+        # at inlet
+        self.qw0 = self._u0 * self.h0  # water unit input discharge
+        self.Qp_water = self.Qw0 / self._Np_water    # volume each water parcel
+        self.qs0 = self.qw0 * self.C0  # sed unit discharge
+        # total amount of sed added to domain per timestep
+        self.dVs = 0.1 * self.N0**2 * self.V0
+        self.Qs0 = self.Qw0 * self.C0  # sediment total input discharge
+        self.Vp_sed = self.dVs / self._Np_sed   # volume of each sediment parcel
+
+        self._dt = self.dVs / self.Qs0  # time step size
+
+        # number of times to repeat topo diffusion
+        self.N_crossdiff = int(round(self.dVs / self.V0))
+
+        self.diffusion_multiplier = (self._dt / self.N_crossdiff * self._alpha
+                                     * 0.5 / self._dx**2)
+
+    def update_boundary_conditions(self):
+        """Update the model after an inlet flow condition is changed.
+
+        Recomputes the variables derived from the inlet flow conditions with
+        :obj:`set_inlet_variables`, and sets the constants of the existing
+        sediment routers that depend on them, in place. Unlike
+        :obj:`create_other_variables` followed by
+        :obj:`init_sediment_routers`, no arrays are allocated and no routers
+        are constructed, so that the inlet flow conditions can be changed
+        cheaply at every timestep, e.g., to follow a hydrograph.
+        """
+        _msg = 'Updating inlet boundary conditions'
+        self.log_info(_msg, verbosity=2)
+
+        self.set_inlet_variables()
+
+        _shared = {'_dt': self._dt, 'Vp_sed': self.Vp_sed,
+                   'u_max': self.u_max, 'dry_depth': self.dry_depth,
+                   'gamma': self.gamma}
+        _mud = dict(_shared, U_dep_mud=self.U_dep_mud,
+                    U_ero_mud=self.U_ero_mud)
+        _sand = dict(_shared, qs0=self.qs0, _u0=self._u0,
+                     U_ero_sand=self.U_ero_sand, _f_bedload=self._f_bedload)
+
+        _mud_routers = [self._mr]
+        _sand_routers = [self._sr]
+        if self._sed_routing in ['batched', 'speculative']:
+            _mud_routers.extend(self._mr_chunks)
+            _sand_routers.extend(self._sr_chunks)
+        for _routers, _constants in [(_mud_routers, _mud),
+                                     (_sand_routers, _sand)]:
+            for _router in _routers:
+                for _name, _value in _constants.items():
+                    setattr(_router, _name, _value)
+
     def create_domain(self):
         """
         Creates the model domain
@@ -329,10 +392,17 @@ class init_tools(abc.ABC):
         self.X, self.Y = np.meshgrid(np.arange(0, self.W+1)*self._dx,
                                      np.arange(0, self.L+1)*self._dx)
 
-        self.cell_type = np.zeros((self.L, self.W), dtype=np.int64)
+        # fields used in the weights of parcel steps are padded with a
+        #   one-cell halo, which is filled by `fill_halo`. The depth and cell
+        #   type are views into the padded arrays; the stage is copied into
+        #   its padded array once per water iteration.
+        self.pad_cell_type = np.zeros((self.L + 2, self.W + 2), dtype=np.int64)
+        self.pad_stage = np.zeros((self.L + 2, self.W + 2), dtype=np.float32)
+        self.pad_depth = np.zeros((self.L + 2, self.W + 2), dtype=np.float32)
+        self.cell_type = self.pad_cell_type[1:-1, 1:-1]
         self.eta = np.zeros((self.L, self.W)).astype(np.float32)
         self.stage = np.zeros((self.L, self.W)).astype(np.float32)
-        self.depth = np.zeros((self.L, self.W)).astype(np.float32)
+        self.depth = self.pad_depth[1:-1, 1:-1]
         self.qx = np.zeros((self.L, self.W))
         self.qy = np.zeros((self.L, self.W))
         self.qxn = np.zeros((self.L, self.W))
@@ -344,11 +414,12 @@ class init_tools(abc.ABC):
         self.qs = np.zeros((self.L, self.W))
         self.Vp_dep_sand = np.zeros((self.L, self.W))
         self.Vp_dep_mud = np.zeros((self.L, self.W))
+        self.cf = np.zeros((self.L, self.W))
         self.free_surf_flag = np.zeros((self._Np_water,), dtype=np.int64)
         self.looped = np.zeros((self._Np_water,), dtype=np.int64)
-        self.free_surf_walk_indices = np.zeros((self._Np_water,
-                                                self.size_indices),
-                                               dtype=np.int64)
+        self.free_surf_walks = water_tools.ParcelWalks(
+            self._Np_water, (self.L, self.W), self.size_indices,
+            int(self.stepmax / 4))
         self.sfc_visit = np.zeros_like(self.depth)
         self.sfc_sum = np.zeros_like(self.depth)
 
@@ -398,8 +469,21 @@ class init_tools(abc.ABC):
         self.cell_type[:self.L0, channel_inds:y_channel_max] = cell_channel
 
         self.inlet = np.array(np.unique(np.where(self.cell_type == 1)[1]))
+
+        # cumulative weights of the inlet cells, to sample parcel starts
+        self._inlet_cumulative = shared_tools.get_inlet_cumulative(
+            np.ones_like(self.inlet, dtype=np.float64))
+
+        # unraveled indices of the neighbors of each cell, for parcel steps
+        self.neighbor_indices = shared_tools.get_neighbor_indices(
+            self.cell_type.shape)
         self.eta[:] = self.stage - self.depth
 
+        self.pad_stage[1:-1, 1:-1] = self.stage
+        shared_tools.fill_halo(self.pad_cell_type)
+        shared_tools.fill_halo(self.pad_stage)
+        shared_tools.fill_halo(self.pad_depth)
+
     def init_sediment_routers(self):
         """Initialize the sediment router object here.
 
@@ -410,25 +494,101 @@ class init_tools(abc.ABC):
         self.log_info(_msg, verbosity=1)
 
         # initialize the MudRouter object
-        self._mr = sed_tools.MudRouter(self._dt, self._dx, self.Vp_sed,
-                                       self.u_max, self.U_dep_mud, self.U_ero_mud,
-                                       self.ivec_flat, self.jvec_flat,
-                                       self.iwalk_flat, self.jwalk_flat,
-                                       self.distances_flat, self.dry_depth, self.gamma,
-                                       self._lambda, self._beta,  self.stepmax,
-                                       self.theta_mud)
+        _mud_args = (self._dt, self._dx, self.Vp_sed,
+                     self.u_max, self.U_dep_mud, self.U_ero_mud,
+                     self.ivec_flat, self.jvec_flat,
+                     self.iwalk_flat, self.jwalk_flat,
+                     self.distances_flat, self.dry_depth, self.gamma,
+                     self._lambda, self._beta,  self.stepmax,
+                     self.theta_mud)
+        self._mr = sed_tools.MudRouter(*_mud_args)
         # initialize the SandRouter object
-        self._sr = sed_tools.SandRouter(self._dt, self._dx, self.Vp_sed,
-                                        self.u_max, self.qs0, self._u0, self.U_ero_sand,
-                                        self._f_bedload,
-                                        self.ivec_flat, self.jvec_flat,
-                                        self.iwalk_flat, self.jwalk_flat,
-                                        self.distances_flat, self.dry_depth, self.gamma,
-                                        self._beta, self.stepmax,
-                                        self.theta_sand)
+        _sand_args = (self._dt, self._dx, self.Vp_sed,
+                      self.u_max, self.qs0, self._u0, self.U_ero_sand,
+                      self._f_bedload,
+                      self.ivec_flat, self.jvec_flat,
+                      self.iwalk_flat, self.jwalk_flat,
+                      self.distances_flat, self.dry_depth, self.gamma,
+                      self._beta, self.stepmax,
+                      self.theta_sand)
+        self._sr = sed_tools.SandRouter(*_sand_args)
+
+        # one router of each kind per chunk, for the batched and speculative
+        #   routing
+        if self._sed_routing in ['batched', 'speculative']:
+            _n_chunks = shared_tools.get_num_chunks(self._threaded)
+            self._mr_chunks = typed.List(
+                [sed_tools.MudRouter(*_mud_args) for _ in range(_n_chunks)])
+            self._sr_chunks = typed.List(
+                [sed_tools.SandRouter(*_sand_args) for _ in range(_n_chunks)])
+
+        self.bind_sediment_routers()
+
+    def init_forcing(self):
+        """Convert the forcing schedules to tables.
+
+        The schedule of each parameter in
+        :obj:`~pyDeltaRCM.DeltaModel.forcing` is converted once to arrays of
+        time and value, which are interpolated at every timestep by
+        :obj:`~pyDeltaRCM.iteration_tools.iteration_tools.apply_forcing`.
+
+        Raises
+        ------
+        ValueError
+            If a parameter cannot be forced, or a schedule is not a table of
+            two columns with increasing times.
+        """
+        self._forcing_tables = dict()
+        if self._forcing is None:
+            return
+
+        _msg = 'Initializing forcing schedules'
+        self.log_info(_msg, verbosity=1)
+
+        for _name, _schedule in self._forcing.items():
+            if _name not in _FORCING_PARAMETERS:
+                raise ValueError(
+                    'Cannot force parameter "%s", forcing is possible for: '
+                    '%s' % (_name, ', '.join(_FORCING_PARAMETERS)))
+
+            if isinstance(_schedule, dict):
+                _table = np.column_stack((_schedule['time'],
+                                          _schedule['value']))
+            elif isinstance(_schedule, (str, os.PathLike)):
+                _path = _schedule
+                if self.input_file and not os.path.isabs(_path):
+                    _path = os.path.join(
+                        os.path.dirname(self.input_file), _path)
+                if str(_path).endswith('.npy'):
+                    _table = np.load(_path)
+                else:
+                    _table = np.loadtxt(_path, delimiter=None, ndmin=2)
+            else:
+                _table = np.asarray(_schedule)
+
+            _table = np.asarray(_table, dtype=np.float64)
+            if (_table.ndim != 2) or (_table.shape[1] != 2) or \
+                    (_table.shape[0] == 0):
+                raise ValueError(
+                    'Forcing schedule for "%s" must be a table of two '
+                    'columns, time and value.' % _name)
+            if np.any(np.diff(_table[:, 0]) <= 0):
+                raise ValueError(
+                    'Forcing schedule for "%s" must have increasing '
+                    'times.' % _name)
+
+            self._forcing_tables[_name] = (_table[:, 0].copy(),
+                                           _table[:, 1].copy())
+
+        # inlet conditions require the derived variables to be updated
+        self._forcing_inlet = any(_name in _FORCING_INLET_PARAMETERS
+                                  for _name in self._forcing_tables)
 
     def init_stratigraphy(self):
-        """Creates sparse array to store stratigraphy data."""
+        """Creates sparse stores for stratigraphy data.
+
+        See :obj:`~pyDeltaRCM.iteration_tools.StrataStore`.
+        """
         _msg = 'Initializing stratigraphy storage'
         self.log_info(_msg, verbosity=1)
         if self.save_strata:
@@ -437,12 +597,16 @@ class init_tools(abc.ABC):
 
             self.n_steps = int(max(1, 5 * int(self._save_dt / self.dt)))
 
-            self.strata_sand_frac = lil_matrix((self.L * self.W, self.n_steps),
-                                               dtype=np.float32)
+            self.strata_sand_frac = iteration_tools.StrataStore(
+                self.L * self.W, self.n_steps, dtype=np.float32)
 
             self.init_eta = self.eta.copy()
-            self.strata_eta = lil_matrix((self.L * self.W, self.n_steps),
-                                         dtype=np.float32)
+            self.strata_eta = iteration_tools.StrataStore(
+                self.L * self.W, self.n_steps, dtype=np.float32)
+
+            if self._preserve_strata:
+                self.strata_preserved = iteration_tools.PreservedStrata(
+                    self.L * self.W)
 
     def init_output_file(self):
         """Creates a netCDF file to store output grids.
@@ -539,6 +703,23 @@ class init_tools(abc.ABC):
                     'velocity_y', 'f4', ('total_time', 'length', 'width'))
                 velocity_y.units = 'meters per second'
 
+            # set up variables for stratigraphy written as it is saved
+            if self.save_strata and self.stream_strata:
+                self.output_netcdf.createDimension('total_strata_age', None)
+                strata_age = self.output_netcdf.createVariable(
+                    'strata_age', np.int32, ('total_strata_age',))
+                strata_age.units = 'second'
+                sand_frac = self.output_netcdf.createVariable(
+                    'strata_sand_frac', np.float32,
+                    ('total_strata_age', 'length', 'width'),
+                    zlib=True, chunksizes=(1, self.L, self.W))
+                sand_frac.units = 'fraction'
+                strata_elev = self.output_netcdf.createVariable(
+                    'strata_depth', np.float32,
+                    ('total_strata_age', 'length', 'width'),
+                    zlib=True, chunksizes=(1, self.L, self.W))
+                strata_elev.units = 'meters'
+
             # set up metadata group and populate variables
             def _create_meta_variable(varname, varvalue, varunits,
                                       vartype='f4', vardims=()):
@@ -632,15 +813,15 @@ class init_tools(abc.ABC):
         self._time_iter = int(checkpoint['time_iter'])
         self._save_iter = int(checkpoint['save_iter'])
         self._save_time_since_last = int(checkpoint['save_time_since_last'])
-        self.uw = checkpoint['uw']
-        self.ux = checkpoint['ux']
-        self.uy = checkpoint['uy']
-        self.qw = checkpoint['qw']
-        self.qx = checkpoint['qx']
-        self.qy = checkpoint['qy']
-        self.depth = checkpoint['depth']
-        self.stage = checkpoint['stage']
-        self.eta = checkpoint['eta']
+        self.uw[:] = checkpoint['uw']
+        self.ux[:] = checkpoint['ux']
+        self.uy[:] = checkpoint['uy']
+        self.qw[:] = checkpoint['qw']
+        self.qx[:] = checkpoint['qx']
+        self.qy[:] = checkpoint['qy']
+        self.depth[:] = checkpoint['depth']
+        self.stage[:] = checkpoint['stage']
+        self.eta[:] = checkpoint['eta']
         self.n_steps = checkpoint['n_steps']
         self.init_eta = checkpoint['init_eta']
         self.strata_counter = checkpoint['strata_counter']
@@ -658,13 +839,32 @@ class init_tools(abc.ABC):
                                     checkpoint['eta_indices'],
                                     checkpoint['eta_indptr']),
                                     shape=checkpoint['eta_shape'])
-        self.strata_eta = strata_eta_csr.tolil()
+        self.strata_eta = iteration_tools.StrataStore.from_matrix(
+            strata_eta_csr, self.strata_counter)
+        if 'eta_offsets' in checkpoint:
+            self.strata_eta.set_offsets(checkpoint['eta_offsets'],
+                                        checkpoint['eta_offset_columns'],
+                                        checkpoint['eta_offset_ids'])
+        if self._preserve_strata and ('preserved_start' in checkpoint):
+            self.strata_preserved = iteration_tools.PreservedStrata.from_arrays(
+                checkpoint['preserved_start'], checkpoint['preserved_elev'],
+                checkpoint['preserved_size'],
+                checkpoint['preserved_subsidence'], self.strata_counter)
+        elif self._preserve_strata:
+            # checkpoint without preserved surfaces, record them again
+            self.strata_preserved = iteration_tools.PreservedStrata(
+                self.L * self.W)
+            for i in range(self.strata_counter):
+                _surface = self.strata_eta.column(i)
+                _surface[_surface == 0] = self.init_eta.flat[_surface == 0]
+                self.strata_preserved.record(_surface)
         # get strata_sand_frac
         strata_sand_csr = csr_matrix((checkpoint['sand_data'],
                                      checkpoint['sand_indices'],
                                      checkpoint['sand_indptr']),
                                      shape=checkpoint['sand_shape'])
-        self.strata_sand_frac = strata_sand_csr.tolil()
+        self.strata_sand_frac = iteration_tools.StrataStore.from_matrix(
+            strata_sand_csr, self.strata_counter)
 
         # re-open the netCDF4 file
         _msg = 'Reopening NetCDF4 output file'
@@ -4,10 +4,11 @@ import os
 import warnings
 
 import numpy as np
+from numba import njit
 import matplotlib.pyplot as plt
 import mpl_toolkits.axes_grid1 as axtk
 
-from scipy.sparse import lil_matrix, csc_matrix, hstack
+from scipy.sparse import csc_matrix, hstack
 
 import abc
 
@@ -23,6 +24,28 @@ class iteration_tools(abc.ABC):
     these operations largely occur when saving and updating the model.
     """
 
+    def apply_forcing(self):
+        """Apply the forcing schedules at the current model time.
+
+        The first operation called by :meth:`update`. The value of each
+        forced parameter (see :obj:`~pyDeltaRCM.DeltaModel.forcing`) is
+        interpolated from its table at the model time, and set on the model.
+        If an inlet condition is forced, the variables derived from the
+        inlet conditions and the sediment routers are updated in place with
+        :obj:`~pyDeltaRCM.init_tools.init_tools.update_boundary_conditions`.
+        """
+        if not self._forcing_tables:
+            return
+
+        for _name, (_time, _value) in self._forcing_tables.items():
+            _val = float(np.interp(self._time, _time, _value))
+            setattr(self, _name, _val)
+            _msg = 'Forcing `{name}`: {val}'.format(name=_name, val=_val)
+            self.log_info(_msg, verbosity=2)
+
+        if self._forcing_inlet:
+            self.update_boundary_conditions()
+
     def run_one_timestep(self):
         """Run the timestep once.
 
@@ -121,6 +144,10 @@ class iteration_tools(abc.ABC):
     def expand_stratigraphy(self):
         """Expand stratigraphy array sizes.
 
+        Adds room for :obj:`n_steps` more columns to the stratigraphy stores
+        (see :obj:`StrataStore.expand`). The columns already stored are not
+        copied.
+
         Parameters
         ----------
 
@@ -131,18 +158,29 @@ class iteration_tools(abc.ABC):
         _msg = 'Expanding stratigraphy arrays'
         self.log_info(_msg, verbosity=1)
 
-        lil_blank = lil_matrix((self.L * self.W, self.n_steps),
-                               dtype=np.float32)
-
-        self.strata_eta = hstack([self.strata_eta, lil_blank], format='lil')
-        self.strata_sand_frac = hstack([self.strata_sand_frac, lil_blank],
-                                       format='lil')
+        self.strata_eta.expand(self.n_steps)
+        self.strata_sand_frac.expand(self.n_steps)
 
     def record_stratigraphy(self):
         """Save stratigraphy to file.
 
         Saves the sand fraction of deposited sediment into a sparse array
-        created by :obj:`~pyDeltaRCM.DeltaModel.init_stratigraphy()`.
+        created by :obj:`~pyDeltaRCM.DeltaModel.init_stratigraphy()`. The
+        cells with a record are appended as a new column of the
+        :obj:`StrataStore`, at a cost proportional to the number of cells
+        recorded. If the domain is subsiding, the subsidence of the
+        stratigraphy saved before is recorded as an offset (see
+        :obj:`StrataStore.subtract`), which is applied only when the
+        stratigraphy is read or written out.
+
+        If :obj:`~pyDeltaRCM.DeltaModel.stream_strata` is True, the
+        stratigraphy is instead written directly to the output netCDF file
+        (see :obj:`write_strata_slice`), and is not kept in memory.
+
+        If :obj:`~pyDeltaRCM.DeltaModel.preserve_strata` is True, the bed
+        elevation is also recorded as a new surface of the
+        :obj:`PreservedStrata`, which clips the preserved surfaces saved
+        before wherever the bed has been eroded below them.
 
         Only runs if :obj:`~pyDeltaRCM.DeltaModel.save_strata` is True.
 
@@ -163,7 +201,8 @@ class iteration_tools(abc.ABC):
 
         if self.save_strata:
 
-            if self.strata_counter >= self.strata_eta.shape[1]:
+            if ((not self._stream_strata) and
+                    (self.strata_counter >= self.strata_eta.shape[1])):
                 self.expand_stratigraphy()
 
             _msg = 'Storing stratigraphy data'
@@ -185,33 +224,46 @@ class iteration_tools(abc.ABC):
                                    / (self.Vp_dep_mud[sand_loc]
                                       + self.Vp_dep_sand[sand_loc])
                                    )
-            # store indices and sand_frac into a sparse array
+            # store indices and sand_frac into strata_sand_frac
             row_s = np.where(sand_frac.flatten() >= 0)[0]
-            col_s = np.zeros((len(row_s),))
             data_s = sand_frac[sand_frac >= 0]
-
-            sand_sparse = csc_matrix((data_s, (row_s, col_s)),
-                                     shape=(self.L * self.W, 1))
-            # store sand_sparse into strata_sand_frac
-            self.strata_sand_frac[:, self.strata_counter] = sand_sparse
+            if self._stream_strata:
+                sf = np.zeros((self.L * self.W,), dtype=np.float32)
+                sf[row_s] = data_s
+            else:
+                self.strata_sand_frac.append(row_s, data_s)
 
             # ------------------ eta ------------------
             diff_eta = self.eta - self.init_eta
 
             row_s = np.where(diff_eta.flatten() != 0)[0]
-            col_s = np.zeros((len(row_s),))
             data_s = self.eta[diff_eta != 0]
+            if self._stream_strata:
+                sz = np.zeros((self.L * self.W,), dtype=np.float32)
+                sz[row_s] = data_s
+                self.write_strata_slice(self.strata_counter, sf, sz)
+                self.output_netcdf.sync()
+            else:
+                self.strata_eta.append(row_s, data_s)
+
+            _subsiding = (self._toggle_subsidence and
+                          (self._time >= self._start_subsidence))
+            if _subsiding:
+
+                self.strata_eta.subtract(self.sigma.flatten(),
+                                         self.strata_counter)
 
-            eta_sparse = csc_matrix((data_s, (row_s, col_s)),
-                                    shape=(self.L * self.W, 1))
-            self.strata_eta[:, self.strata_counter] = eta_sparse
+            # ------------------ preserved surfaces ------------------
+            if self._preserve_strata:
 
-            if self._toggle_subsidence and (self._time >= self._start_subsidence):
+                if _subsiding:
+                    self.strata_preserved.subtract(self.sigma.flatten())
 
-                sigma_change = (self.strata_eta[:, :self.strata_counter]
-                                - self.sigma.flatten()[:, np.newaxis])
-                self.strata_eta[:, :self.strata_counter] = lil_matrix(
-                    sigma_change)
+                _n_clipped = self.strata_preserved.record(self.eta.flatten())
+
+                _msg = 'Preserved surfaces clipped in {0} cells'.format(
+                    _n_clipped)
+                self.log_info(_msg, verbosity=2)
 
             self.strata_counter += 1
 
@@ -395,7 +447,9 @@ class iteration_tools(abc.ABC):
         """Save stratigraphy as sparse matrix to file.
 
         Saves the stratigraphy (sand fraction) sparse matrices into output
-        netcdf file.
+        netcdf file. If :obj:`~pyDeltaRCM.DeltaModel.stream_strata` is True,
+        the stratigraphy has already been written as it was saved, and only
+        the ages of the saves are written.
 
         .. note:
 
@@ -421,47 +475,88 @@ class iteration_tools(abc.ABC):
                 self.logger.error(_msg)
                 raise RuntimeError(_msg)
 
-            self.strata_eta = self.strata_eta[:, :self.strata_counter]
-
-            shape = self.strata_eta.shape
+            shape = (self.L * self.W, self.strata_counter)
 
-            total_strata_age = self.output_netcdf.createDimension(
-                'total_strata_age',
-                shape[1])
+            if self._stream_strata:
+                # slices were written as they were saved, only set the ages
+                self.output_netcdf.variables['strata_age'][
+                    :] = list(range(shape[1] - 1, -1, -1))
 
-            strata_age = self.output_netcdf.createVariable('strata_age',
-                                                           np.int32,
-                                                           ('total_strata_age'))
-            strata_age.units = 'second'
-            self.output_netcdf.variables['strata_age'][
-                :] = list(range(shape[1] - 1, -1, -1))
+            else:
+                total_strata_age = self.output_netcdf.createDimension(
+                    'total_strata_age',
+                    shape[1])
 
-            sand_frac = self.output_netcdf.createVariable('strata_sand_frac',
-                                                          np.float32,
-                                                          ('total_strata_age', 'length', 'width'))
-            sand_frac.units = 'fraction'
+                strata_age = self.output_netcdf.createVariable('strata_age',
+                                                               np.int32,
+                                                               ('total_strata_age'))
+                strata_age.units = 'second'
+                self.output_netcdf.variables['strata_age'][
+                    :] = list(range(shape[1] - 1, -1, -1))
 
-            strata_elev = self.output_netcdf.createVariable('strata_depth',
-                                                            np.float32,
-                                                            ('total_strata_age', 'length', 'width'))
-            strata_elev.units = 'meters'
+                sand_frac = self.output_netcdf.createVariable('strata_sand_frac',
+                                                              np.float32,
+                                                              ('total_strata_age', 'length', 'width'))
+                sand_frac.units = 'fraction'
 
-            for i in range(shape[1]):
+                strata_elev = self.output_netcdf.createVariable('strata_depth',
+                                                                np.float32,
+                                                                ('total_strata_age', 'length', 'width'))
+                strata_elev.units = 'meters'
 
-                sf = self.strata_sand_frac[:, i].toarray()
-                sf = sf.reshape(self.eta.shape)
-                sf[sf == 0] = -1
+                for i in range(shape[1]):
 
-                self.output_netcdf.variables['strata_sand_frac'][i, :, :] = sf
+                    self.write_strata_slice(i, self.strata_sand_frac.column(i),
+                                            self.strata_eta.column(i))
 
-                sz = self.strata_eta[:, i].toarray().reshape(self.eta.shape)
-                sz[sz == 0] = self.init_eta[sz == 0]
+            if self._preserve_strata:
+                strata_preserved = self.output_netcdf.createVariable(
+                    'strata_preserved_depth', np.float32,
+                    ('total_strata_age', 'length', 'width'),
+                    zlib=True, chunksizes=(1, self.L, self.W))
+                strata_preserved.units = 'meters'
 
-                self.output_netcdf.variables['strata_depth'][i, :, :] = sz
+                for i in range(shape[1]):
+                    strata_preserved[i, :, :] = self.strata_preserved.surface(
+                        i).reshape(self.eta.shape)
 
             _msg = 'Stratigraphy data saved.'
             self.log_info(_msg, verbosity=0)
 
+    def write_strata_slice(self, i, sf, sz):
+        """Write one save of stratigraphy to the output netCDF file.
+
+        Writes the sand fraction `sf` and the elevation `sz` of save `i`,
+        given as flattened columns of the stratigraphy (i.e., as returned by
+        :obj:`StrataStore.column`), to the ``strata_sand_frac`` and
+        ``strata_depth`` variables. Cells without a record are written as
+        -1 and as the initial bed elevation, respectively.
+
+        Parameters
+        ----------
+        i : :obj:`int`
+            Index of the save along the ``total_strata_age`` dimension.
+
+        sf : :obj:`ndarray`
+            Sand fraction of each cell.
+
+        sz : :obj:`ndarray`
+            Elevation of each cell.
+
+        Returns
+        -------
+
+        """
+        sf = sf.reshape(self.eta.shape)
+        sf[sf == 0] = -1
+
+        self.output_netcdf.variables['strata_sand_frac'][i, :, :] = sf
+
+        sz = sz.reshape(self.eta.shape)
+        sz[sz == 0] = self.init_eta[sz == 0]
+
+        self.output_netcdf.variables['strata_depth'][i, :, :] = sz
+
     def make_figure(self, var, timestep):
         """Create a figure.
 
@@ -574,18 +669,27 @@ class iteration_tools(abc.ABC):
         - Current random seed state
         - Stratigraphic 'topography' in 'strata_eta.npz'
         - Stratigraphic sand fraction in 'strata_sand_frac.npz'
+        - Preserved stratigraphic surfaces, if `preserve_strata` is on
         If `save_checkpoint` is turned on, checkpoints are re-written
         with either a frequency of `checkpoint_dt` or `save_dt` if
         `checkpoint_dt` has not been explicitly defined.
         """
         ckp_file = os.path.join(self.prefix, 'checkpoint.npz')
-        # convert sparse arrays to csr type so they are easier to save
-        csr_strata_eta = self.strata_eta.tocsr()
+        # convert sparse arrays to csr type so they are easier to save, the
+        #   subsidence of strata_eta is saved separately as offsets
+        csr_strata_eta = self.strata_eta.tocsr(raw=True)
         csr_strata_sand_frac = self.strata_sand_frac.tocsr()
         # advance _time_iter since this is before update step fully finishes
         _time_iter = self._time_iter + int(1)
         # get rng state
         rng_state = shared_tools.get_random_state()
+        # stacks of the preserved surfaces
+        _preserved = {}
+        if self._preserve_strata:
+            _arrays = self.strata_preserved.compact()
+            for _name, _array in zip(['start', 'elev', 'size', 'subsidence'],
+                                     _arrays):
+                _preserved['preserved_' + _name] = _array
 
         np.savez_compressed(ckp_file, time=self.time, H_SL=self._H_SL,
                             time_iter=_time_iter,
@@ -600,9 +704,588 @@ class iteration_tools(abc.ABC):
                             eta_indices=csr_strata_eta.indices,
                             eta_indptr=csr_strata_eta.indptr,
                             eta_shape=csr_strata_eta.shape,
+                            eta_offsets=self.strata_eta.offsets,
+                            eta_offset_columns=self.strata_eta.offset_columns,
+                            eta_offset_ids=self.strata_eta.offset_ids,
                             sand_data=csr_strata_sand_frac.data,
                             sand_indices=csr_strata_sand_frac.indices,
                             sand_indptr=csr_strata_sand_frac.indptr,
                             sand_shape=csr_strata_sand_frac.shape,
                             n_steps=self.n_steps,
-                            init_eta=self.init_eta)
+                            init_eta=self.init_eta,
+                            **_preserved)
+
+
+class StrataStore(object):
+    """Append-only store of sparse stratigraphy columns.
+
+    Each save of the stratigraphy appends one column, given as the flat
+    indices of the cells with a record and their values. The columns are
+    stored as the three arrays of a compressed sparse column matrix
+    (`data`, `indices`, and `indptr`), so that appending a column writes
+    only the new records. The `data` and `indices` arrays grow by doubling
+    their length when full, so the cost of a save is proportional to the
+    number of its records, and not to the size of the domain or the number
+    of columns already stored.
+
+    The store has room for a number of columns (the second dimension of
+    :obj:`shape`), which is increased with :obj:`expand`, like the
+    preallocated sparse matrices previously used. Columns which are not yet
+    filled hold no records.
+
+    The records are converted to a :obj:`scipy.sparse` matrix or a dense
+    array only when needed, with :obj:`tocsc`, :obj:`tocsr`, and
+    :obj:`toarray`, e.g., to write the stratigraphy to a checkpoint file.
+
+    Offsets subtracted from the columns already stored (i.e., subsidence of
+    the stratigraphy, see :obj:`subtract`) are not applied to the records.
+    Instead, each distinct offset is kept once, along with the number of
+    columns each subtraction applies to, and the offsets are applied only
+    when the columns are read. The records thus stay in an undeformed frame
+    of reference, and a subtraction costs the size of the domain, rather
+    than the size of the whole store. The offsets are rounded to the type
+    of the store, and their sum is subtracted from a column with a single
+    rounding, so a column may differ in the last digit from one where the
+    offsets are subtracted (and rounded) one at a time.
+
+    Initialized in
+    :obj:`~pyDeltaRCM.init_tools.init_tools.init_stratigraphy`.
+    """
+    def __init__(self, n_cells, n_columns, dtype=np.float32):
+
+        self.n_cells = int(n_cells)
+        self.dtype = np.dtype(dtype)
+
+        self.n_filled = 0  # number of columns appended
+        self.nnz = 0  # number of records in the appended columns
+
+        self.data = np.zeros(self.n_cells, dtype=self.dtype)
+        self.indices = np.zeros(self.n_cells, dtype=np.int64)
+        self.indptr = np.zeros(int(n_columns) + 1, dtype=np.int64)
+
+        self._offsets = []  # distinct offsets subtracted
+        self._offset_columns = []  # number of columns of each subtraction
+        self._offset_ids = []  # index of the offset of each subtraction
+        self._offset_cache = None  # stacked offsets and counts, if computed
+
+    @classmethod
+    def from_matrix(cls, matrix, n_filled, dtype=np.float32):
+        """Create a store from a sparse matrix.
+
+        The first `n_filled` columns of the matrix are the appended columns,
+        and any further columns are room for appending.
+        """
+        matrix = csc_matrix(matrix, dtype=dtype)
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+
+        store = cls(matrix.shape[0], matrix.shape[1], dtype=dtype)
+        store.n_filled = int(n_filled)
+        store.nnz = matrix.nnz
+        store.data = matrix.data.copy()
+        store.indices = matrix.indices.astype(np.int64)
+        store.indptr = matrix.indptr.astype(np.int64)
+        return store
+
+    @property
+    def shape(self):
+        """Shape of the store, as ``(n_cells, n_columns)``."""
+        return (self.n_cells, self.indptr.shape[0] - 1)
+
+    @property
+    def offsets(self):
+        """Distinct offsets subtracted, as an array of shape
+        ``(n_offsets, n_cells)``."""
+        return np.array(self._offsets, dtype=self.dtype).reshape(
+            -1, self.n_cells)
+
+    @property
+    def offset_columns(self):
+        """Number of columns each subtraction applies to."""
+        return np.array(self._offset_columns, dtype=np.int64)
+
+    @property
+    def offset_ids(self):
+        """Index into :obj:`offsets` of the offset of each subtraction."""
+        return np.array(self._offset_ids, dtype=np.int64)
+
+    def set_offsets(self, offsets, offset_columns, offset_ids):
+        """Set the subtracted offsets, e.g., as read from a checkpoint file.
+
+        The arguments are as given by :obj:`offsets`,
+        :obj:`offset_columns`, and :obj:`offset_ids`.
+        """
+        self._offsets = [np.array(_o, dtype=self.dtype) for _o in offsets]
+        self._offset_columns = [int(_c) for _c in offset_columns]
+        self._offset_ids = [int(_i) for _i in offset_ids]
+        self._offset_cache = None
+
+    def expand(self, n_columns):
+        """Add room for appending `n_columns` more columns."""
+        self.indptr = np.concatenate(
+            (self.indptr, np.zeros(int(n_columns), dtype=np.int64)))
+
+    def _reserve(self, nnz):
+        """Grow the `data` and `indices` arrays to hold `nnz` records."""
+        if nnz <= self.data.shape[0]:
+            return
+        _size = max(nnz, 2 * self.data.shape[0])
+        _data = np.zeros(_size, dtype=self.dtype)
+        _data[:self.nnz] = self.data[:self.nnz]
+        _indices = np.zeros(_size, dtype=np.int64)
+        _indices[:self.nnz] = self.indices[:self.nnz]
+        self.data = _data
+        self.indices = _indices
+
+    def append(self, indices, values):
+        """Append a column with `values` at the flat cell `indices`.
+
+        The values are cast to the type of the store, and zero values are
+        not recorded, as in a :obj:`scipy.sparse` matrix. The indices should
+        be in increasing order.
+        """
+        if self.n_filled >= self.shape[1]:
+            raise IndexError(
+                'No room to append a column to the store with '
+                '{0} columns; expand the store first.'.format(self.shape[1]))
+
+        values = np.asarray(values).astype(self.dtype)
+        _keep = (values != 0)
+        values = values[_keep]
+        indices = np.asarray(indices)[_keep]
+
+        _end = self.nnz + values.shape[0]
+        self._reserve(_end)
+        self.data[self.nnz:_end] = values
+        self.indices[self.nnz:_end] = indices
+
+        self.nnz = _end
+        self.n_filled += 1
+        self.indptr[self.n_filled] = self.nnz
+
+    def subtract(self, offset, n_columns):
+        """Subtract `offset` from the first `n_columns` columns.
+
+        The `offset` of each cell is subtracted from every one of the
+        columns when they are read, including from the cells without a
+        record. The records are not changed; the offset is kept only if it
+        differs from the last offset subtracted, and otherwise only the
+        number of columns is recorded. The offset is rounded to the type of
+        the store.
+        """
+        offset = np.asarray(offset).astype(self.dtype).reshape(-1)
+        if not (self._offsets and np.array_equal(offset, self._offsets[-1])):
+            self._offsets.append(offset)
+        self._offset_columns.append(int(n_columns))
+        self._offset_ids.append(len(self._offsets) - 1)
+        self._offset_cache = None
+
+    def _offset_counts(self, n_columns):
+        """Count the subtractions of each offset from each column.
+
+        Returns an array of shape ``(n_offsets, n_columns)``, with the
+        number of times each distinct offset is subtracted from each of the
+        first `n_columns` columns.
+        """
+        _counts = np.zeros((len(self._offsets), n_columns + 1))
+        np.add.at(_counts, (self.offset_ids,
+                            np.minimum(self.offset_columns, n_columns)), 1)
+        # a subtraction from the first n columns applies to columns < n
+        _counts = np.cumsum(_counts[:, ::-1], axis=1)[:, ::-1]
+        return _counts[:, 1:]
+
+    def _stacked_offsets(self):
+        """Get the stacked offsets and the counts of their subtractions.
+
+        Returns :obj:`offsets` and the :obj:`_offset_counts` of the columns
+        with any offset, which are kept until the next subtraction, so that
+        reading the columns one after another does not recount the
+        subtractions for each column.
+        """
+        if self._offset_cache is None:
+            self._offset_cache = (
+                self.offsets, self._offset_counts(max(self._offset_columns)))
+        return self._offset_cache
+
+    def column(self, i, raw=False):
+        """Get column `i` as a dense array, with zero where no record.
+
+        The subtracted offsets are applied, unless `raw` is `True`.
+        """
+        _column = np.zeros(self.n_cells, dtype=self.dtype)
+        if i < self.n_filled:
+            _start, _end = self.indptr[i], self.indptr[i + 1]
+            _column[self.indices[_start:_end]] = self.data[_start:_end]
+        if self._offsets and not raw:
+            _offsets, _counts = self._stacked_offsets()
+            if i < _counts.shape[1]:
+                _offset = np.dot(_offsets.T, _counts[:, i])
+                _column = (_column - _offset).astype(self.dtype)
+        return _column
+
+    def tocsc(self, raw=False):
+        """Convert the store to a :obj:`scipy.sparse.csc_matrix`.
+
+        The subtracted offsets are applied, unless `raw` is `True`. Columns
+        with an offset have a record for every cell where the offset is
+        nonzero.
+        """
+        _indptr = self.indptr.copy()
+        _indptr[self.n_filled + 1:] = self.nnz
+        _matrix = csc_matrix((self.data[:self.nnz].copy(),
+                              self.indices[:self.nnz].copy(), _indptr),
+                             shape=self.shape)
+        if raw or not self._offsets:
+            return _matrix
+
+        _offsets, _counts = self._stacked_offsets()
+        _n = _counts.shape[1]
+        _block = (_matrix[:, :_n].toarray() - np.dot(_offsets.T, _counts))
+        _block = csc_matrix(_block.astype(self.dtype))
+        _block.eliminate_zeros()
+        return hstack([_block, _matrix[:, _n:]], format='csc')
+
+    def tocsr(self, raw=False):
+        """Convert the store to a :obj:`scipy.sparse.csr_matrix`.
+
+        The subtracted offsets are applied, unless `raw` is `True`.
+        """
+        return self.tocsc(raw=raw).tocsr()
+
+    def toarray(self):
+        """Convert the store to a dense array."""
+        return self.tocsc().toarray()
+
+    def todense(self):
+        """Convert the store to a dense matrix."""
+        return self.tocsc().todense()
+
+
+class PreservedStrata(object):
+    """Preserved stratigraphic surfaces, kept up to date during the run.
+
+    A surface (i.e., the bed elevation) recorded at a save is preserved
+    only where it has not been eroded by a later surface; the preserved
+    elevation of save ``i`` in a cell is the minimum of the elevations
+    recorded at saves ``i`` and after. Instead of computing this minimum
+    over the whole history after the run, each new surface clips the
+    preserved surfaces already recorded, as it is recorded.
+
+    The preserved elevations of a cell never decrease from older to younger
+    saves, so each cell keeps a stack of layers, each with the first save
+    it holds (`int32`) and its elevation (`float32`), in order of increasing
+    elevation. A new surface removes the layers at or above its elevation
+    from the top of the stack (those saves are clipped to the new
+    elevation), and pushes one new layer (see
+    :obj:`_clip_preserved_stacks`). The work of a save is therefore
+    proportional to the number of cells plus the number of layers removed.
+
+    The stacks are ragged: the layers of a cell are held in a linked list of
+    blocks of `block_size` layers, taken from a pool shared by all cells,
+    and blocks emptied by erosion are returned to the pool, which grows by
+    half when it runs out of blocks. The memory is proportional to the
+    number of layers held, with fewer than `block_size` unused layers in
+    the stack of each cell, rather than to the largest stack of any cell.
+    A cell where the bed is unchanged, or is lowered at every
+    save, keeps a single layer, but a cell that aggrades at every save keeps
+    one layer per save, so that in the worst case the stacks take twice the
+    memory of the `float32` cube of surfaces.
+
+    The preserved elevations of any save, or the whole preserved cube, can
+    be read at any time with :obj:`surface` and :obj:`cube`.
+
+    Subsidence of the surfaces already recorded (see :obj:`subtract`) is
+    accumulated, and the surfaces are recorded and clipped relative to the
+    accumulated subsidence, which is subtracted again when they are read.
+
+    Initialized in
+    :obj:`~pyDeltaRCM.init_tools.init_tools.init_stratigraphy`.
+    """
+    def __init__(self, n_cells, block_size=4):
+
+        self.n_cells = int(n_cells)
+        self.n_saves = 0
+
+        # pool of blocks of layers, each linked to the block below it
+        self.block_start = np.zeros((self.n_cells, block_size),
+                                    dtype=np.int32)
+        self.block_elev = np.zeros((self.n_cells, block_size),
+                                   dtype=np.float32)
+        self.block_below = np.full((self.n_cells,), -1, dtype=np.int32)
+        self.n_blocks = 0  # blocks taken from the pool
+        self.free_block = -1  # first of the returned blocks
+        self.n_free = 0
+
+        # top block of the stack of each cell, and the layers used in it
+        self.top_block = np.full((self.n_cells,), -1, dtype=np.int32)
+        self.top_size = np.zeros((self.n_cells,), dtype=np.int32)
+
+        self.subsidence = np.zeros((self.n_cells,), dtype=np.float64)
+
+    @property
+    def block_size(self):
+        """Number of layers in a block of the pool."""
+        return self.block_start.shape[1]
+
+    @property
+    def stack_size(self):
+        """Number of layers in the stack of each cell."""
+        return _get_preserved_stack_size(
+            self.block_below, self.top_block, self.top_size,
+            self.block_size)
+
+    @classmethod
+    def from_arrays(cls, stack_start, stack_elev, stack_size, subsidence,
+                    n_saves, block_size=4):
+        """Create preserved surfaces from their arrays.
+
+        The arrays are as given by :obj:`compact`, e.g., as read from a
+        checkpoint file.
+        """
+        preserved = cls(stack_size.shape[0], block_size=block_size)
+        preserved._reserve(int(np.sum(-(-stack_size // block_size))))
+        preserved.n_blocks = _set_preserved_stacks(
+            preserved.block_start, preserved.block_elev,
+            preserved.block_below, preserved.top_block, preserved.top_size,
+            stack_start.astype(np.int32), stack_elev.astype(np.float32),
+            stack_size.astype(np.int64))
+        preserved.subsidence[:] = subsidence
+        preserved.n_saves = int(n_saves)
+        return preserved
+
+    def compact(self):
+        """Get the layers of the stacks, without unused layers.
+
+        Returns `stack_start` and `stack_elev`, with the layers of each cell
+        from the bottom to the top of its stack, one cell after another,
+        `stack_size`, the number of layers of each cell, and `subsidence`.
+        """
+        _size = self.stack_size
+        _start, _elev = _get_preserved_stacks(
+            self.block_start, self.block_elev, self.block_below,
+            self.top_block, self.top_size, _size)
+        return _start, _elev, _size, self.subsidence
+
+    def _reserve(self, n_blocks):
+        """Make sure the pool can give out `n_blocks` more blocks."""
+        _capacity = self.block_below.shape[0]
+        _needed = self.n_blocks + n_blocks - self.n_free
+        if _needed <= _capacity:
+            return
+        _capacity = max(_needed, _capacity + _capacity // 2)
+        _start = np.zeros((_capacity, self.block_size), dtype=np.int32)
+        _elev = np.zeros((_capacity, self.block_size), dtype=np.float32)
+        _below = np.full((_capacity,), -1, dtype=np.int32)
+        _start[:self.n_blocks] = self.block_start[:self.n_blocks]
+        _elev[:self.n_blocks] = self.block_elev[:self.n_blocks]
+        _below[:self.n_blocks] = self.block_below[:self.n_blocks]
+        self.block_start = _start
+        self.block_elev = _elev
+        self.block_below = _below
+
+    def record(self, surface):
+        """Record a new surface, and clip the preserved surfaces with it.
+
+        Returns the number of cells where earlier surfaces were clipped.
+        """
+        _surface = (np.asarray(surface, dtype=np.float64).reshape(-1)
+                    + self.subsidence).astype(np.float32)
+        # each cell takes at most one block
+        self._reserve(self.n_cells)
+        (_n_clipped, self.n_blocks, self.free_block,
+         self.n_free) = _clip_preserved_stacks(
+            self.block_start, self.block_elev, self.block_below,
+            self.top_block, self.top_size, self.n_blocks, self.free_block,
+            self.n_free, _surface, self.n_saves)
+        self.n_saves += 1
+        return _n_clipped
+
+    def subtract(self, offset):
+        """Subtract `offset` from all of the surfaces recorded so far."""
+        self.subsidence += np.asarray(offset, dtype=np.float64).reshape(-1)
+
+    def surface(self, i):
+        """Get the preserved elevation of each cell for save `i`."""
+        if not (0 <= i < self.n_saves):
+            raise IndexError(
+                'Save {0} is out of range for {1} saves.'.format(
+                    i, self.n_saves))
+        _surface = _get_preserved_surface(
+            self.block_start, self.block_elev, self.block_below,
+            self.top_block, self.top_size, i)
+        return (_surface - self.subsidence).astype(np.float32)
+
+    def cube(self):
+        """Get the preserved elevations of all saves.
+
+        Returns an array of shape ``(n_saves, n_cells)``.
+        """
+        _cube = _get_preserved_cube(
+            self.block_start, self.block_elev, self.block_below,
+            self.top_block, self.top_size, self.n_saves)
+        return (_cube - self.subsidence).astype(np.float32)
+
+
+@njit
+def _clip_preserved_stacks(block_start, block_elev, block_below, top_block,
+                           top_size, n_blocks, free_block, n_free, surface,
+                           index):
+    """Clip the preserved stacks of each cell with a new surface.
+
+    Removes the layers at or above the elevation of the new `surface` from
+    the stack of each cell, and pushes a layer starting at the first save
+    of the removed layers (or at save `index`, if none were removed) with
+    the elevation of the surface. Blocks emptied by the removal are
+    returned to the list of free blocks, which starts at `free_block` and
+    is linked by `block_below`, and new blocks are taken from that list
+    first, and then from the `n_blocks` blocks of the pool in use. The pool
+    must have room for one more block for each cell.
+
+    Returns the number of cells where a layer above the surface was
+    removed, and the new `n_blocks`, `free_block` and `n_free`.
+    """
+    block_size = block_start.shape[1]
+    n_clipped = 0
+    for c in range(surface.shape[0]):
+        _elev = surface[c]
+        _block = top_block[c]
+        _size = top_size[c]
+        _start = np.int32(index)
+        _clipped = False
+        while (_block >= 0) and (block_elev[_block, _size - 1] >= _elev):
+            _size -= 1
+            _start = block_start[_block, _size]
+            if block_elev[_block, _size] > _elev:
+                _clipped = True
+            if _size == 0:
+                # return the empty block to the free list
+                _below = block_below[_block]
+                block_below[_block] = free_block
+                free_block = _block
+                n_free += 1
+                _block = _below
+                _size = block_size
+
+        if (_block < 0) or (_size == block_size):
+            # take a new block
+            if free_block >= 0:
+                _new = free_block
+                free_block = block_below[_new]
+                n_free -= 1
+            else:
+                _new = n_blocks
+                n_blocks += 1
+            block_below[_new] = _block
+            _block = _new
+            _size = 0
+
+        block_start[_block, _size] = _start
+        block_elev[_block, _size] = _elev
+        top_block[c] = _block
+        top_size[c] = _size + 1
+        if _clipped:
+            n_clipped += 1
+    return n_clipped, n_blocks, free_block, n_free
+
+
+@njit
+def _get_preserved_surface(block_start, block_elev, block_below, top_block,
+                           top_size, index):
+    """Get the preserved elevation of each cell for save `index`."""
+    surface = np.zeros(top_block.shape[0], dtype=np.float64)
+    for c in range(top_block.shape[0]):
+        _block = top_block[c]
+        _size = top_size[c]
+        while block_start[_block, 0] > index:
+            _block = block_below[_block]
+            _size = block_start.shape[1]
+        _layer = np.searchsorted(
+            block_start[_block, :_size], index, side='right') - 1
+        surface[c] = block_elev[_block, _layer]
+    return surface
+
+
+@njit
+def _get_preserved_cube(block_start, block_elev, block_below, top_block,
+                        top_size, n_saves):
+    """Get the preserved elevation of each cell for every save."""
+    cube = np.zeros((n_saves, top_block.shape[0]), dtype=np.float64)
+    for c in range(top_block.shape[0]):
+        _block = top_block[c]
+        _size = top_size[c]
+        _last = n_saves
+        while _block >= 0:
+            for _layer in range(_size - 1, -1, -1):
+                _first = block_start[_block, _layer]
+                for i in range(_first, _last):
+                    cube[i, c] = block_elev[_block, _layer]
+                _last = _first
+            _block = block_below[_block]
+            _size = block_start.shape[1]
+    return cube
+
+
+@njit
+def _get_preserved_stack_size(block_below, top_block, top_size, block_size):
+    """Get the number of layers in the stack of each cell."""
+    stack_size = np.zeros(top_block.shape[0], dtype=np.int64)
+    for c in range(top_block.shape[0]):
+        _block = top_block[c]
+        if _block >= 0:
+            stack_size[c] = top_size[c]
+            _block = block_below[_block]
+        while _block >= 0:
+            stack_size[c] += block_size
+            _block = block_below[_block]
+    return stack_size
+
+
+@njit
+def _get_preserved_stacks(block_start, block_elev, block_below, top_block,
+                          top_size, stack_size):
+    """Get the layers of the stack of each cell, one cell after another."""
+    stack_start = np.zeros(np.sum(stack_size), dtype=np.int32)
+    stack_elev = np.zeros(np.sum(stack_size), dtype=np.float32)
+    _end = 0
+    for c in range(top_block.shape[0]):
+        _end += stack_size[c]
+        _n = _end
+        _block = top_block[c]
+        _size = top_size[c]
+        while _block >= 0:
+            for _layer in range(_size - 1, -1, -1):
+                _n -= 1
+                stack_start[_n] = block_start[_block, _layer]
+                stack_elev[_n] = block_elev[_block, _layer]
+            _block = block_below[_block]
+            _size = block_start.shape[1]
+    return stack_start, stack_elev
+
+
+@njit
+def _set_preserved_stacks(block_start, block_elev, block_below, top_block,
+                          top_size, stack_start, stack_elev, stack_size):
+    """Fill the pool of blocks with the layers of each cell.
+
+    The layers are as given by :obj:`_get_preserved_stacks`. Returns the
+    number of blocks used.
+    """
+    block_size = block_start.shape[1]
+    n_blocks = 0
+    _n = 0
+    for c in range(top_block.shape[0]):
+        _block = -1
+        _size = block_size
+        for _layer in range(stack_size[c]):
+            if _size == block_size:
+                block_below[n_blocks] = _block
+                _block = n_blocks
+                n_blocks += 1
+                _size = 0
+            block_start[_block, _size] = stack_start[_n]
+            block_elev[_block, _size] = stack_elev[_n]
+            _size += 1
+            _n += 1
+        top_block[c] = _block
+        top_size[c] = _size if _block >= 0 else 0
+    return n_blocks
@@ -83,6 +83,7 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
 
         self.init_sediment_routers()
         self.init_subsidence()
+        self.init_forcing()
 
         # if resume flag set to True, load checkpoint, open netCDF4
         if self.resume_checkpoint:
@@ -106,6 +107,8 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
         various morphodynamic and basin-scale processes, and incrementing the
         model time-tracking attributes. This method calls, in sequence:
 
+            * the routine to apply parameters forced over time
+              (:meth:`apply_forcing`)
             * the routine to run one timestep (i.e., water surface estimation
               and sediment routing, :meth:`run_one_timestep`)
             * the basin subsidence update pattern (:meth:`apply_subsidence`)
@@ -123,6 +126,9 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
         -------
 
         """
+        # apply parameters forced over time
+        self.apply_forcing()
+
         # record the state of the model
         if self._save_time_since_last >= self.save_dt:
             self.record_stratigraphy()
@@ -489,6 +495,46 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
             raise ValueError('C0_percent must be greater than 0.')
         self._C0_percent = C0_percent
 
+    @property
+    def forcing(self):
+        """
+        forcing prescribes model parameters that vary over time.
+
+        forcing is a *dictionary* type parameter, mapping the name of a
+        parameter to a schedule of values over model time. The parameters
+        that can be forced are :attr:`u0`, :attr:`h0`, :attr:`N0_meters`,
+        :attr:`C0_percent`, :attr:`f_bedload`, and :attr:`H_SL`. The schedule
+        of a parameter is either a dictionary with lists `time` (model time
+        in seconds, increasing) and `value`, or the path to a text (or
+        ``.npy``) file with a table of two columns, time and value. A path
+        is relative to the directory of the input YAML file. For example:
+
+        .. code::
+
+            forcing:
+              u0:
+                time: [0, 86400, 172800]
+                value: [1.0, 1.5, 1.0]
+              H_SL: 'sea_level.txt'
+
+        The schedules are converted to tables once (see
+        :obj:`~pyDeltaRCM.init_tools.init_tools.init_forcing`), and the
+        values are interpolated linearly at the model time at the start of
+        every :meth:`update` (see
+        :obj:`~pyDeltaRCM.iteration_tools.iteration_tools.apply_forcing`),
+        and held at the first and last values outside the schedule. A forced
+        :attr:`H_SL` replaces the sea level set by :attr:`SLR` at the start
+        of every timestep. The default, `None`, applies no forcing.
+        """
+        return self._forcing
+
+    @forcing.setter
+    def forcing(self, forcing):
+        if (forcing is not None) and not isinstance(forcing, dict):
+            raise TypeError('forcing must be a dictionary or None, but was: '
+                            '%s' % type(forcing).__name__)
+        self._forcing = forcing
+
     @property
     def Csmooth(self):
         """
@@ -794,6 +840,53 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
     def save_strata(self, save_strata):
         self._save_strata = save_strata
 
+    @property
+    def stream_strata(self):
+        """
+        stream_strata controls whether stratigraphy is written as it is saved.
+
+        If `True` (and :obj:`save_strata` is `True`), each save of the
+        stratigraphy is written to the ``strata_sand_frac`` and
+        ``strata_depth`` variables of the output netCDF file by
+        :obj:`~pyDeltaRCM.iteration_tools.iteration_tools.record_stratigraphy`,
+        along an unlimited dimension, instead of being kept in memory and
+        written by
+        :obj:`~pyDeltaRCM.iteration_tools.iteration_tools.output_strata` when
+        the model is finalized. The variables are compressed, with one chunk
+        per save, and the file is synced after each save, so that the
+        stratigraphy saved so far can be read if the run does not finish.
+        The memory used for stratigraphy then does not grow over the run.
+
+        Streaming cannot be used with subsidence
+        (:obj:`toggle_subsidence`), which changes the stratigraphy already
+        saved.
+        """
+        return self._stream_strata
+
+    @stream_strata.setter
+    def stream_strata(self, stream_strata):
+        self._stream_strata = stream_strata
+
+    @property
+    def preserve_strata(self):
+        """
+        preserve_strata controls whether preserved stratigraphy is computed.
+
+        If `True` (and :obj:`save_strata` is `True`), the bed elevation at
+        each save of the stratigraphy is recorded as a surface of
+        :obj:`strata_preserved`
+        (a :obj:`~pyDeltaRCM.iteration_tools.PreservedStrata`), which clips
+        the surfaces saved before wherever the bed has since been eroded
+        below them. The preserved surfaces are thus available at any time
+        during the run, and are written to the ``strata_preserved_depth``
+        variable of the output netCDF file when the model is finalized.
+        """
+        return self._preserve_strata
+
+    @preserve_strata.setter
+    def preserve_strata(self, preserve_strata):
+        self._preserve_strata = preserve_strata
+
     @property
     def save_checkpoint(self):
         """
@@ -1022,6 +1115,190 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
     def stepmax(self, stepmax):
         self._stepmax = stepmax
 
+    @property
+    def water_routing(self):
+        """
+        water_routing selects the engine used to route the water parcels.
+
+        water_routing is a *string* type parameter. The default, `stepwise`,
+        steps all water parcels together from a Python loop in
+        :obj:`~pyDeltaRCM.water_tools.water_tools.run_water_iteration`. With
+        `fused`, the same step-by-step routing of all parcels is carried out
+        to completion within a single jitted function
+        (:obj:`~pyDeltaRCM.water_tools._route_all_water_parcels`), which
+        avoids the overhead of the Python loop. The `fused` engine reproduces
+        the `stepwise` engine exactly, for a given random seed.
+
+        With `compacted`, the Python loop of the `stepwise` engine steps only
+        the parcels which are still being routed, rather than all parcels,
+        so that the cost of a step decreases as parcels reach the boundary.
+        The `compacted` engine also reproduces the `stepwise` engine
+        exactly.
+
+        With `parcelwise`, each parcel is routed to completion independently
+        (:obj:`~pyDeltaRCM.water_tools._route_all_water_parcels_parcelwise`),
+        with its own stream of random numbers, so that the parcels can be
+        routed on multiple threads (see :attr:`threaded`). The `parcelwise`
+        engine is reproducible for a given random seed, and gives the same
+        result for any number of threads, but the result is not the same as
+        that of the `stepwise`, `fused`, and `compacted` engines.
+        """
+        return self._water_routing
+
+    @water_routing.setter
+    def water_routing(self, water_routing):
+        if water_routing not in ['stepwise', 'fused', 'compacted',
+                                 'parcelwise']:
+            raise ValueError('water_routing must be one of "stepwise", '
+                             '"fused", "compacted", or "parcelwise", but '
+                             'was: %s' % str(water_routing))
+        self._water_routing = water_routing
+
+    @property
+    def water_sampling(self):
+        """
+        water_sampling selects how water parcels sample the step direction.
+
+        water_sampling is a *string* type parameter. The water weights of
+        every cell are fixed for a water iteration (see
+        :obj:`~pyDeltaRCM.water_tools.water_tools.get_water_weight_array`),
+        so a table for sampling the direction of a step can be prepared once
+        per iteration, for every cell.
+
+        With the default, `search`, no table is prepared, and the cumulative
+        weights of the cell are computed and searched at every step of a
+        parcel (:obj:`~pyDeltaRCM.shared_tools.random_pick`). With
+        `cumulative`, the cumulative weights of every cell are computed once
+        (:obj:`~pyDeltaRCM.shared_tools.get_cumulative_table`), which
+        reproduces the `search` sampling exactly. With `alias`, a Walker
+        alias table is computed for every cell
+        (:obj:`~pyDeltaRCM.shared_tools.get_alias_table`), such that a
+        direction is sampled in constant time. The `alias` sampling is
+        reproducible for a given random seed, but the result is not the same
+        as that of the `search` and `cumulative` sampling.
+        """
+        return self._water_sampling
+
+    @water_sampling.setter
+    def water_sampling(self, water_sampling):
+        if water_sampling not in ['search', 'cumulative', 'alias']:
+            raise ValueError('water_sampling must be one of "search", '
+                             '"cumulative", or "alias", but was: '
+                             '%s' % str(water_sampling))
+        self._water_sampling = water_sampling
+
+    @property
+    def diffusion_region(self):
+        """
+        diffusion_region selects where topographic diffusion is computed.
+
+        diffusion_region is a *string* type parameter. With the default,
+        `domain`, the cross-diffusion flux of
+        :obj:`~pyDeltaRCM.sed_tools.sed_tools.topo_diffusion` is computed at
+        every cell of the domain. With `active`, it is computed only within
+        the bounding box of the cells with a nonzero sediment flux, plus a
+        one-cell halo (:obj:`~pyDeltaRCM.sed_tools._get_active_bounds`),
+        because the flux is zero everywhere else. The result is the same,
+        but the cost of the diffusion scales with the area reached by the
+        sediment parcels, rather than with the area of the domain.
+        """
+        return self._diffusion_region
+
+    @diffusion_region.setter
+    def diffusion_region(self, diffusion_region):
+        if diffusion_region not in ['domain', 'active']:
+            raise ValueError('diffusion_region must be one of "domain" or '
+                             '"active", but was: %s' % str(diffusion_region))
+        self._diffusion_region = diffusion_region
+
+    @property
+    def sed_routing(self):
+        """
+        sed_routing selects how the sediment parcels are routed.
+
+        sed_routing is a *string* type parameter. With the default, `serial`,
+        the sediment parcels are routed one after another, each parcel
+        seeing the changes to the bed made by all parcels before it.
+
+        With `batched`, the parcels are routed in batches of
+        :attr:`sed_batch_size` parcels
+        (:obj:`~pyDeltaRCM.sed_tools._route_parcels_batched`). The parcels
+        of a batch are routed against a snapshot of the fields at the start
+        of the batch, and can therefore be routed on multiple threads (see
+        :attr:`threaded`). The changes of the parcels of a batch are summed
+        when the batch is complete. The `batched` routing is an
+        *approximation* of the `serial` routing, which is reproducible for a
+        given random seed and gives the same result for any number of
+        threads. With a batch size of one, the `serial` routing is used.
+
+        With `speculative`, windows of :attr:`sed_batch_size` parcels are
+        routed in parallel against a snapshot of the fields, and then
+        committed in order; a parcel that reads a cell changed by an earlier
+        parcel of the window is routed again
+        (:obj:`~pyDeltaRCM.sed_tools._route_parcels_speculative`). The
+        `speculative` routing gives the same result for any window size and
+        number of threads: the result of routing the parcels one after
+        another, with each parcel drawing random numbers from its own
+        stream. The result is reproducible for a given random seed, but is
+        *not* the same as that of the `serial` routing, which draws the
+        random numbers of all parcels from a single sequence. The fraction
+        of parcels routed again is logged, with the *ideal parallelism*: the
+        number of parcels over the number of windows plus the number of
+        parcels routed again. This is an upper bound on the speedup over
+        routing the parcels one after another, not a measured speedup.
+        """
+        return self._sed_routing
+
+    @sed_routing.setter
+    def sed_routing(self, sed_routing):
+        if sed_routing not in ['serial', 'batched', 'speculative']:
+            raise ValueError('sed_routing must be one of "serial", '
+                             '"batched", or "speculative", but was: %s'
+                             % str(sed_routing))
+        self._sed_routing = sed_routing
+
+    @property
+    def sed_batch_size(self):
+        """
+        sed_batch_size is the number of sediment parcels in a batch.
+
+        sed_batch_size is an *integer* type parameter, and is used only if
+        :attr:`sed_routing` is `batched` or `speculative`. Larger batches make
+        more parcels available to route in parallel, but with `batched`, the
+        parcels of a batch do not see each other's changes to the bed, and
+        with `speculative`, more parcels of a window must be routed again.
+        """
+        return self._sed_batch_size
+
+    @sed_batch_size.setter
+    def sed_batch_size(self, sed_batch_size):
+        if sed_batch_size < 1:
+            raise ValueError('sed_batch_size must be a positive integer.')
+        self._sed_batch_size = int(sed_batch_size)
+
+    @property
+    def threaded(self):
+        """
+        threaded controls whether jitted functions may use multiple threads.
+
+        threaded is a *boolean* parameter. If `True`, functions that support
+        it split their work over the threads available to Numba (see
+        :obj:`numba.set_num_threads`, or the ``NUMBA_NUM_THREADS``
+        environment variable). If `False` (the default), all work runs on a
+        single thread.
+
+        .. note::
+
+            This option is unrelated to the ``parallel`` option of the
+            :obj:`~pyDeltaRCM.preprocessor.Preprocessor`, which runs separate
+            jobs in separate processes.
+        """
+        return self._threaded
+
+    @threaded.setter
+    def threaded(self, threaded):
+        self._threaded = threaded
+
     @property
     def time(self):
         """Elapsed model time in seconds.
@@ -1090,8 +1367,7 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
     @channel_flow_velocity.setter
     def channel_flow_velocity(self, new_u0):
         self.u0 = new_u0
-        self.create_other_variables()
-        self.init_sediment_routers()
+        self.update_boundary_conditions()
 
     @property
     def channel_width(self):
@@ -1101,8 +1377,7 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
     @channel_width.setter
     def channel_width(self, new_N0):
         self.N0_meters = new_N0
-        self.create_other_variables()
-        self.init_sediment_routers()
+        self.update_boundary_conditions()
 
     @property
     def channel_flow_depth(self):
@@ -1112,8 +1387,7 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
     @channel_flow_depth.setter
     def channel_flow_depth(self, new_d):
         self.h0 = new_d
-        self.create_other_variables()
-        self.init_sediment_routers()
+        self.update_boundary_conditions()
 
     @property
     def sea_surface_mean_elevation(self):
@@ -1150,8 +1424,7 @@ class DeltaModel(iteration_tools, sed_tools, water_tools,
     @influx_sediment_concentration.setter
     def influx_sediment_concentration(self, new_u0):
         self.C0_percent = new_u0
-        self.create_other_variables()
-        self.init_sediment_routers()
+        self.update_boundary_conditions()
 
     @property
     def sea_surface_elevation(self):
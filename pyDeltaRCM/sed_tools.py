@@ -1,8 +1,8 @@
 
 import numpy as np
-from numba import float32, float64, int64
+from numba import njit, prange, float32, float64, int64, boolean
 from numba.experimental import jitclass
-from scipy import ndimage
+from numba.np import numpy_support
 import abc
 
 from . import shared_tools
@@ -18,7 +18,13 @@ class sed_tools(abc.ABC):
         This is the main method for sediment routing in the model. It is
         called once per `update()` call.
         """
-        self.pad_depth = np.pad(self.depth, 1, 'edge')
+        shared_tools.fill_halo(self.pad_depth)
+
+        # bind again only if a field array was replaced since the last bind
+        _fields = tuple(getattr(self, _name) for _name in _ROUTER_FIELDS)
+        if not all(_field is _bound for _field, _bound in
+                   zip(_fields, self._sed_router_fields)):
+            self.bind_sediment_routers()
 
         self.qs[:] = 0
         self.Vp_dep_sand[:] = 0
@@ -36,120 +42,210 @@ class sed_tools(abc.ABC):
         self.log_info(_msg, verbosity=2)
         self.topo_diffusion()
 
+    def bind_sediment_routers(self):
+        """Bind the sediment routers to the model fields.
+
+        The :obj:`SandRouter` and :obj:`MudRouter` keep references to the
+        arrays of the model fields listed in :obj:`_ROUTER_FIELDS`, and
+        change them in place (see :obj:`BaseRouter.bind_fields`), so that the
+        fields need not be passed to the routers and copied back for every
+        routing. Called when the routers are initialized, and by
+        :obj:`sed_route` if a field array has been replaced since.
+
+        Raises
+        ------
+        TypeError
+            if the type or number of dimensions of a field does not match
+            the field of the routers, to which it would otherwise be cast.
+        """
+        _spec = dict(r_spec)
+        _fields = tuple(getattr(self, _name) for _name in _ROUTER_FIELDS)
+        for _name, _field in zip(_ROUTER_FIELDS, _fields):
+            _dtype = numpy_support.as_dtype(_spec[_name].dtype)
+            if (_field.dtype != _dtype) or (_field.ndim != _spec[_name].ndim):
+                raise TypeError(
+                    'Cannot bind field `%s` of type %s and %i dimensions to '
+                    'the sediment routers, which require type %s and %i '
+                    'dimensions.' % (_name, _field.dtype, _field.ndim,
+                                     _dtype, _spec[_name].ndim))
+
+        self._sr.bind_fields(*_fields)
+        self._mr.bind_fields(*_fields)
+        self._sed_router_fields = _fields
+
     def route_all_sand_parcels(self):
         """Route sand parcels; topo diffusion.
 
         This method largely wraps the :obj:`SandRouter`. First, the number of
         parcels and sand fraction (:obj:`f_bedload`) are used to determine
         starting locations for sand parcels. Next, these locations are sent to
-        the `SandRouter`, along with many other model state variables.
-
-        Finally, variables are unpacked from the `SandRouter` and updated in
-        the model fields, where they are later used by the `MudRouter` and the
-        water parcel routing.
+        the `SandRouter`, which is bound to the model fields (see
+        :obj:`bind_sediment_routers`) and updates them in place, where they
+        are later used by the `MudRouter` and the water parcel routing.
         """
         _msg = 'Determining sand parcel start indicies'
         self.log_info(_msg, verbosity=2)
 
         num_starts = int(self._Np_sed * self._f_bedload)
-        inlet_weights = np.ones_like(self.inlet)
-        start_indices = shared_tools.get_start_indices(self.inlet,
-                                                       inlet_weights,
-                                                       num_starts)
+        start_indices = shared_tools.sample_start_indices(
+            self.inlet, self._inlet_cumulative, num_starts)
 
-        _msg = 'Supplying model state to SandRouter for iteration'
+        if (self._sed_routing == 'batched') and (self._sed_batch_size > 1):
+            self.route_parcels_batched(self._sr_chunks, start_indices)
+            return
+        if self._sed_routing == 'speculative':
+            self.route_parcels_speculative(self._sr, self._sr_chunks, start_indices)
+            return
+
+        _msg = 'Routing sand parcels with the SandRouter'
         self.log_info(_msg, verbosity=2)
 
-        self._sr.run(start_indices, self.eta, self.stage, self.depth,
-                     self.cell_type, self.uw, self.ux, self.uy,
-                     self.pad_stage, self.pad_depth, self.pad_cell_type,
-                     self.Vp_dep_mud, self.Vp_dep_sand,
-                     self.qw, self.qx, self.qy, self.qs)
+        # the router is bound to the model fields, and changes them in place
+        self._sr.run(start_indices)
 
-        # These are the variables updated at the end of the `SandRouter`. If
-        # you attempt to drop in a replacement SandRouter, you will need to
-        # update these fields!!
-        _msg = 'Updating DeltaModel based on SandRouter change'
+        _msg = 'SandRouter weight cache hit rate: {:.3f}'.format(
+            self._sr.weight_cache_hit_rate())
         self.log_info(_msg, verbosity=2)
 
-        self.Vp_dep_mud = self._sr.Vp_dep_mud
-        self.Vp_dep_sand = self._sr.Vp_dep_sand
-        self.eta = self._sr.eta  # update bed
-        self.depth = self._sr.depth  # update depth
-        self.pad_depth = self._sr.pad_depth  # update depth in padded array
-        self.uw = self._sr.uw  # update absolute flow field
-        self.ux = self._sr.ux  # update component flow field
-        self.uy = self._sr.uy  # update component flow fielda
-        self.qs = self._sr.qs
-
     def route_all_mud_parcels(self):
         """Route mud parcels.
 
         This method largely wraps the :obj:`MudRouter`. First, the number of
         parcels and sand fraction (:obj:`f_bedload`) are used to determine
         starting locations for mud parcels. Next, these locations are sent to
-        the `MudRouter`, along with many other model state variables.
-
-        Finally, variables are unpacked from the `MudRouter` and updated in
-        the model fields, where they are later used by the water parcel
-        routing.
+        the `MudRouter`, which is bound to the model fields (see
+        :obj:`bind_sediment_routers`) and updates them in place, where they
+        are later used by the water parcel routing.
         """
         _msg = 'Determining mud parcel start indicies'
         self.log_info(_msg, verbosity=2)
 
         num_starts = int(self._Np_sed * (1 - self._f_bedload))
-        inlet_weights = np.ones_like(self.inlet)
-        start_indices = shared_tools.get_start_indices(self.inlet,
-                                                       inlet_weights,
-                                                       num_starts)
+        start_indices = shared_tools.sample_start_indices(
+            self.inlet, self._inlet_cumulative, num_starts)
 
-        _msg = 'Supplying model state to MudRouter for iteration'
+        if (self._sed_routing == 'batched') and (self._sed_batch_size > 1):
+            self.route_parcels_batched(self._mr_chunks, start_indices)
+            return
+        if self._sed_routing == 'speculative':
+            self.route_parcels_speculative(self._mr, self._mr_chunks, start_indices)
+            return
+
+        _msg = 'Routing mud parcels with the MudRouter'
         self.log_info(_msg, verbosity=2)
 
-        self._mr.run(start_indices, self.eta, self.stage, self.depth,
-                     self.cell_type, self.uw, self.ux, self.uy,
-                     self.pad_stage, self.pad_depth, self.pad_cell_type,
-                     self.Vp_dep_mud, self.Vp_dep_sand,
-                     self.qw, self.qx, self.qy)
+        # the router is bound to the model fields, and changes them in place
+        self._mr.run(start_indices)
 
-        # These are the variables updated at the end of the `MudRouter`. If
-        # you attempt to drop in a replacement MudRouter, you will need to
-        # update these fields!!
-        _msg = 'Updating DeltaModel based on MudRouter change'
+        _msg = 'MudRouter weight cache hit rate: {:.3f}'.format(
+            self._mr.weight_cache_hit_rate())
         self.log_info(_msg, verbosity=2)
 
-        self.Vp_dep_mud = self._mr.Vp_dep_mud
-        self.Vp_dep_sand = self._mr.Vp_dep_sand
-        self.eta = self._mr.eta  # update bed
-        self.depth = self._mr.depth  # update depth
-        self.pad_depth = self._mr.pad_depth  # update depth in padded array
-        self.uw = self._mr.uw  # update absolute flow field
-        self.ux = self._mr.ux  # update component flow field
-        self.uy = self._mr.uy  # update component flow field
+    def route_parcels_batched(self, routers, start_indices):
+        """Route sediment parcels in batches.
+
+        Used instead of the `run` method of the :obj:`SandRouter` or
+        :obj:`MudRouter` if :obj:`~pyDeltaRCM.DeltaModel.sed_routing` is
+        `batched`. This method wraps :obj:`_route_parcels_batched`, which
+        modifies the model fields in place, with one router for each chunk
+        of parcels in `routers`.
+        """
+        _msg = 'Routing {} sediment parcels in batches of {}'.format(
+            len(start_indices), self._sed_batch_size)
+        self.log_info(_msg, verbosity=2)
+
+        if self._threaded:
+            _route = _route_parcels_batched.threaded
+        else:
+            _route = _route_parcels_batched
+        _route(routers, start_indices, self._sed_batch_size,
+               shared_tools.get_random_key(), self.eta, self.stage,
+               self.depth, self.cell_type, self.uw, self.ux, self.uy,
+               self.pad_stage, self.pad_depth, self.pad_cell_type,
+               self.Vp_dep_mud, self.Vp_dep_sand, self.qw, self.qx, self.qy,
+               self.qs)
+
+        _hits = sum(_r.n_weight_hits for _r in routers)
+        _misses = sum(_r.n_weight_misses for _r in routers)
+        _msg = 'Batched routers weight cache hit rate: {:.3f}'.format(
+            _hits / max(1, _hits + _misses))
+        self.log_info(_msg, verbosity=2)
+
+    def route_parcels_speculative(self, router, routers, start_indices):
+        """Route sediment parcels speculatively, in serial order.
+
+        Used instead of the `run` method of the :obj:`SandRouter` or
+        :obj:`MudRouter` if :obj:`~pyDeltaRCM.DeltaModel.sed_routing` is
+        `speculative`. This method wraps :obj:`_route_parcels_speculative`,
+        which modifies the model fields in place, re-routing parcels that
+        conflict with earlier parcels of a window with `router`.
+
+        The fraction of parcels in conflict, and the ideal parallelism (the
+        number of parcels, over the number of windows plus the number of
+        parcels routed again), are logged. The ideal parallelism is the
+        speedup over routing the parcels one after another that would be
+        reached with one thread per parcel of a window, and no overhead; it
+        is not a measured speedup.
+        """
+        _msg = 'Routing {} sediment parcels speculatively in windows of {}'.format(
+            len(start_indices), self._sed_batch_size)
+        self.log_info(_msg, verbosity=2)
+
+        if self._threaded:
+            _route = _route_parcels_speculative.threaded
+        else:
+            _route = _route_parcels_speculative
+        n_windows, n_conflicts = _route(
+            router, routers, start_indices, self._sed_batch_size,
+            shared_tools.get_random_key(), self.eta, self.stage, self.depth,
+            self.cell_type, self.uw, self.ux, self.uy, self.pad_stage,
+            self.pad_depth, self.pad_cell_type, self.Vp_dep_mud,
+            self.Vp_dep_sand, self.qw, self.qx, self.qy, self.qs)
+
+        _nparcels = len(start_indices)
+        _msg = ('Speculative routing conflict rate: {:.3f}, '
+                'ideal parallelism: {:.2f}').format(
+            n_conflicts / max(1, _nparcels),
+            _nparcels / max(1, n_windows + n_conflicts))
+        self.log_info(_msg, verbosity=2)
 
     def topo_diffusion(self):
         """Diffuse topography after routing.
 
         Diffuse topography after routing all coarse sediment parcels. The
-        method uses convolution with a kernel to compute smoother topography,
-        and then adds this different to the current eta to do the smoothing.
-        The operation is repeated `N_crossdiff` times.
+        method computes the cross-diffusion flux `cf` at each cell from the
+        3x3 neighborhood of the cell, and then adds this flux to the current
+        eta to do the smoothing. The operation is repeated `N_crossdiff`
+        times, with :obj:`_topo_diffusion_pass`.
+
+        If :obj:`~pyDeltaRCM.DeltaModel.diffusion_region` is `active`, the
+        passes are restricted to the bounding box of the cells with a
+        nonzero sediment flux, plus a one-cell halo (see
+        :obj:`_get_active_bounds`), outside of which the flux is zero;
+        `cf` is zeroed before the passes, so that it holds the flux of the
+        last pass over the whole domain in either case.
         """
-        for _ in range(self.N_crossdiff):
-
-            a = ndimage.convolve(self.eta, self.kernel1, mode='constant')
-            b = ndimage.convolve(self.qs, self.kernel2, mode='constant')
-            c = ndimage.convolve(self.qs * self.eta, self.kernel2,
-                                 mode='constant')
+        if self._threaded:
+            _diffuse = _topo_diffusion_pass.threaded
+        else:
+            _diffuse = _topo_diffusion_pass
+        _n_chunks = shared_tools.get_num_chunks(self._threaded)
 
-            self.cf = (self.diffusion_multiplier *
-                       (self.qs * a - self.eta * b + c))
+        if self._diffusion_region == 'active':
+            _bounds = _get_active_bounds(self.qs)
+            self.cf[:] = 0
+        else:
+            _bounds = (0, self.L, 0, self.W)
 
-            self.cf[self.cell_type == -2] = 0
-            self.cf[0, :] = 0
+        for _ in range(self.N_crossdiff):
+            _diffuse(self.eta, self.qs, self.cell_type, self.cf,
+                     self.diffusion_multiplier, _bounds, _n_chunks)
 
-            self.eta += self.cf
 
+# model fields bound to the sediment routers, in the order of `bind_fields`
+_ROUTER_FIELDS = ('eta', 'stage', 'depth', 'cell_type', 'uw', 'ux', 'uy',
+                  'pad_stage', 'pad_depth', 'pad_cell_type', 'Vp_dep_mud',
+                  'Vp_dep_sand', 'qw', 'qx', 'qy', 'qs')
 
 r_spec = [('_dt', float32), ('_dx', float32),
           ('num_starts', int64), ('start_indices', int64[:]),
@@ -170,7 +266,11 @@ r_spec = [('_dt', float32), ('_dx', float32),
           ('Vp_res', float32), ('Vp_dep_mud', float64[:, :]),
           ('Vp_dep_sand', float64[:, :]),
           ('U_dep_mud', float32), ('U_ero_mud', float32),
-          ('U_ero_sand', float32)]
+          ('U_ero_sand', float32),
+          ('weight_cache', float64[:, :, :]), ('weight_cached', boolean[:, :]),
+          ('n_weight_hits', int64), ('n_weight_misses', int64),
+          ('rng_key', int64), ('rng_stream', int64), ('rng_counter', int64),
+          ('touched', int64[:]), ('n_touched', int64)]
 
 
 class BaseRouter(object):
@@ -199,25 +299,112 @@ class BaseRouter(object):
     def _route_one_parcel(self):
         ...
 
+    def bind_fields(self, eta, stage, depth, cell_type, uw, ux, uy,
+                    pad_stage, pad_depth, pad_cell_type, Vp_dep_mud,
+                    Vp_dep_sand, qw, qx, qy, qs):
+        """Bind the fields to the router, without routing parcels.
+
+        The router keeps references to the arrays, and changes them in place
+        when routing parcels, so the fields need only be bound again if an
+        array is replaced. The model binds its fields with
+        :obj:`~pyDeltaRCM.sed_tools.sed_tools.bind_sediment_routers`, and
+        :obj:`_route_parcels_batched` binds each router to its own copies of
+        the fields that parcels change.
+        """
+        self.eta = eta
+        self.stage = stage
+        self.depth = depth
+        self.cell_type = cell_type
+        self.uw = uw
+        self.ux = ux
+        self.uy = uy
+        self.pad_stage = pad_stage
+        self.pad_depth = pad_depth
+        self.pad_cell_type = pad_cell_type
+        self.Vp_dep_mud = Vp_dep_mud
+        self.Vp_dep_sand = Vp_dep_sand
+        self.qw = qw
+        self.qx = qx
+        self.qy = qy
+        self.qs = qs
+        self._reset_weight_cache()
+
+    def _log_touched(self, px, py):
+        """Record a cell changed by the parcel being routed.
+
+        Cells are recorded only while there is room in the `touched` array,
+        which has no room unless allocated by :obj:`_route_parcels_batched`.
+        """
+        if self.n_touched < self.touched.shape[0]:
+            self.touched[self.n_touched] = px * self.depth.shape[1] + py
+            self.n_touched += 1
+
+    def _reset_weight_cache(self):
+        """Invalidate the routing weights of all cells.
+
+        The cache of routing weights is allocated on the first call, and
+        whenever the shape of the domain changes. The cache must be reset
+        at the start of each `run`, because the fields the weights depend on
+        change between runs.
+        """
+        L, W = self.depth.shape
+        if ((self.weight_cache.shape[0] != L) or
+                (self.weight_cache.shape[1] != W)):
+            self.weight_cache = np.zeros((L, W, 9))
+            self.weight_cached = np.zeros((L, W), dtype=np.bool_)
+        self.weight_cached[:] = False
+        self.n_weight_hits = 0
+        self.n_weight_misses = 0
+
+    def _invalidate_weights(self, px, py):
+        """Invalidate the routing weights of the neighbors of a cell.
+
+        Called when the depth at cell `px`, `py` changes, because the depth
+        at the cell enters the weights of every cell in its 3x3
+        neighborhood.
+        """
+        L, W = self.depth.shape
+        for i in range(max(px - 1, 0), min(px + 2, L)):
+            for j in range(max(py - 1, 0), min(py + 2, W)):
+                self.weight_cached[i, j] = False
+
+    def weight_cache_hit_rate(self):
+        """Fraction of parcel steps that used cached routing weights.
+
+        Counted since the start of the last `run`.
+        """
+        n_steps = self.n_weight_hits + self.n_weight_misses
+        if n_steps > 0:
+            return self.n_weight_hits / n_steps
+        else:
+            return 0.
+
     def _choose_next_location(self, px, py):
 
-        # choose next location with weights
-        stage_nbrs = self.pad_stage[
-            px:px + 3, py:py + 3]
-        depth_nbrs = self.pad_depth[
-            px:px + 3, py:py + 3]
-        cell_type_ind = self.pad_cell_type[
-            px:px + 3, py:py + 3]
-
-        weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
-            self.stage[px, py], stage_nbrs.ravel(), self.qx[px, py],
-            self.qy[px, py], self.ivec_flat, self.jvec_flat,
-            self.distances_flat)
-        weights = shared_tools.get_weight_at_cell(
-            (px, py), weight_sfc, weight_int, depth_nbrs.ravel(),
-            cell_type_ind.ravel(), self.dry_depth,
-            self.gamma, self.theta_sed)
-        new_cell = shared_tools.random_pick(weights)
+        # the weights change only when the depth of a neighbor changes, so
+        #   they are cached until invalidated in `_update_fields`
+        if self.weight_cached[px, py]:
+            self.n_weight_hits += 1
+        else:
+            self.n_weight_misses += 1
+
+            # choose next location with weights
+            shared_tools.fill_weight_at_cell(
+                self.weight_cache[px, py], px, py, self.stage,
+                self.pad_stage, self.pad_depth, self.pad_cell_type, self.qx,
+                self.qy, self.ivec_flat, self.jvec_flat, self.distances_flat,
+                self.dry_depth, self.gamma, self.theta_sed)
+            self.weight_cached[px, py] = True
+
+        if self.rng_key < 0:
+            new_cell = shared_tools.random_pick(self.weight_cache[px, py])
+        else:
+            # draw from the stream of the parcel, see `_route_parcels_batched`
+            self.rng_counter += 1
+            new_cell = shared_tools.random_pick_with_uniform(
+                self.weight_cache[px, py],
+                shared_tools.get_counter_uniform(
+                    self.rng_key, self.rng_stream, self.rng_counter))
         dist, istep, jstep, _ = shared_tools.get_steps(
             new_cell, self.iwalk_flat, self.jwalk_flat)
 
@@ -244,7 +431,8 @@ class BaseRouter(object):
             Vp_change / (dx * dx)
 
         Following the sediment deposition/erosion, the new values for flow
-        depth and flow velocity fields are determined.
+        depth and flow velocity fields are determined. If the depth changes,
+        the cached routing weights of the neighboring cells are invalidated.
 
         .. note::
 
@@ -286,9 +474,12 @@ class BaseRouter(object):
             uw = self.uw[px, py]
 
         # now apply the computed updated values
+        self._log_touched(px, py)
+        depth0 = self.depth[px, py]
         self.eta[px, py] = eta  # update bed
-        self.depth[px, py] = depth  # update depth
-        self.pad_depth[px + 1, py + 1] = depth  # update depth in padded array
+        self.depth[px, py] = depth  # update depth, and the padded array
+        if self.depth[px, py] != depth0:
+            self._invalidate_weights(px, py)
         self.uw[px, py] = uw  # update absolute flow field
         # update component flow fields
         if qw0 > 0:
@@ -381,15 +572,21 @@ class SandRouter(BaseRouter):
         self.stepmax = stepmax
         self.theta_sed = theta_sed
 
-    def run(self, start_indices, eta, stage, depth, cell_type,
-            uw, ux, uy, pad_stage, pad_depth, pad_cell_type, Vp_dep_mud, Vp_dep_sand,
-            qw, qx, qy, qs):
+        self.weight_cache = np.zeros((0, 0, 9))
+        self.weight_cached = np.zeros((0, 0), dtype=np.bool_)
+
+        self.rng_key = -1
+        self.touched = np.zeros(0, dtype=np.int64)
+
+    def run(self, start_indices):
         """The main function to route and deposit/erode sand parcels.
 
+        The router must be bound to the fields of the model with
+        :obj:`bind_fields`, which are then changed in place.
+
         Algorithm is to:
 
-            1. as input, receive the current status of fields from the model.
-            Additionally, receive a list of the starting points to use to run
+            1. as input, receive a list of the starting points to use to run
             parcels, as :obj:`px` and :obj:`py`.
 
             2. begin a `for` loop to run each parcel in series.
@@ -412,36 +609,27 @@ class SandRouter(BaseRouter):
             We are unable to precompute the routing weights, in the way
             we do in :obj:`~pyDeltaRCM.water_tools.get_water_weight_array`,
             because the weighting changes with each parcel step (i.e.,
-            morphodynamics).
+            morphodynamics). Instead, the weights of each cell are computed
+            when first needed, and cached until the depth of the cell or one
+            of its neighbors changes.
         """
-        self.eta = eta
-        self.stage = stage
-        self.depth = depth
-        self.cell_type = cell_type
-        self.uw = uw
-        self.ux = ux
-        self.uy = uy
-        self.pad_stage = pad_stage
-        self.pad_depth = pad_depth
-        self.pad_cell_type = pad_cell_type
-        self.Vp_dep_mud = Vp_dep_mud
-        self.Vp_dep_sand = Vp_dep_sand
-        self.qw = qw
-        self.qx = qx
-        self.qy = qy
-        self.qs = qs
+        self._reset_weight_cache()
 
         num_starts = start_indices.shape[0]
         for np_sed in range(num_starts):
+            self._route_from_inlet(start_indices[np_sed])
 
-            self.Vp_res = self.Vp_sed
+    def _route_from_inlet(self, py):
+        """Route one parcel, from the inlet cell at column `py`.
+        """
+        self.Vp_res = self.Vp_sed
 
-            px = 0
-            py = start_indices[np_sed]
+        px = 0
 
-            self.qs[px, py] = (self.qs[px, py] +
-                               self.Vp_res / 2. / self._dt / self._dx)
-            self._route_one_parcel(px, py)
+        self.qs[px, py] = (self.qs[px, py] +
+                           self.Vp_res / 2. / self._dt / self._dx)
+        self._log_touched(px, py)
+        self._route_one_parcel(px, py)
 
     def _route_one_parcel(self, px, py):
         """Route one parcel.
@@ -589,38 +777,32 @@ class MudRouter(BaseRouter):
         self.stepmax = stepmax
         self.theta_sed = theta_sed
 
-    def run(self, start_indices, eta, stage, depth, cell_type,
-            uw, ux, uy, pad_stage, pad_depth, pad_cell_type, Vp_dep_mud, Vp_dep_sand,
-            qw, qx, qy):
+        self.weight_cache = np.zeros((0, 0, 9))
+        self.weight_cached = np.zeros((0, 0), dtype=np.bool_)
+
+        self.rng_key = -1
+        self.touched = np.zeros(0, dtype=np.int64)
+
+    def run(self, start_indices):
         """The main function to route and deposit/erode mud parcels.
 
+        The router must be bound to the fields of the model with
+        :obj:`bind_fields`, which are then changed in place.
         """
-
-        self.eta = eta
-        self.stage = stage
-        self.depth = depth
-        self.cell_type = cell_type
-        self.uw = uw
-        self.ux = ux
-        self.uy = uy
-        self.pad_stage = pad_stage
-        self.pad_depth = pad_depth
-        self.pad_cell_type = pad_cell_type
-        self.Vp_dep_mud = Vp_dep_mud
-        self.Vp_dep_sand = Vp_dep_sand
-        self.qw = qw
-        self.qx = qx
-        self.qy = qy
+        self._reset_weight_cache()
 
         num_starts = start_indices.shape[0]
         for np_sed in range(num_starts):
+            self._route_from_inlet(start_indices[np_sed])
 
-            self.Vp_res = self.Vp_sed
+    def _route_from_inlet(self, py):
+        """Route one parcel, from the inlet cell at column `py`.
+        """
+        self.Vp_res = self.Vp_sed
 
-            px = 0
-            py = start_indices[np_sed]
+        px = 0
 
-            self._route_one_parcel(px, py)
+        self._route_one_parcel(px, py)
 
     def _route_one_parcel(self, px, py):
         """Route one parcel.
@@ -674,3 +856,533 @@ class MudRouter(BaseRouter):
         self.Vp_res = self.Vp_res - Vp_change  # update sed volume in parcel
 
         self._update_fields(Vp_change, px, py)  # update other fields as needed
+
+
+@shared_tools.njit_threaded
+def _route_parcels_batched(routers, start_indices, batch_size, key,
+                           eta, stage, depth, cell_type, uw, ux, uy,
+                           pad_stage, pad_depth, pad_cell_type, Vp_dep_mud,
+                           Vp_dep_sand, qw, qx, qy, qs):
+    """Route sediment parcels in batches, against a snapshot of the fields.
+
+    This is an approximate alternative to routing the parcels one after
+    another with the `run` method of a router. The parcels are split into
+    batches of `batch_size` parcels. All parcels of a batch are routed
+    against the same snapshot of the fields (the fields at the start of the
+    batch), each parcel seeing only its own changes to the fields, so that
+    the parcels of a batch can be routed in parallel by the ``threaded``
+    variant of the function (see
+    :obj:`~pyDeltaRCM.shared_tools.njit_threaded`).
+
+    Each router in `routers` routes the parcels of one chunk of the batch,
+    on its own copies of the fields that parcels change (see
+    :obj:`_bind_router_copies` and :obj:`_route_and_record_parcel`).
+
+    After the batch is routed, the changes are reduced into the fields, in
+    the order of the parcels. At a cell changed by a single parcel, the
+    final values of that parcel are taken. At a cell changed by more than one
+    parcel, the changes of the bed elevation, deposit volumes and sediment
+    discharge are summed. The summed change of the bed is limited to a
+    quarter of the water depth of the snapshot, as in
+    :obj:`BaseRouter._limit_Vp_change`, or to the largest change made by a
+    single parcel, if larger (a single parcel has already limited each of its
+    own steps). The summed changes of the deposit volumes and sediment
+    discharge are scaled by the same factor as the change of the bed. The
+    depth and flow velocities at the cell are then computed from the new
+    bed, as in :obj:`BaseRouter._update_fields`.
+
+    Random numbers are drawn from a counter-based generator
+    (:obj:`~pyDeltaRCM.shared_tools.get_counter_uniform`), with the parcel
+    number as the stream, so that the result is identical for any number of
+    chunks or threads. Because the `run` method draws from the global random
+    number generator instead, this function does *not* reproduce the serial
+    routing, even with a `batch_size` of one. A
+    :obj:`~pyDeltaRCM.DeltaModel.sed_batch_size` of one gives the serial
+    result only because
+    :obj:`~pyDeltaRCM.sed_tools.sed_tools.route_all_sand_parcels` and
+    :obj:`~pyDeltaRCM.sed_tools.sed_tools.route_all_mud_parcels` then call
+    `run`, and do not call this function at all.
+
+    Parameters
+    ----------
+    routers : :obj:`numba.typed.List`
+        One :obj:`SandRouter` or :obj:`MudRouter` for each chunk.
+
+    start_indices : :obj:`ndarray`
+        Inlet columns of the parcels.
+
+    batch_size : :obj:`int`
+        Number of parcels in a batch.
+
+    key : :obj:`int`
+        Key for the counter-based random number generator, see
+        :obj:`~pyDeltaRCM.shared_tools.get_random_key`.
+
+    The remaining arguments are the model fields, as passed to `run`. The
+    fields `eta`, `depth` (and `pad_depth`), `uw`, `ux`, `uy`, `Vp_dep_mud`,
+    `Vp_dep_sand` and `qs` are modified in place.
+    """
+    L, W = eta.shape
+    n_chunks = len(routers)
+    nparcels = start_indices.shape[0]
+    ncap = int(routers[0].stepmax) + 2
+    u_max = routers[0].u_max
+
+    _bind_router_copies(routers, key, ncap, eta, stage, depth, cell_type,
+                        uw, ux, uy, pad_stage, pad_depth, pad_cell_type,
+                        Vp_dep_mud, Vp_dep_sand, qw, qx, qy, qs)
+
+    # cells changed by each parcel of a batch, and the final values there
+    cells = np.zeros((batch_size, ncap), dtype=np.int64)
+    n_cells = np.zeros(batch_size, dtype=np.int64)
+    f_32 = np.zeros((2, batch_size, ncap), dtype=np.float32)
+    f_64 = np.zeros((6, batch_size, ncap))
+
+    # reduction of the changes at each cell
+    seen = np.full(L * W, -1, dtype=np.int64)
+    count = np.zeros(L * W, dtype=np.int64)
+    last = np.zeros(L * W, dtype=np.int64)
+    d_eta = np.zeros(L * W)
+    max_dep = np.zeros(L * W)
+    max_ero = np.zeros(L * W)
+    d_Vp_mud = np.zeros(L * W)
+    d_Vp_sand = np.zeros(L * W)
+    d_qs = np.zeros(L * W)
+    changed = np.zeros(batch_size * ncap, dtype=np.int64)
+
+    for b0 in range(0, nparcels, batch_size):
+        nb = min(batch_size, nparcels - b0)
+
+        # route the parcels of the batch, each chunk on its own router
+        for c in prange(n_chunks):
+            router = routers[np.int64(c)]
+            for j in range(c, nb, n_chunks):
+                _route_and_record_parcel(
+                    router, start_indices[b0 + j], b0 + j, j, cells,
+                    n_cells, f_32, f_64, eta, depth, uw, ux, uy, Vp_dep_mud,
+                    Vp_dep_sand, qs)
+
+        # sum the changes of the parcels at each cell, in parcel order
+        n_changed = 0
+        for j in range(nb):
+            for m in range(n_cells[j]):
+                cell = cells[j, m]
+                if seen[cell] == b0 + j:
+                    continue  # recorded more than once by this parcel
+                seen[cell] = b0 + j
+                if count[cell] == 0:
+                    changed[n_changed] = cell
+                    n_changed += 1
+                count[cell] += 1
+                last[cell] = j * ncap + m
+
+                i = cell // W
+                k = cell % W
+                _d = float(f_32[0, j, m]) - float(eta[i, k])
+                d_eta[cell] += _d
+                max_dep[cell] = max(max_dep[cell], _d)
+                max_ero[cell] = max(max_ero[cell], -_d)
+                d_Vp_mud[cell] += f_64[3, j, m] - Vp_dep_mud[i, k]
+                d_Vp_sand[cell] += f_64[4, j, m] - Vp_dep_sand[i, k]
+                d_qs[cell] += f_64[5, j, m] - qs[i, k]
+
+        # apply the changes to the fields
+        for n in range(n_changed):
+            cell = changed[n]
+            i = cell // W
+            k = cell % W
+            if count[cell] == 1:
+                _commit_cell(last[cell] // ncap, last[cell] % ncap, i, k,
+                             f_32, f_64, eta, depth, uw, ux, uy, Vp_dep_mud,
+                             Vp_dep_sand, qs)
+            else:
+                fourth = max(0., float(stage[i, k]) - float(eta[i, k])) / 4
+                _d = min(d_eta[cell], max(fourth, max_dep[cell]))
+                _d = max(_d, -max(fourth, max_ero[cell]))
+                # scale the other changes as the change of the bed
+                scale = 1.
+                if d_eta[cell] != 0:
+                    scale = _d / d_eta[cell]
+                eta[i, k] = eta[i, k] + _d
+                depth[i, k] = max(0, stage[i, k] - eta[i, k])
+                qw0 = qw[i, k]
+                if depth[i, k] > 0:
+                    uw[i, k] = min(u_max, qw0 / depth[i, k])
+                if qw0 > 0:
+                    ux[i, k] = uw[i, k] * qx[i, k] / qw0
+                    uy[i, k] = uw[i, k] * qy[i, k] / qw0
+                else:
+                    ux[i, k] = 0
+                    uy[i, k] = 0
+                Vp_dep_mud[i, k] += scale * d_Vp_mud[cell]
+                Vp_dep_sand[i, k] += scale * d_Vp_sand[cell]
+                qs[i, k] += scale * d_qs[cell]
+
+            count[cell] = 0
+            d_eta[cell] = 0
+            max_dep[cell] = 0
+            max_ero[cell] = 0
+            d_Vp_mud[cell] = 0
+            d_Vp_sand[cell] = 0
+            d_qs[cell] = 0
+
+        # bring the copies of all routers up to date with the fields
+        for c in prange(n_chunks):
+            for n in range(n_changed):
+                _restore_cell(routers[np.int64(c)],
+                              changed[n] // W, changed[n] % W,
+                              eta, depth, uw, ux, uy, Vp_dep_mud,
+                              Vp_dep_sand, qs)
+
+    for c in range(n_chunks):
+        routers[c].rng_key = -1
+        routers[c].touched = np.zeros(0, dtype=np.int64)
+
+
+@shared_tools.njit_threaded
+def _route_parcels_speculative(router, routers, start_indices, window, key,
+                               eta, stage, depth, cell_type, uw, ux, uy,
+                               pad_stage, pad_depth, pad_cell_type,
+                               Vp_dep_mud, Vp_dep_sand, qw, qx, qy, qs):
+    """Route sediment parcels speculatively, in serial order.
+
+    The parcels are routed with the same result as routing them one after
+    another, each drawing random numbers from its own stream of a
+    counter-based generator
+    (:obj:`~pyDeltaRCM.shared_tools.get_counter_uniform`), with the parcel
+    number as the stream. Unlike :obj:`_route_parcels_batched`, the result
+    does not depend on the number of parcels routed at once. The result is
+    not the same as that of the `run` method of the router, which draws the
+    random numbers of all parcels from the global random number generator.
+
+    The parcels are taken in windows of `window` parcels. All parcels of a
+    window are first routed speculatively against the fields at the start of
+    the window, in parallel by the ``threaded`` variant of the function (see
+    :obj:`~pyDeltaRCM.shared_tools.njit_threaded`), each chunk on its own
+    router in `routers`, which records the cells visited by each parcel (see
+    :obj:`_route_and_record_parcel`).
+
+    The parcels are then committed in order. Everything a parcel reads, to
+    choose a step or to deposit or erode, is found in the 3x3 neighborhoods
+    of the cells it visits, and every cell it changes is a cell it visits.
+    A parcel is therefore committed as speculated if none of the cells it
+    visited is in the 3x3 neighborhood of a cell changed by an earlier
+    parcel of the window, because it then read the same values it would
+    have read after the earlier parcels. Otherwise, the speculation is a
+    conflict, and the parcel is routed again with `router`, which is bound
+    to the model fields.
+
+    Parameters
+    ----------
+    router : :obj:`SandRouter` or :obj:`MudRouter`
+        Router to re-route conflicting parcels on the model fields.
+
+    routers : :obj:`numba.typed.List`
+        One :obj:`SandRouter` or :obj:`MudRouter` for each chunk.
+
+    start_indices : :obj:`ndarray`
+        Inlet columns of the parcels.
+
+    window : :obj:`int`
+        Number of parcels routed speculatively at once.
+
+    key : :obj:`int`
+        Key for the counter-based random number generator, see
+        :obj:`~pyDeltaRCM.shared_tools.get_random_key`.
+
+    The remaining arguments are the model fields, as passed to `run`, and
+    are modified in place as by :obj:`_route_parcels_batched`.
+
+    Returns
+    -------
+    n_windows : :obj:`int`
+        Number of windows the parcels were routed in.
+
+    n_conflicts : :obj:`int`
+        Number of parcels that were routed again.
+    """
+    L, W = eta.shape
+    n_chunks = len(routers)
+    nparcels = start_indices.shape[0]
+    ncap = int(routers[0].stepmax) + 2
+
+    _bind_router_copies(routers, key, ncap, eta, stage, depth, cell_type,
+                        uw, ux, uy, pad_stage, pad_depth, pad_cell_type,
+                        Vp_dep_mud, Vp_dep_sand, qw, qx, qy, qs)
+    router.bind_fields(eta, stage, depth, cell_type, uw, ux, uy, pad_stage,
+                       pad_depth, pad_cell_type, Vp_dep_mud, Vp_dep_sand,
+                       qw, qx, qy, qs)
+    router.touched = np.zeros(ncap, dtype=np.int64)
+    router.rng_key = key
+
+    # cells visited by each parcel of a window, and the final values there
+    cells = np.zeros((window, ncap), dtype=np.int64)
+    n_cells = np.zeros(window, dtype=np.int64)
+    f_32 = np.zeros((2, window, ncap), dtype=np.float32)
+    f_64 = np.zeros((6, window, ncap))
+
+    # cells near a cell changed in the window, and the changed cells
+    dirty = np.full(L * W, -1, dtype=np.int64)
+    seen = np.full(L * W, -1, dtype=np.int64)
+    changed = np.zeros(window * ncap, dtype=np.int64)
+
+    n_windows = 0
+    n_conflicts = 0
+    for b0 in range(0, nparcels, window):
+        nb = min(window, nparcels - b0)
+
+        # route the parcels of the window speculatively
+        for c in prange(n_chunks):
+            _router = routers[np.int64(c)]
+            for j in range(c, nb, n_chunks):
+                _route_and_record_parcel(
+                    _router, start_indices[b0 + j], b0 + j, j, cells,
+                    n_cells, f_32, f_64, eta, depth, uw, ux, uy, Vp_dep_mud,
+                    Vp_dep_sand, qs)
+
+        # commit the parcels in order, routing again on conflict
+        n_changed = 0
+        for j in range(nb):
+            # the inlet cell is read, even if the parcel does not change it
+            valid = dirty[start_indices[b0 + j]] != n_windows
+            for m in range(n_cells[j]):
+                if dirty[cells[j, m]] == n_windows:
+                    valid = False
+                    break
+
+            if valid:
+                for m in range(n_cells[j]):
+                    i = cells[j, m] // W
+                    k = cells[j, m] % W
+                    _commit_cell(j, m, i, k, f_32, f_64, eta, depth, uw, ux,
+                                 uy, Vp_dep_mud, Vp_dep_sand, qs)
+                    router._invalidate_weights(i, k)
+            else:
+                n_conflicts += 1
+                router.n_touched = 0
+                router.rng_stream = b0 + j
+                router.rng_counter = 0
+                router._route_from_inlet(start_indices[b0 + j])
+                n_cells[j] = router.n_touched
+                cells[j, :router.n_touched] = router.touched[
+                    :router.n_touched]
+
+            # mark the neighborhoods of the changed cells
+            for m in range(n_cells[j]):
+                cell = cells[j, m]
+                i = cell // W
+                k = cell % W
+                for ii in range(max(i - 1, 0), min(i + 2, L)):
+                    for kk in range(max(k - 1, 0), min(k + 2, W)):
+                        dirty[ii * W + kk] = n_windows
+                if seen[cell] != n_windows:
+                    seen[cell] = n_windows
+                    changed[n_changed] = cell
+                    n_changed += 1
+
+        # bring the copies of all routers up to date with the fields
+        for c in prange(n_chunks):
+            for n in range(n_changed):
+                _restore_cell(routers[np.int64(c)],
+                              changed[n] // W, changed[n] % W,
+                              eta, depth, uw, ux, uy, Vp_dep_mud,
+                              Vp_dep_sand, qs)
+
+        n_windows += 1
+
+    for c in range(n_chunks):
+        routers[c].rng_key = -1
+        routers[c].touched = np.zeros(0, dtype=np.int64)
+    router.rng_key = -1
+    router.touched = np.zeros(0, dtype=np.int64)
+
+    return n_windows, n_conflicts
+
+
+@njit
+def _bind_router_copies(routers, key, ncap, eta, stage, depth, cell_type,
+                        uw, ux, uy, pad_stage, pad_depth, pad_cell_type,
+                        Vp_dep_mud, Vp_dep_sand, qw, qx, qy, qs):
+    """Bind each router to its own copies of the fields parcels change.
+
+    The routers are set to record the cells changed by a parcel, and to draw
+    random numbers from the counter-based generator with `key`.
+    """
+    for c in range(len(routers)):
+        _pad_depth = pad_depth.copy()
+        routers[c].bind_fields(
+            eta.copy(), stage, _pad_depth[1:-1, 1:-1], cell_type, uw.copy(),
+            ux.copy(), uy.copy(), pad_stage, _pad_depth, pad_cell_type,
+            Vp_dep_mud.copy(), Vp_dep_sand.copy(), qw, qx, qy, qs.copy())
+        routers[c].touched = np.zeros(ncap, dtype=np.int64)
+        routers[c].rng_key = key
+
+
+@njit
+def _route_and_record_parcel(router, py, stream, j, cells, n_cells, f_32,
+                             f_64, eta, depth, uw, ux, uy, Vp_dep_mud,
+                             Vp_dep_sand, qs):
+    """Route one parcel on the copies of a router, and record the changes.
+
+    The parcel is routed from the inlet column `py`, with random stream
+    `stream`. The cells changed by the parcel and the final values of the
+    fields there are recorded in row `j` of `cells`, `f_32` (bed elevation
+    and depth) and `f_64` (velocities, deposit volumes and sediment
+    discharge). The copies of the router are then restored from the model
+    fields.
+    """
+    W = eta.shape[1]
+    router.n_touched = 0
+    router.rng_stream = stream
+    router.rng_counter = 0
+    router._route_from_inlet(py)
+
+    # record the final values at the changed cells
+    n_cells[j] = router.n_touched
+    for m in range(router.n_touched):
+        i = router.touched[m] // W
+        k = router.touched[m] % W
+        cells[j, m] = router.touched[m]
+        f_32[0, j, m] = router.eta[i, k]
+        f_32[1, j, m] = router.depth[i, k]
+        f_64[0, j, m] = router.uw[i, k]
+        f_64[1, j, m] = router.ux[i, k]
+        f_64[2, j, m] = router.uy[i, k]
+        f_64[3, j, m] = router.Vp_dep_mud[i, k]
+        f_64[4, j, m] = router.Vp_dep_sand[i, k]
+        f_64[5, j, m] = router.qs[i, k]
+
+    # and restore the copies
+    for m in range(router.n_touched):
+        _restore_cell(router, router.touched[m] // W, router.touched[m] % W,
+                      eta, depth, uw, ux, uy, Vp_dep_mud, Vp_dep_sand, qs)
+
+
+@njit
+def _commit_cell(j, m, i, k, f_32, f_64, eta, depth, uw, ux, uy, Vp_dep_mud,
+                 Vp_dep_sand, qs):
+    """Write the final values recorded for a parcel into the fields.
+
+    See :obj:`_route_and_record_parcel`.
+    """
+    eta[i, k] = f_32[0, j, m]
+    depth[i, k] = f_32[1, j, m]
+    uw[i, k] = f_64[0, j, m]
+    ux[i, k] = f_64[1, j, m]
+    uy[i, k] = f_64[2, j, m]
+    Vp_dep_mud[i, k] = f_64[3, j, m]
+    Vp_dep_sand[i, k] = f_64[4, j, m]
+    qs[i, k] = f_64[5, j, m]
+
+
+@njit
+def _restore_cell(router, i, k, eta, depth, uw, ux, uy, Vp_dep_mud,
+                  Vp_dep_sand, qs):
+    """Copy the fields at a cell into the fields bound to a router.
+
+    The cached routing weights of the router around the cell are
+    invalidated, because the depth at the cell may change.
+    """
+    router.eta[i, k] = eta[i, k]
+    router.depth[i, k] = depth[i, k]
+    router.uw[i, k] = uw[i, k]
+    router.ux[i, k] = ux[i, k]
+    router.uy[i, k] = uy[i, k]
+    router.Vp_dep_mud[i, k] = Vp_dep_mud[i, k]
+    router.Vp_dep_sand[i, k] = Vp_dep_sand[i, k]
+    router.qs[i, k] = qs[i, k]
+    router._invalidate_weights(i, k)
+
+
+@shared_tools.njit_threaded
+def _topo_diffusion_pass(eta, qs, cell_type, cf, diffusion_multiplier,
+                         bounds, n_chunks):
+    """Diffuse topography once, in place.
+
+    Computes the cross-diffusion flux at every cell into `cf`, and then adds
+    the flux to `eta`. The flux is
+
+    .. code::
+
+        cf = diffusion_multiplier * (qs * a - eta * b + c)
+
+    where `a` is the sum of the bed elevation of the 8 neighbors of a cell
+    minus 8 times the bed elevation of the cell, `b` is the sum of the
+    sediment flux of the neighbors, and `c` is the sum of the product of the
+    sediment flux and the bed elevation of the neighbors. Neighbors outside
+    the domain count as zero. The flux is zero in the first row and at
+    cells with a cell type of ``-2``.
+
+    This is the same computation as convolving `eta`, `qs` and ``qs * eta``
+    with the kernels :obj:`~pyDeltaRCM.DeltaModel.kernel1` and
+    :obj:`~pyDeltaRCM.DeltaModel.kernel2` (with `a` rounded to the
+    precision of `eta`), but in a single pass over the domain, without
+    temporary arrays.
+
+    Only the cells within `bounds`, given as ``(i0, i1, j0, j1)`` with
+    exclusive upper bounds, are computed; `cf` is not updated outside the
+    bounds, and is only valid there unless zeroed by the caller. The rows
+    within the bounds are split into `n_chunks` chunks, which are computed
+    in parallel by the ``threaded`` variant of the function (see :obj:`~pyDeltaRCM.shared_tools.njit_threaded`).
+    """
+    L, W = eta.shape
+    i0, i1, j0, j1 = bounds
+    n_rows = i1 - i0
+
+    for c in prange(n_chunks):
+        for i in range(i0 + c * n_rows // n_chunks,
+                       i0 + (c + 1) * n_rows // n_chunks):
+            for j in range(j0, j1):
+                if (i == 0) or (cell_type[i, j] == -2):
+                    cf[i, j] = 0
+                    continue
+                sum_eta = 0.
+                sum_qs = 0.
+                sum_qs_eta = 0.
+                for ni in range(max(i - 1, 0), min(i + 2, L)):
+                    for nj in range(max(j - 1, 0), min(j + 2, W)):
+                        if (ni == i) and (nj == j):
+                            sum_eta -= 8 * float(eta[i, j])
+                        else:
+                            sum_eta += eta[ni, nj]
+                            sum_qs += qs[ni, nj]
+                            sum_qs_eta += qs[ni, nj] * eta[ni, nj]
+                a = eta.dtype.type(sum_eta)
+                cf[i, j] = diffusion_multiplier * (
+                    qs[i, j] * a - eta[i, j] * sum_qs + sum_qs_eta)
+
+    for c in prange(n_chunks):
+        for i in range(i0 + c * n_rows // n_chunks,
+                       i0 + (c + 1) * n_rows // n_chunks):
+            for j in range(j0, j1):
+                eta[i, j] = eta[i, j] + cf[i, j]
+
+
+@njit
+def _get_active_bounds(qs):
+    """Get the bounds of the region where topographic diffusion is active.
+
+    The cross-diffusion flux of :obj:`_topo_diffusion_pass` is zero at any
+    cell where the sediment flux `qs` of the cell and of all its neighbors
+    is zero. This function returns the bounding box of the cells with a
+    nonzero sediment flux, grown by one cell in each direction and clipped
+    to the domain, as ``(i0, i1, j0, j1)`` with exclusive upper bounds. If
+    the sediment flux is zero everywhere, the box is empty.
+
+    Finding the box takes a single comparison per cell, which is small
+    compared to the `N_crossdiff` stencil passes it saves outside the box.
+    """
+    L, W = qs.shape
+
+    i0, i1, j0, j1 = L, 0, W, 0
+    for i in range(L):
+        for j in range(W):
+            if qs[i, j] != 0:
+                i0 = min(i0, i)
+                i1 = i + 1
+                j0 = min(j0, j)
+                j1 = max(j1, j + 1)
+
+    if i1 == 0:
+        return 0, 0, 0, 0
+    return max(i0 - 1, 0), min(i1 + 1, L), max(j0 - 1, 0), min(j1 + 1, W)
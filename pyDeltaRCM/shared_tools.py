@@ -1,6 +1,7 @@
 
 import numpy as np
 
+import numba
 from numba import njit, jit, typed, _helperlib
 
 # tools shared between deltaRCM water and sediment routing
@@ -38,13 +39,117 @@ def get_random_uniform(N):
     return np.random.uniform(0, 1)
 
 
+@njit
+def get_random_key():
+    """Draw a key for the counter-based random number generator.
+
+    The key is drawn from the global random number generator, so that
+    counter-based random numbers are reproducible from the model seed.
+    """
+    return np.random.randint(0, 2**62)
+
+
+@njit
+def _splitmix64(x):
+    """Mix the bits of an unsigned 64-bit integer (SplitMix64 finalizer)."""
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+@njit
+def get_counter_uniform(key, stream, counter):
+    """Draw a uniform random number from a counter-based generator.
+
+    The value is a pure function of the `key`, the `stream` (e.g., a parcel
+    number), and the `counter` (e.g., a step number). Independent streams of
+    random numbers can therefore be drawn in any order, and on any number of
+    threads, with identical results.
+
+    Returns a number in the interval [0, 1).
+    """
+    x = _splitmix64(np.uint64(key) ^ _splitmix64(np.uint64(stream)))
+    x = _splitmix64(x + np.uint64(counter))
+    return (x >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+def njit_threaded(func):
+    """Compile a function for serial and for threaded execution.
+
+    Returns the function compiled with :obj:`numba.njit`, with the variant
+    compiled with ``parallel=True`` attached as its ``threaded`` attribute.
+    Functions decorated in this way split their work into chunks and loop
+    over them with :obj:`numba.prange`, which is a plain ``range`` in the
+    serial variant.
+
+    The threaded variant should only be used if
+    :obj:`~pyDeltaRCM.DeltaModel.threaded` is `True`, so that Numba's
+    threading layer is not started otherwise. A process which forks after
+    the threading layer has started (as the
+    :obj:`~pyDeltaRCM.preprocessor.Preprocessor` does to run jobs in
+    parallel) may hang.
+    """
+    _serial = njit(func)
+    _serial.threaded = njit(parallel=True)(func)
+    return _serial
+
+
+def get_num_chunks(threaded):
+    """Get the number of chunks to split work into for threaded functions.
+
+    Jitted functions that can run on multiple threads split their work into
+    a number of chunks, which are executed in parallel. If `threaded` is
+    `False`, a single chunk is used, and the work runs on one thread.
+    """
+    if threaded:
+        return numba.get_num_threads()
+    else:
+        return 1
+
+
 @njit
 def get_start_indices(inlet, inlet_weights, num_starts):
+    """Pick the inlet cells where parcels start, weighted by `inlet_weights`.
+
+    The cumulative weights are computed with :obj:`get_inlet_cumulative` on
+    every call; when the weights do not change between calls, compute them
+    once and use :obj:`sample_start_indices` instead.
+    """
+    inlet_cumulative = get_inlet_cumulative(inlet_weights)
+    return sample_start_indices(inlet, inlet_cumulative, num_starts)
+
+
+@njit
+def get_inlet_cumulative(inlet_weights):
+    """Get the normalized cumulative weights of the inlet cells.
+
+    The weights are normalized and summed in the same order as by
+    :obj:`random_pick`, so that :obj:`sample_start_indices` picks the same
+    cells as repeated calls to :obj:`random_pick` with the same random
+    numbers.
+    """
     norm_weights = inlet_weights / np.sum(inlet_weights)
-    idxs = []
-    for x in np.arange(num_starts):
-        idxs.append(random_pick(norm_weights))
-    idxs = np.array(idxs)
+    return np.cumsum(norm_weights)
+
+
+@njit
+def sample_start_indices(inlet, inlet_cumulative, num_starts):
+    """Pick the inlet cells where parcels start, from cumulative weights.
+
+    All `num_starts` random numbers are drawn from the global random number
+    generator in a single call, and the start cells are found with a single
+    vectorized search of `inlet_cumulative` (see
+    :obj:`get_inlet_cumulative`). The random numbers are drawn from the
+    generator in the same sequence as one call to :obj:`get_random_uniform`
+    for each parcel, so that for a given seed the start cells are identical
+    to those picked by :obj:`random_pick` one parcel at a time, and the
+    state of the generator afterwards is the same.
+    """
+    u = np.random.random(num_starts)
+    idxs = np.searchsorted(inlet_cumulative, u)
+    # guard against a last cumulative weight rounded to below one
+    idxs = np.minimum(idxs, len(inlet_cumulative) - 1)
     return inlet.take(idxs)
 
 
@@ -69,8 +174,166 @@ def random_pick(prob):
     Takes a numpy array that is the precalculated cumulative probability
     around the cell flattened to 1D.
     """
+    return random_pick_with_uniform(prob, get_random_uniform(1))
+
+
+@njit
+def random_pick_with_uniform(prob, u):
+    """Pick number from weighted array, with a given uniform number.
+
+    Same as :obj:`random_pick`, but the random number `u` in the interval
+    [0, 1) is supplied by the caller.
+    """
     arr = np.arange(len(prob))
-    return arr[np.searchsorted(np.cumsum(prob), get_random_uniform(1))]
+    return arr[np.searchsorted(np.cumsum(prob), u)]
+
+
+@njit
+def get_cumulative_table(weights):
+    """Get the cumulative weights of each row of a weight table.
+
+    The weights of each row are summed in the same order as by
+    :obj:`numpy.cumsum`, so that :obj:`pick_from_cumulative` picks the same
+    index as :obj:`random_pick_with_uniform` for the same random number.
+    """
+    cumulative = np.zeros_like(weights)
+    for i in range(weights.shape[0]):
+        _sum = 0.
+        for k in range(weights.shape[1]):
+            _sum += weights[i, k]
+            cumulative[i, k] = _sum
+    return cumulative
+
+
+@njit
+def pick_from_cumulative(cumulative, u):
+    """Pick number from cumulative weights, with a given uniform number.
+
+    Same as :obj:`random_pick_with_uniform`, but with the cumulative
+    weights precomputed (see :obj:`get_cumulative_table`), and without
+    allocating any arrays.
+
+    If `u` is larger than the sum of the weights (due to rounding), the last
+    index with a nonzero weight is picked.
+    """
+    for k in range(cumulative.shape[0]):
+        if u <= cumulative[k]:
+            return k
+    for k in range(cumulative.shape[0] - 1, 0, -1):
+        if cumulative[k] > cumulative[k - 1]:
+            return k
+    return 0
+
+
+@njit
+def get_alias_table(weights):
+    """Get the Walker alias table of each row of a weight table.
+
+    The tables are constructed with Vose's method, such that index ``k`` of
+    a row is picked with probability proportional to ``weights[i, k]`` by
+    :obj:`pick_from_alias`. Rows without any weight always pick the middle
+    index of the row (i.e., for the 9 cells of a neighborhood, the cell
+    itself).
+
+    Returns
+    -------
+    prob : :obj:`ndarray`
+        Probability of keeping each index of each row.
+
+    alias : :obj:`ndarray`
+        Index to pick instead of each index of each row.
+    """
+    n_rows, n = weights.shape
+    prob = np.zeros((n_rows, n))
+    alias = np.full((n_rows, n), n // 2, dtype=np.int64)
+
+    scaled = np.zeros(n)
+    small = np.zeros(n, dtype=np.int64)
+    large = np.zeros(n, dtype=np.int64)
+    for i in range(n_rows):
+        _sum = 0.
+        _max = 0
+        for k in range(n):
+            _sum += weights[i, k]
+            if weights[i, k] > weights[i, _max]:
+                _max = k
+        if _sum <= 0:
+            continue
+
+        n_small = 0
+        n_large = 0
+        for k in range(n):
+            scaled[k] = weights[i, k] * n / _sum
+            if scaled[k] < 1:
+                small[n_small] = k
+                n_small += 1
+            else:
+                large[n_large] = k
+                n_large += 1
+
+        while (n_small > 0) and (n_large > 0):
+            n_small -= 1
+            n_large -= 1
+            s = small[n_small]
+            g = large[n_large]
+            prob[i, s] = scaled[s]
+            alias[i, s] = g
+            scaled[g] = (scaled[g] + scaled[s]) - 1
+            if scaled[g] < 1:
+                small[n_small] = g
+                n_small += 1
+            else:
+                large[n_large] = g
+                n_large += 1
+
+        # entries left over are (up to rounding) kept with probability one,
+        #   but never for an index without weight
+        for m in range(n_large):
+            prob[i, large[m]] = 1
+        for m in range(n_small):
+            k = small[m]
+            if weights[i, k] > 0:
+                prob[i, k] = 1
+            else:
+                alias[i, k] = _max
+    return prob, alias
+
+
+@njit
+def pick_from_alias(prob, alias, u):
+    """Pick number from a Walker alias table, with a given uniform number.
+
+    The uniform number `u` in the interval [0, 1) selects both an index of
+    the table, and whether to keep the index or take its alias (see
+    :obj:`get_alias_table`). The pick is made in constant time, without
+    allocating any arrays, but does not pick the same index as
+    :obj:`random_pick_with_uniform` for the same random number.
+    """
+    x = u * prob.shape[0]
+    k = min(int(x), prob.shape[0] - 1)
+    if (x - k) < prob[k]:
+        return k
+    else:
+        return alias[k]
+
+
+@njit
+def fill_halo(padded):
+    """Fill the one-cell halo of a padded array.
+
+    The halo is filled with the values of the nearest cells of the interior
+    of the array, the same as by ``np.pad(interior, 1, 'edge')``, but in
+    place and without copying the interior. Model fields are views into the
+    interior of their padded arrays, so that only the halo needs to be
+    refreshed when the fields change.
+    """
+    L, W = padded.shape
+    for j in range(1, W - 1):
+        padded[0, j] = padded[1, j]
+        padded[L - 1, j] = padded[L - 2, j]
+    for i in range(L):
+        padded[i, 0] = padded[i, 1]
+        padded[i, W - 1] = padded[i, W - 2]
 
 
 @njit
@@ -93,6 +356,33 @@ def custom_ravel(tup, shape):
     return x + y
 
 
+@njit
+def get_neighbor_indices(shape):
+    """Get the unraveled indices of the neighbors of every cell.
+
+    Returns an ``(L*W, 9)`` `int32` array, where row ``i`` holds the
+    unraveled indices of the 3x3 neighborhood of the cell with unraveled
+    index ``i``, in the same order as
+    :obj:`~pyDeltaRCM.DeltaModel.iwalk_flat` and
+    :obj:`~pyDeltaRCM.DeltaModel.jwalk_flat` (i.e., column ``4`` is the
+    cell itself). Neighbors outside the domain are ``-1``.
+
+    A step of a parcel in D8 direction ``k`` from cell ``i`` is then a
+    single lookup, ``neighbor_indices[i, k]``, rather than unraveling and
+    raveling the index.
+    """
+    L, W = shape
+    neighbor_indices = np.full((L * W, 9), -1, dtype=np.int32)
+    for x in range(L):
+        for y in range(W):
+            for k in range(9):
+                nx = x + k // 3 - 1
+                ny = y + k % 3 - 1
+                if (nx >= 0) and (nx < L) and (ny >= 0) and (ny < W):
+                    neighbor_indices[x * W + y, k] = nx * W + ny
+    return neighbor_indices
+
+
 @njit
 def get_weight_sfc_int(stage, stage_nbrs, qx, qy, ivec, jvec, distances):
     """Determine random walk weight surfaces.
@@ -138,6 +428,102 @@ def get_weight_at_cell(ind, weight_sfc, weight_int, depth_nbrs, ct_nbrs,
     return weight
 
 
+@njit
+def fill_weight_at_cell(weight, i, j, stage, pad_stage, pad_depth,
+                        pad_cell_type, qx, qy, ivec, jvec, distances,
+                        dry_depth, gamma, theta):
+    """Compute the step direction weights of one cell, in place.
+
+    Computes the same weights as :obj:`get_weight_sfc_int` followed by
+    :obj:`get_weight_at_cell` for cell ``(i, j)``, but with scalar loops over
+    the 9 neighbors of the cell, writing directly into `weight`. No arrays
+    are created, and the arithmetic is carried out in the same order and
+    precision as the array functions (e.g., the surface weights are summed
+    in the precision of `stage` and `distances`), so that the weights are
+    identical.
+
+    Parameters
+    ----------
+    weight : :obj:`ndarray`
+        Array of 9 elements, to write the weights of the cell into.
+
+    i, j : :obj:`int`
+        Index of the cell.
+
+    stage : :obj:`ndarray`
+        The stage field.
+
+    pad_stage, pad_depth, pad_cell_type : :obj:`ndarray`
+        The stage, depth, and cell type fields, padded with one cell along
+        each edge.
+
+    qx, qy : :obj:`ndarray`
+        The discharge component fields.
+
+    ivec, jvec, distances : :obj:`ndarray`
+        Flattened unit vectors and distances to the 9 neighbors of a cell.
+
+    dry_depth, gamma, theta : :obj:`float`
+        Routing constants.
+    """
+    # zero in the type of the surface weights, so that they are summed in
+    #   the precision of `stage` and `distances`, as by the array
+    #   functions; it is nan where the stage of the cell is nan, so that
+    #   the weights are zero, as when `np.maximum` propagates the nan
+    zero_sfc = (stage[i, j] - stage[i, j]) / distances[0]
+
+    # sum of the surface and inertial weights over valid cells
+    sum_sfc = zero_sfc
+    sum_int = 0.
+    for k in range(9):
+        ni = i + k // 3
+        nj = j + k % 3
+        invalid = (((i == 0) and (k < 3)) or
+                   (pad_depth[ni, nj] <= dry_depth) or
+                   (pad_cell_type[ni, nj] == -2))
+        if not invalid:
+            sum_sfc += max(zero_sfc,
+                           (stage[i, j] - pad_stage[ni, nj]) / distances[k])
+            sum_int += max(0., (qx[i, j] * jvec[k] + qy[i, j] * ivec[k]) /
+                           distances[k])
+
+    # combined weight of each cell, nan for invalid cells
+    sum_weight = 0.
+    nonzero = False
+    n_valid = 0
+    for k in range(9):
+        ni = i + k // 3
+        nj = j + k % 3
+        if pad_depth[ni, nj] <= dry_depth:
+            weight[k] = 0.
+        elif ((i == 0) and (k < 3)) or (pad_cell_type[ni, nj] == -2):
+            weight[k] = np.nan
+            continue
+        else:
+            weight_sfc = max(zero_sfc,
+                             (stage[i, j] - pad_stage[ni, nj]) / distances[k])
+            weight_int = max(0., (qx[i, j] * jvec[k] + qy[i, j] * ivec[k]) /
+                             distances[k])
+            if sum_sfc > 0:
+                weight_sfc = weight_sfc / sum_sfc
+            if sum_int > 0:
+                weight_int = weight_int / sum_int
+            weight[k] = (pad_depth[ni, nj] ** theta *
+                         (gamma * weight_sfc + (1 - gamma) * weight_int))
+        sum_weight += weight[k]
+        nonzero = nonzero or (weight[k] != 0)
+        n_valid += 1
+
+    # normalize the weights, and zero the invalid cells
+    for k in range(9):
+        if np.isnan(weight[k]):
+            weight[k] = 0
+        elif nonzero:
+            weight[k] = weight[k] / sum_weight
+        else:
+            weight[k] = 1 / max(1, n_valid)
+
+
 def _get_version():
     """Extract version from file.
 
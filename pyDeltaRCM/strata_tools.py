@@ -0,0 +1,145 @@
+
+import numpy as np
+from numba import prange
+
+import netCDF4
+
+from . import shared_tools
+
+# tools for building stratigraphy cubes from the model output
+
+
+def build_cube(nc_path, npy_path, vertical_spacing=0.05,
+               max_depth_of_section=5, rows_per_chunk=16, threaded=False):
+    """Build a stratigraphy cube from the output netCDF file.
+
+    Combines the elevations (``strata_depth``) and sand fractions
+    (``strata_sand_frac``) of the saved stratigraphy into a cube of the sand
+    fraction of the preserved deposits, with vertical cells of
+    `vertical_spacing`, and writes the cube to a memory-mapped ``.npy``
+    file.
+
+    The cube has shape ``(nz, L, W)``, where ``nz`` is
+    ``int(max_depth_of_section / vertical_spacing)``. The first index is
+    height, from the top of the cube down: cell ``z`` of the cube is at
+    height ``(nz - 1 - z) * vertical_spacing - max_depth_of_section``. Cells
+    not within any preserved deposit (i.e., above the final bed) are -1.
+
+    The netCDF file is read in blocks of `rows_per_chunk` rows (of all
+    saves), so that only one block is in memory at a time, and each block is
+    written to the cube before the next is read. The vertical column of
+    each cell is filled by :obj:`_fill_strata_columns`, and the rows of a
+    block are filled in parallel if `threaded` is `True`.
+
+    Parameters
+    ----------
+    nc_path : :obj:`str`
+        Path to the output netCDF file of a model run, with stratigraphy
+        saved (see :obj:`~pyDeltaRCM.model.DeltaModel.save_strata`).
+
+    npy_path : :obj:`str`
+        Path to write the cube to. An existing file is overwritten.
+
+    vertical_spacing : :obj:`float`, optional
+        Height of the cells of the cube, in meters. Default is 0.05.
+
+    max_depth_of_section : :obj:`float`, optional
+        Depth of the base of the cube below zero elevation, in meters.
+        Default is 5.
+
+    rows_per_chunk : :obj:`int`, optional
+        Number of rows of the domain to read and fill at a time. Default is
+        16.
+
+    threaded : :obj:`bool`, optional
+        Whether to fill the rows of each block in parallel. Default is
+        `False`.
+
+    Returns
+    -------
+    cube : :obj:`numpy.memmap`
+        The stratigraphy cube, memory-mapped from `npy_path`.
+    """
+    nz = int(max_depth_of_section / vertical_spacing)
+    n_chunks = shared_tools.get_num_chunks(threaded)
+    if threaded:
+        _fill = _fill_strata_columns.threaded
+    else:
+        _fill = _fill_strata_columns
+
+    with netCDF4.Dataset(nc_path, 'r') as nc:
+        nc.set_auto_mask(False)
+        strata_depth = nc.variables['strata_depth']
+        strata_sand_frac = nc.variables['strata_sand_frac']
+        _, L, W = strata_depth.shape
+
+        cube = np.lib.format.open_memmap(
+            npy_path, mode='w+', dtype=np.float32, shape=(nz, L, W))
+
+        for i0 in range(0, L, rows_per_chunk):
+            i1 = min(i0 + rows_per_chunk, L)
+            _depth = np.asarray(strata_depth[:, i0:i1, :], dtype=np.float64)
+            _sand_frac = np.asarray(strata_sand_frac[:, i0:i1, :],
+                                    dtype=np.float64)
+            _block = np.empty((nz, i1 - i0, W), dtype=np.float32)
+            _fill(_depth, _sand_frac, _block, float(vertical_spacing),
+                  float(max_depth_of_section), min(n_chunks, i1 - i0))
+            cube[:, i0:i1, :] = _block
+
+    cube.flush()
+    return cube
+
+
+@shared_tools.njit_threaded
+def _fill_strata_columns(depth, sand_frac, block, vertical_spacing,
+                         max_depth_of_section, n_chunks):
+    """Fill the vertical columns of a block of a stratigraphy cube.
+
+    `depth` and `sand_frac` are the elevation and sand fraction of each save
+    of the stratigraphy, with shape ``(n_saves, n_rows, W)``, and `block`
+    is the part of the cube to fill, with shape ``(nz, n_rows, W)``.
+
+    For each cell, the preserved elevation of each save is the minimum of
+    the elevations of that save and all later saves (i.e., where a surface
+    was cut by a later one, only the lower surface is preserved). A cell of
+    the column is within the deposit of a save if its height is at or below
+    the preserved elevation of the save, and takes the sand fraction of the
+    oldest save it is within, skipping saves without a sand fraction
+    record (a sand fraction of zero or less). Cells not within any deposit
+    are -1.
+
+    The preserved elevations never decrease from older to younger saves,
+    so each column is filled in one pass from the oldest save up, with a
+    cost proportional to the number of saves plus the height of the cube.
+
+    The rows of the block are split into `n_chunks` chunks, which are
+    filled in parallel by the ``threaded`` variant of the function (see
+    :obj:`~pyDeltaRCM.shared_tools.njit_threaded`).
+    """
+    n_saves, n_rows, W = depth.shape
+    nz = block.shape[0]
+
+    for c in prange(n_chunks):
+        # preserved elevation, and sand fraction of the fill, of each save
+        _preserved = np.empty(n_saves, dtype=np.float64)
+        _value = np.empty(n_saves, dtype=np.float64)
+        for i in range(c * n_rows // n_chunks, (c + 1) * n_rows // n_chunks):
+            for j in range(W):
+                _min = np.inf
+                _next = -1.
+                for s in range(n_saves - 1, -1, -1):
+                    _min = min(_min, depth[s, i, j])
+                    _preserved[s] = _min
+                    if sand_frac[s, i, j] > 0:
+                        _next = sand_frac[s, i, j]
+                    _value[s] = _next
+
+                block[:, i, j] = -1
+                _filled = -1  # highest height index filled
+                for s in range(n_saves):
+                    _top = np.floor((_preserved[s] + max_depth_of_section)
+                                    / vertical_spacing)
+                    _top = min(_top, nz - 1)
+                    for z in range(_filled + 1, int(_top) + 1):
+                        block[nz - 1 - z, i, j] = _value[s]
+                    _filled = max(_filled, int(_top))
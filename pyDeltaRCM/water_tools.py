@@ -1,12 +1,16 @@
 
 import numpy as np
-from numba import njit
+from numba import njit, prange, typed, types, int64, uint8
+from numba.experimental import jitclass
 import abc
 
 from . import shared_tools
 
 # tools for water routing algorithms
 
+# integer codes of the `water_sampling` modes, passed to jitted functions
+_WATER_SAMPLING = {'search': 0, 'cumulative': 1, 'alias': 2}
+
 
 class water_tools(abc.ABC):
 
@@ -19,13 +23,16 @@ class water_tools(abc.ABC):
         self.qwn[:] = 0
 
         self.free_surf_flag[:] = 0
-        self.free_surf_walk_indices[:] = 0
+        self.free_surf_walks.clear()
         self.sfc_visit[:] = 0
         self.sfc_sum[:] = 0
 
-        self.pad_stage = np.pad(self.stage, 1, 'edge')
-        self.pad_depth = np.pad(self.depth, 1, 'edge')
-        self.pad_cell_type = np.pad(self.cell_type, 1, 'edge')
+        # the stage is updated by the free surface, after the weights are
+        #   computed, so it is copied to keep the stage of this iteration
+        self.pad_stage[1:-1, 1:-1] = self.stage
+        shared_tools.fill_halo(self.pad_stage)
+        shared_tools.fill_halo(self.pad_depth)
+        shared_tools.fill_halo(self.pad_cell_type)
 
     def run_water_iteration(self):
         """Run a single iteration of travel paths for all water parcels.
@@ -35,26 +42,127 @@ class water_tools(abc.ABC):
 
         All parcels are processed in parallel, taking one step for each loop
         of the ``while`` loop.
+
+        If :obj:`~pyDeltaRCM.DeltaModel.water_routing` is ``'fused'``, the
+        ``while`` loop is instead executed entirely within the jitted function
+        :obj:`_route_all_water_parcels`, which gives an identical result. If
+        :obj:`~pyDeltaRCM.DeltaModel.water_routing` is ``'parcelwise'``, each
+        parcel is instead routed to completion independently, with its own
+        stream of random numbers, by
+        :obj:`_route_all_water_parcels_parcelwise`.
+
+        If :obj:`~pyDeltaRCM.DeltaModel.water_routing` is ``'compacted'``,
+        the ``while`` loop operates only on the parcels which are still being
+        routed, kept as an ordered array of parcel numbers from which
+        finished parcels are removed after each step. The work of each step
+        is then proportional to the number of parcels still being routed,
+        and the result is identical to that of the ``'stepwise'`` loop.
         """
         _msg = 'Beginning stepping of water parcels'
         self.log_info(_msg, verbosity=2)
 
         _step = 0  # the step number of parcels
-        inlet_weights = np.ones_like(self.inlet)
-        start_indices = shared_tools.get_start_indices(self.inlet,
-                                                       inlet_weights,
-                                                       self._Np_water)
+        start_indices = shared_tools.sample_start_indices(
+            self.inlet, self._inlet_cumulative, self._Np_water)
 
         self.qxn.flat[start_indices] += 1
         self.qwn.flat[start_indices] += self.Qp_water / self._dx / 2
 
-        self.free_surf_walk_indices[:, 0] = start_indices
+        self.free_surf_walks.reset(start_indices)
         current_inds = np.copy(start_indices)
 
         self.looped[:] = 0
 
+        # hash set of cells visited by each parcel, to find loops
+        _n_cells = self.L * self.W
+        _has_repeat = np.zeros(self._Np_water, dtype=np.bool_)
+        _visited, _n_visited = _record_visits(
+            start_indices, np.zeros(0, dtype=np.int64), 0, _has_repeat,
+            _n_cells)
+
         self.get_water_weight_array()
-        water_weights_flat = self.water_weights.reshape(-1, 9)  # flatten for fast access
+        _table = self.water_sampling_table
+        _alias = self.water_sampling_alias
+        _sampling = _WATER_SAMPLING[self._water_sampling]
+
+        if self._water_routing == 'fused':
+            (self.qxn, self.qyn, self.qwn,
+             self.looped, self.free_surf_flag) = _route_all_water_parcels(
+                start_indices, _table, _alias, _sampling, self.cell_type,
+                self.qxn, self.qyn, self.qwn, self.free_surf_walks,
+                self.looped, self.free_surf_flag, self.iwalk_flat,
+                self.jwalk_flat, self.neighbor_indices, self.stepmax,
+                self.L0, self.CTR, self.Qp_water, self._dx)
+            return
+
+        if self._water_routing == 'parcelwise':
+            # each parcel is routed to completion, and may need `stepmax` steps
+            self.check_size_of_indices_matrix(self.stepmax)
+
+            _key = shared_tools.get_random_key()
+            _n_chunks = shared_tools.get_num_chunks(self._threaded)
+            if self._threaded:
+                _route = _route_all_water_parcels_parcelwise.threaded
+            else:
+                _route = _route_all_water_parcels_parcelwise
+            (self.qxn, self.qyn, self.qwn,
+             self.looped, self.free_surf_flag) = \
+                _route(
+                    start_indices, _table, _alias, _sampling,
+                    self.cell_type, self.qxn, self.qyn, self.qwn, self.free_surf_walks,
+                    self.looped, self.free_surf_flag, self.iwalk_flat,
+                    self.jwalk_flat, self.neighbor_indices, self.stepmax,
+                    self.L0, self.CTR, self.Qp_water, self._dx, _key,
+                    _n_chunks)
+            return
+
+        if self._water_routing == 'compacted':
+            # parcel numbers of the parcels still being routed
+            active = np.arange(self._Np_water)
+
+            while (active.shape[0] > 0) & (_step < self.stepmax):
+
+                _step += 1
+
+                self.check_size_of_indices_matrix(_step)
+
+                # use water weights and random pick to determine d8 direction
+                new_direction = _choose_next_direction_from_table(
+                    current_inds, _table, _alias, _sampling)
+
+                new_indices = _get_new_ind(
+                    current_inds,
+                    new_direction,
+                    self.neighbor_indices)
+
+                dist, istep, jstep, astep = shared_tools.get_steps(
+                    new_direction,
+                    self.iwalk_flat,
+                    self.jwalk_flat)
+
+                self.update_Q(dist, current_inds, new_indices,
+                              astep, jstep, istep)
+
+                new_indices, _looped, _free_surf_flag = \
+                    _check_for_visited_loops(
+                        new_indices, _has_repeat[active], _step, self.L0,
+                        self.looped[active], self.eta.shape, self.CTR,
+                        self.free_surf_flag[active])
+                self.looped[active] = _looped
+                self.free_surf_flag[active] = _free_surf_flag
+
+                # Record the parcel pathways, and remove the parcels that
+                #     have stopped or reached the boundary from the routing.
+                new_indices = self.check_for_boundary(new_indices, active)
+                self.free_surf_walks.record_active(active, new_indices)
+                _visited, _n_visited = _record_active_visits(
+                    active, new_indices, _visited, _n_visited, _has_repeat,
+                    _n_cells)
+                _routing = ((new_indices != 0) &
+                            (self.free_surf_flag[active] <= 0))
+                active = active[_routing]
+                current_inds = new_indices[_routing]
+            return
 
         while (sum(current_inds) > 0) & (_step < self.stepmax):
 
@@ -63,15 +171,13 @@ class water_tools(abc.ABC):
             self.check_size_of_indices_matrix(_step)
 
             # use water weights and random pick to determine d8 direction
-            new_direction = _choose_next_direction(current_inds, water_weights_flat)
-            new_direction = new_direction.astype(np.int)
+            new_direction = _choose_next_direction_from_table(
+                current_inds, _table, _alias, _sampling)
 
-            new_indices = _calculate_new_ind(
+            new_indices = _get_new_ind(
                 current_inds,
                 new_direction,
-                self.iwalk_flat,
-                self.jwalk_flat,
-                self.eta.shape)
+                self.neighbor_indices)
 
             dist, istep, jstep, astep = shared_tools.get_steps(
                 new_direction,
@@ -80,35 +186,44 @@ class water_tools(abc.ABC):
 
             self.update_Q(dist, current_inds, new_indices, astep, jstep, istep)
 
-            current_inds, self.looped, self.free_surf_flag = _check_for_loops(
-                self.free_surf_walk_indices, new_indices, _step, self.L0, self.looped,
-                self.eta.shape, self.CTR, self.free_surf_flag)
+            current_inds, self.looped, self.free_surf_flag = \
+                _check_for_visited_loops(
+                    new_indices, _has_repeat, _step, self.L0, self.looped,
+                    self.eta.shape, self.CTR, self.free_surf_flag)
 
             # Record the parcel pathways for computing the free surface
             #     Parcels that have reached the boundary are updated to
             #     ``ind==0``, effectively ending the routing of these parcels.
             current_inds = self.check_for_boundary(current_inds)  # changes `free_surf_flag`
-            self.free_surf_walk_indices[:, _step] = current_inds  # record indices
+            self.free_surf_walks.record_all(current_inds)  # record indices
+            _visited, _n_visited = _record_visits(
+                current_inds, _visited, _n_visited, _has_repeat, _n_cells)
             current_inds[self.free_surf_flag > 0] = 0
 
     def compute_free_surface(self):
         """Calculate free surface after routing all water parcels.
 
-        This method uses the `free_surf_walk_indices` matrix accumulated
+        This method uses the parcel pathways in `free_surf_walks`, accumulated
         during the routing of the water parcels (in
         :obj:`run_water_iteration`) to determine the free surface. The
         operations of the free surface computation are placed in a jitted
-        function :obj:`accumulate_free_surface_walks`. Following this
-        computation, the free surface is smoothed by steps in
-        :obj:`finalize_free_surface`.
+        function :obj:`_accumulate_free_surface_walks`, which is split over
+        multiple threads if :obj:`~pyDeltaRCM.DeltaModel.threaded` is
+        `True`. Following this computation, the free surface is smoothed by
+        steps in :obj:`finalize_free_surface`.
         """
         _msg = 'Computing free surface from water parcels'
         self.log_info(_msg, verbosity=2)
 
-        self.sfc_visit, self.sfc_sum = _accumulate_free_surface_walks(
-            self.free_surf_walk_indices, self.looped, self.cell_type,
+        if self._threaded:
+            _accumulate = _accumulate_free_surface_walks.threaded
+        else:
+            _accumulate = _accumulate_free_surface_walks
+        self.sfc_visit, self.sfc_sum = _accumulate(
+            self.free_surf_walks, self.looped, self.cell_type,
             self.uw, self.ux, self.uy, self.depth,
-            self._dx, self._u0, self.h0, self._H_SL, self._S0)
+            self._dx, self._u0, self.h0, self._H_SL, self._S0,
+            shared_tools.get_num_chunks(self._threaded))
 
         self.finalize_free_surface()
 
@@ -127,49 +242,63 @@ class water_tools(abc.ABC):
         self.update_velocity_field()
 
     def check_size_of_indices_matrix(self, it):
-        """Check if step path matrix needs to be made larger.
+        """Check if the parcel pathway record needs to be made larger.
 
-        Initial size of self.free_surf_walk_indices is half of self.stepmax
+        Initial size of self.free_surf_walks is half of self.stepmax
         because the number of iterations doesn't go beyond
         that for many timesteps.
 
-        Once it reaches it > self.stepmax/2 once, make the size
-        self.iter for all further timesteps
+        Once it reaches it > self.stepmax/2 once, chunks of self.stepmax/4
+        steps are added to the record for all further timesteps. The
+        recorded steps are not copied when the record is made larger (see
+        :obj:`ParcelWalks`).
         """
-        if it >= self.free_surf_walk_indices.shape[1]:
-            _msg = 'Increasing size of self.free_surf_walk_indices'
+        if it > self.free_surf_walks.capacity():
+            _msg = 'Increasing size of self.free_surf_walks'
             self.log_info(_msg, verbosity=2)
-            
-            indices_blank = np.zeros(
-                (np.int(self._Np_water), np.int(self.stepmax / 4)), dtype=np.int)
 
-            self.free_surf_walk_indices = np.hstack((self.free_surf_walk_indices, indices_blank))
+            self.free_surf_walks.reserve(it)
 
     def get_water_weight_array(self):
         """Get step direction weights for each cell.
 
         This method is called once, before parcels are stepped, because the
         weights do not change during the stepping of parcels.
+
+        The weights of all cells are computed by the jitted function
+        :obj:`_get_water_weight_array`, which is split over multiple threads
+        if :obj:`~pyDeltaRCM.DeltaModel.threaded` is `True`.
+
+        The tables that step directions are sampled from are then set as
+        :obj:`water_sampling_table` and :obj:`water_sampling_alias`,
+        according to :obj:`~pyDeltaRCM.DeltaModel.water_sampling`.
         """
         _msg = 'Computing water weight array'
         self.log_info(_msg, verbosity=2)
-        self.water_weights = np.zeros(shape=(self.L, self.W, 9))
-
-        for i in range(self.L):
-            for j in range(self.W):
-                stage_nbrs = self.pad_stage[i - 1 + 1:i + 2 + 1, j - 1 + 1:j + 2 + 1]
-                depth_nbrs = self.pad_depth[i - 1 + 1:i + 2 + 1, j - 1 + 1:j + 2 + 1]
-                ct_nbrs = self.pad_cell_type[i - 1 + 1:i + 2 + 1, j - 1 + 1:j + 2 + 1]
-
-                weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
-                    self.stage[i, j], stage_nbrs.ravel(),
-                    self.qx[i, j], self.qy[i, j], self.ivec_flat, self.jvec_flat,
-                    self.distances_flat)
 
-                self.water_weights[i, j] = shared_tools.get_weight_at_cell(
-                    (i, j), weight_sfc, weight_int,
-                    depth_nbrs.ravel(), ct_nbrs.ravel(),
-                    self.dry_depth, self.gamma, self._theta_water)
+        if self._threaded:
+            _get_weights = _get_water_weight_array.threaded
+        else:
+            _get_weights = _get_water_weight_array
+        self.water_weights = _get_weights(
+            self.stage, self.pad_stage, self.pad_depth, self.pad_cell_type,
+            self.qx, self.qy, self.ivec_flat, self.jvec_flat,
+            self.distances_flat, self.dry_depth, self.gamma,
+            self._theta_water, shared_tools.get_num_chunks(self._threaded))
+
+        # tables to sample the step directions from, see `water_sampling`
+        _weights_flat = self.water_weights.reshape(-1, 9)
+        if self._water_sampling == 'cumulative':
+            self.water_sampling_table = shared_tools.get_cumulative_table(
+                _weights_flat)
+            self.water_sampling_alias = np.zeros((0, 9), dtype=np.int64)
+        elif self._water_sampling == 'alias':
+            (self.water_sampling_table,
+             self.water_sampling_alias) = shared_tools.get_alias_table(
+                _weights_flat)
+        else:
+            self.water_sampling_table = _weights_flat
+            self.water_sampling_alias = np.zeros((0, 9), dtype=np.int64)
 
     def update_Q(self, dist, current_inds, next_index, astep, jstep, istep):
         """Update discharge field values after one set of water parcel steps."""
@@ -195,7 +324,7 @@ class water_tools(abc.ABC):
             self.qwn.flat[:], dist, next_index,
             astep, self.Qp_water, self._dx).reshape(self.qwn.shape)
 
-    def check_for_boundary(self, inds):
+    def check_for_boundary(self, inds, active=None):
         """Check whether parcels have reached the boundary.
 
         Checks whether any parcels have reached the model boundaries. If they
@@ -206,17 +335,26 @@ class water_tools(abc.ABC):
         ----------
         inds : :obj:`ndarray`
             Unraveled indicies of parcels.
+
+        active : :obj:`ndarray`, optional
+            Parcel numbers of the parcels in `inds`. If not given, `inds`
+            contains all parcels.
         """
         _msg = 'Checking stepped parcels against boundary location'
         self.log_info(_msg, verbosity=2)
 
+        if active is None:
+            active = slice(None)
+        free_surf_flag = self.free_surf_flag[active]
+
         # where cell type is "edge" and free_surf_flag is currently valid (value: 0)
-        self.free_surf_flag[(self.cell_type.flat[inds] == -1) & (self.free_surf_flag == 0)] = 1
+        free_surf_flag[(self.cell_type.flat[inds] == -1) & (free_surf_flag == 0)] = 1
 
         # where cell type is "edge" and free_surf_flag is currently looped (value: -1)
-        self.free_surf_flag[(self.cell_type.flat[inds] == -1) & (self.free_surf_flag == -1)] = 2
+        free_surf_flag[(self.cell_type.flat[inds] == -1) & (free_surf_flag == -1)] = 2
 
-        inds[self.free_surf_flag == 2] = 0
+        self.free_surf_flag[active] = free_surf_flag
+        inds[free_surf_flag == 2] = 0
         return inds
 
     def finalize_free_surface(self):
@@ -246,8 +384,8 @@ class water_tools(abc.ABC):
             self._Nsmooth, self._Csmooth)
 
         if self._time_iter > 0:
-            self.stage = ((1 - self._omega_sfc) * self.stage +
-                          self._omega_sfc * Hsmth)
+            self.stage[:] = ((1 - self._omega_sfc) * self.stage +
+                             self._omega_sfc * Hsmth)
 
         self.flooding_correction()
 
@@ -274,14 +412,14 @@ class water_tools(abc.ABC):
             if iteration == 0:
                 omega = self._omega_flow
 
-            self.qx = self.qxn * omega + self.qx * (1 - omega)
-            self.qy = self.qyn * omega + self.qy * (1 - omega)
+            self.qx[:] = self.qxn * omega + self.qx * (1 - omega)
+            self.qy[:] = self.qyn * omega + self.qy * (1 - omega)
 
         else:
-            self.qx = self.qxn.copy()
-            self.qy = self.qyn.copy()
+            self.qx[:] = self.qxn
+            self.qy[:] = self.qyn
 
-        self.qw = (self.qx**2 + self.qy**2)**(0.5)
+        self.qw[:] = (self.qx**2 + self.qy**2)**(0.5)
 
         self.qx[0, self.inlet] = self.qw0
         self.qy[0, self.inlet] = 0
@@ -392,111 +530,736 @@ class water_tools(abc.ABC):
         return wgt_array
 
 
-@njit('int64[:](int64[:], float64[:,:])')
-def _choose_next_direction(inds, water_weights):
-    """Get new cell locations, based on water weights.
+w_spec = [('domain_shape', types.UniTuple(int64, 2)),
+          ('chunk_size', int64), ('start', int64[:]), ('last', int64[:]),
+          ('length', int64[:]), ('chunks', types.ListType(uint8[:, :]))]
 
-    Algorithm is to:
-        1. loop through each parcel, which is described by a pair in the
-           `inds` array.
-        2. determine the water weights for that location (from `water_weights`)
-        3. choose a new cell based on the probabilities of the weights (using
-           the `random_pick` function)
+
+@jitclass(w_spec)
+class ParcelWalks(object):
+    """Jitted class to record the pathways of water parcels.
+
+    The pathway of each parcel is recorded as the index of the cell it
+    starts in, followed by one `uint8` code for the D8 direction of each
+    step. The code is the index into the flattened 3x3 neighborhood of a
+    cell, i.e., the same as :obj:`~pyDeltaRCM.DeltaModel.iwalk_flat` and
+    :obj:`~pyDeltaRCM.DeltaModel.jwalk_flat` are indexed with. This uses an
+    eighth of the memory of recording the `int64` index of every cell
+    visited.
+
+    The codes are stored in chunks of `chunk_size` steps for all parcels.
+    When more steps are needed, new chunks are appended, so that the steps
+    already recorded are never copied.
+
+    A parcel which is moved other than to a neighboring cell (i.e., a looped
+    parcel relocated by :obj:`_relocate_looped_parcel`) cannot be recorded
+    by a D8 direction, and the pathway of the parcel is not recorded past
+    the last D8 step. Such parcels are always looped, and so do not
+    contribute to the free surface in
+    :obj:`_accumulate_free_surface_walks`.
+
+    Initialized in :obj:`~pyDeltaRCM.init_tools.init_tools.create_domain`.
+    """
+    def __init__(self, n_parcels, domain_shape, size, chunk_size):
+
+        self.domain_shape = domain_shape
+        self.chunk_size = max(1, chunk_size)
+
+        self.start = np.zeros(n_parcels, dtype=np.int64)
+        self.last = np.zeros(n_parcels, dtype=np.int64)
+        self.length = np.zeros(n_parcels, dtype=np.int64)
+
+        self.chunks = typed.List.empty_list(uint8[:, :])
+        self.reserve(size)
+
+    def capacity(self):
+        """Number of steps that can be recorded for each parcel."""
+        return len(self.chunks) * self.chunk_size
+
+    def reserve(self, n_steps):
+        """Append chunks until `n_steps` steps can be recorded."""
+        while self.capacity() < n_steps:
+            self.chunks.append(np.zeros((self.start.shape[0],
+                                         self.chunk_size), dtype=np.uint8))
+
+    def clear(self):
+        """Clear the pathways of all parcels."""
+        self.start[:] = 0
+        self.last[:] = 0
+        self.length[:] = 0
+
+    def reset(self, start_indices):
+        """Start the pathways of all parcels from `start_indices`."""
+        self.start[:] = start_indices
+        self.last[:] = start_indices
+        self.length[:] = 0
+
+    def record(self, p, ind):
+        """Record the step of parcel `p` to the cell with index `ind`.
+
+        Indices of ``0`` are not recorded (the parcel has stopped). If `ind`
+        is not a neighbor of the last cell recorded for the parcel, the
+        pathway of the parcel is ended.
+        """
+        if (ind <= 0) or (self.last[p] < 0):
+            return
+
+        x, y = shared_tools.custom_unravel(ind, self.domain_shape)
+        lx, ly = shared_tools.custom_unravel(self.last[p], self.domain_shape)
+        dx = x - lx
+        dy = y - ly
+        if (abs(dx) > 1) or (abs(dy) > 1):
+            self.last[p] = -1
+            return
+
+        step = self.length[p]
+        self.chunks[step // self.chunk_size][p, step % self.chunk_size] = \
+            (dx + 1) * 3 + (dy + 1)
+        self.length[p] = step + 1
+        self.last[p] = ind
+
+    def record_all(self, inds):
+        """Record the steps of all parcels, see :obj:`record`."""
+        for p in range(inds.shape[0]):
+            self.record(p, inds[p])
+
+    def record_active(self, active, inds):
+        """Record the steps of the parcels numbered in `active`."""
+        for k in range(active.shape[0]):
+            self.record(active[k], inds[k])
+
+    def max_length(self):
+        """Largest number of steps recorded for any parcel."""
+        return np.max(self.length)
+
+    def decode(self, p, xs, ys):
+        """Decode the pathway of parcel `p` into cell coordinates.
+
+        The x and y coordinates of the cells visited by the parcel are
+        written into `xs` and `ys`, which must have a length of at least
+        ``max_length() + 1``.
+
+        Returns
+        -------
+        n : :obj:`int`
+            Number of cells visited by the parcel, including the start.
+        """
+        x, y = shared_tools.custom_unravel(self.start[p], self.domain_shape)
+        xs[0] = x
+        ys[0] = y
+        for step in range(self.length[p]):
+            code = self.chunks[step // self.chunk_size][
+                p, step % self.chunk_size]
+            x += code // 3 - 1
+            y += code % 3 - 1
+            xs[step + 1] = x
+            ys[step + 1] = y
+        return self.length[p] + 1
+
+    def get_indices(self, p):
+        """Get the unraveled indices of the cells visited by parcel `p`."""
+        xs = np.zeros(self.length[p] + 1, dtype=np.int64)
+        ys = np.zeros(self.length[p] + 1, dtype=np.int64)
+        self.decode(p, xs, ys)
+        return xs * self.domain_shape[1] + ys
+
+
+@shared_tools.njit_threaded
+def _get_water_weight_array(stage, pad_stage, pad_depth, pad_cell_type,
+                            qx, qy, ivec, jvec, distances,
+                            dry_depth, gamma, theta, n_chunks):
+    """Get step direction weights for every cell of the domain.
+
+    Computes the weights of each cell with
+    :obj:`~pyDeltaRCM.shared_tools.fill_weight_at_cell`, writing directly
+    into the ``(L, W, 9)`` output array. The weights are identical to
+    :obj:`~pyDeltaRCM.shared_tools.get_weight_sfc_int` followed by
+    :obj:`~pyDeltaRCM.shared_tools.get_weight_at_cell` for each cell, but no
+    temporary arrays are created for individual cells.
+
+    The rows of the domain are split into `n_chunks` chunks, which are
+    computed in parallel by the ``threaded`` variant of the function (see
+    :obj:`~pyDeltaRCM.shared_tools.njit_threaded`).
 
     Parameters
     ----------
-    inds : :obj:`ndarray`
-        Current unraveled indices of the parcels. ``(N,)``  `ndarray`
-        containing the unraveled indices.
+    stage : :obj:`ndarray`
+        The stage field.
+
+    pad_stage, pad_depth, pad_cell_type : :obj:`ndarray`
+        The stage, depth, and cell type fields, padded with one cell along
+        each edge.
+
+    qx, qy : :obj:`ndarray`
+        The discharge component fields.
+
+    ivec, jvec, distances : :obj:`ndarray`
+        Flattened unit vectors and distances to the 9 neighbors of a cell.
 
+    n_chunks : :obj:`int`
+        Number of chunks to split the rows of the domain into.
+
+    Returns
+    -------
     water_weights : :obj:`ndarray`
-        Weights of every water cell. ``(LxW, 9)`` `ndarray`, uses unraveled
-        indicies along 0th dimension; 9 cells represent self and 8 neighboring
-        cells.
+        Weights of every water cell. ``(L, W, 9)`` `ndarray`.
+    """
+    L, W = stage.shape
+    theta = float(theta)
+    water_weights = np.zeros((L, W, 9))
+
+    for c in prange(n_chunks):
+        for i in range(c * L // n_chunks, (c + 1) * L // n_chunks):
+            for j in range(W):
+                shared_tools.fill_weight_at_cell(
+                    water_weights[i, j], i, j, stage, pad_stage, pad_depth,
+                    pad_cell_type, qx, qy, ivec, jvec, distances, dry_depth,
+                    gamma, theta)
+
+    return water_weights
+
+
+@njit
+def _pick_direction(table, alias, ind, u, sampling):
+    """Pick the step direction from a cell, with a given uniform number.
+
+    Parameters
+    ----------
+    table, alias : :obj:`ndarray`
+        Sampling tables of every cell, see
+        :obj:`~pyDeltaRCM.water_tools.water_tools.get_water_weight_array`.
+
+    ind : :obj:`int`
+        Unraveled index of the cell.
+
+    u : :obj:`float`
+        Uniform random number in the interval [0, 1).
+
+    sampling : :obj:`int`
+        Sampling mode; ``0`` to search the weights of the cell, ``1`` to
+        search the cumulative weights, and ``2`` to use the alias table.
+    """
+    if sampling == 1:
+        return shared_tools.pick_from_cumulative(table[ind], u)
+    elif sampling == 2:
+        return shared_tools.pick_from_alias(table[ind], alias[ind], u)
+    else:
+        return shared_tools.random_pick_with_uniform(table[ind], u)
+
+
+@njit
+def _choose_next_direction_from_table(inds, table, alias, sampling):
+    """Get new cell locations, based on sampling tables.
+
+    Loops through the parcels in order, and picks the D8 direction of the
+    next step of each parcel from the sampling tables of its cell, with
+    :obj:`_pick_direction`. One random number is drawn for each parcel that
+    is still being routed. Parcels at index ``0`` are no longer routed, and
+    are given the direction ``4``, i.e., no step.
+
+    Parameters
+    ----------
+    inds : :obj:`ndarray`
+        Current unraveled indices of the parcels. ``(N,)`` `ndarray`.
+
+    table, alias : :obj:`ndarray`
+        Sampling tables of every cell, see
+        :obj:`~pyDeltaRCM.water_tools.water_tools.get_water_weight_array`.
+
+    sampling : :obj:`int`
+        Sampling mode, see :obj:`_pick_direction`.
 
     Returns
     -------
     new_cells : :obj:`ndarray`
-        The new cell for water parcels, relative to the current location.
-        I.e., this is the D8 direction the parcel is going to travel in the
-        next stage, :obj:`pyDeltaRCM.shared_tools._calculate_new_ind`.
+        The D8 direction each parcel travels in the next step, i.e., the
+        index of the neighbor cell in the 9 cells around the current cell.
     """
-    new_cells = []
-    for i in np.arange(inds.shape[0]):
+    new_cells = np.full(inds.shape[0], 4, dtype=np.int64)
+    for i in range(inds.shape[0]):
         ind = inds[i]
         if ind != 0:
-            weight = water_weights[ind, :]
-            new_cells.append(shared_tools.random_pick(weight))
-        else:
-            new_cells.append(4)
-
-    new_cells = np.array(new_cells)
+            new_cells[i] = _pick_direction(
+                table, alias, ind, shared_tools.get_random_uniform(1),
+                sampling)
     return new_cells
 
 
 @njit
-def _calculate_new_ind(indices, new_cells, iwalk, jwalk, domain_shape):
-    """Calculate the new location (indices) of parcels.
+def _get_new_ind(indices, new_cells, neighbor_indices):
+    """Get the new location (indices) of parcels from the neighbor table.
+
+    The new index of each parcel is looked up in the table of the unraveled
+    indices of the neighbors of every cell (see
+    :obj:`~pyDeltaRCM.shared_tools.get_neighbor_indices`), with the D8
+    direction of the parcel (`new_cells`). Parcels with the direction ``4``
+    did not step, and are given the index ``0``, ending their routing.
+    """
+    new_indices = np.zeros(indices.shape[0], dtype=np.int64)
+    for p in range(indices.shape[0]):
+        if new_cells[p] != 4:
+            new_indices[p] = neighbor_indices[indices[p], new_cells[p]]
+    return new_indices
+
+
+@njit
+def _check_for_visited_loops(new_indices, has_repeat, _step, L0, looped,
+                             domain_shape, CTR, free_surf_flag):
+    """Check for loops in water parcel pathways, from the visited cells.
 
-    Use the information of the current parcel (`indices`) in conjunction with
-    the D8 direction the parcel needs to travel (`new_cells`) to determine the
-    new indices of each parcel.
+    Look for looping random walks, i.e., where a parcel returns to somewhere
+    it has already been. Once the `_step` number is larger than the inlet
+    length `L0`, each parcel which is still routed (new index larger than
+    ``0``) and has a repeated cell in its recorded walk is counted in
+    `looped`, relocated by :obj:`_relocate_looped_parcel`, and marked with
+    ``-1`` in `free_surf_flag`.
+
+    Rather than searching the walk of each parcel for a repeated index, the
+    check uses the `has_repeat` flag maintained by :obj:`_record_visits`
+    while the walks are recorded. The check is therefore made in constant
+    time per parcel, independent of the length of the walk.
     """
-    newbies = []
-    for p, q in zip(indices, new_cells):
-        if q != 4:
-            ind_tuple = shared_tools.custom_unravel(p, domain_shape)
-            new_ind = (ind_tuple[0] + jwalk[q],
-                       ind_tuple[1] + iwalk[q])
-            newbies.append(shared_tools.custom_ravel(new_ind, domain_shape))
-        else:
-            newbies.append(0)
+    if (_step > L0):
+        for p in range(new_indices.shape[0]):
+            if (new_indices[p] > 0) and has_repeat[p]:
+                # handle when a loop is detected
+                looped[p] += 1
+                new_indices[p] = _relocate_looped_parcel(
+                    new_indices[p], L0, domain_shape, CTR)
+                free_surf_flag[p] = -1
+    return new_indices, looped, free_surf_flag
 
-    return np.array(newbies)
+
+@njit
+def _record_visits(inds, visited, n_visited, has_repeat, n_cells):
+    """Record the cells visited by the water parcels in a step.
+
+    The cells visited by all parcels are kept in a hash set, `visited`, with
+    the key ``p * n_cells + ind`` for parcel ``p`` at index ``ind``. Indices
+    of ``0`` mark parcels that are no longer routed, and are not recorded.
+    Parcels which visit a cell they have visited before are flagged in
+    `has_repeat`. The flag is never cleared, so the cells of a flagged
+    parcel are not recorded any further.
+
+    The set uses open addressing with linear probing, with ``-1`` marking
+    empty slots. Whenever the set would become more than three quarters
+    full, it is rebuilt by :obj:`_rebuild_visits`, which drops the keys of
+    the parcels that are no longer routed or are flagged, and sizes the set
+    to at least twice the number of keys. `visited` can therefore be
+    initialized as an empty array.
+
+    Returns
+    -------
+    visited, n_visited
+        The (possibly rebuilt) hash set, and the number of keys in it.
+    """
+    return _record_active_visits(np.arange(inds.shape[0]), inds, visited,
+                                 n_visited, has_repeat, n_cells)
 
 
 @njit
-def _check_for_loops(free_surf_walk_indices, new_indices, _step,
-                    L0, looped, domain_shape, CTR, free_surf_flag):
-    """Check for loops in water parcel pathways.
+def _record_active_visits(active, inds, visited, n_visited, has_repeat,
+                          n_cells):
+    """Record the cells visited by some of the water parcels in a step.
 
-    Look for looping random walks, i.e., where a parcel returns to somewhere
-    it has already been.
+    Same as :obj:`_record_visits`, but `inds` are the indices of only the
+    parcels numbered in `active`.
+    """
+    if 4 * (n_visited + inds.shape[0]) > 3 * visited.shape[0]:
+        visited, n_visited = _rebuild_visits(
+            active, inds, visited, has_repeat, n_cells)
+
+    for k in range(inds.shape[0]):
+        p = active[k]
+        if (inds[k] > 0) and not has_repeat[p]:
+            if _insert_visit(visited, p * n_cells + inds[k]):
+                n_visited += 1
+            else:
+                has_repeat[p] = True
+    return visited, n_visited
+
+
+@njit
+def _rebuild_visits(active, inds, visited, has_repeat, n_cells):
+    """Rebuild the hash set of visited cells, before recording a step.
+
+    Only the keys of the parcels that are still being routed, i.e., the
+    parcels numbered in `active` with a new index (`inds`) larger than
+    ``0``, and that are not flagged in `has_repeat`, are kept. The keys of
+    the other parcels are never looked up again. The new set is the smallest
+    power of two that holds at least twice the number of kept keys and the
+    keys of the step.
+
+    Returns
+    -------
+    visited, n_visited
+        The rebuilt hash set, and the number of keys in it.
+    """
+    live = np.zeros(has_repeat.shape[0], dtype=np.bool_)
+    for k in range(inds.shape[0]):
+        live[active[k]] = (inds[k] > 0) and not has_repeat[active[k]]
+
+    n_visited = 0
+    for key in visited:
+        if (key >= 0) and live[key // n_cells]:
+            n_visited += 1
+
+    size = 1
+    while size < 2 * (n_visited + inds.shape[0]):
+        size *= 2
+    _rebuilt = np.full(size, -1, dtype=np.int64)
+    for key in visited:
+        if (key >= 0) and live[key // n_cells]:
+            _insert_visit(_rebuilt, key)
+    return _rebuilt, n_visited
+
+
+@njit
+def _insert_visit(visited, key):
+    """Insert a key into the hash set of visited cells.
+
+    Returns `False` if the key was already in the set.
+    """
+    mask = np.uint64(visited.shape[0] - 1)
+    slot = shared_tools._splitmix64(np.uint64(key)) & mask
+    while visited[slot] != -1:
+        if visited[slot] == key:
+            return False
+        slot = (slot + np.uint64(1)) & mask
+    visited[slot] = key
+    return True
+
+
+@njit
+def _relocate_looped_parcel(new_ind, L0, domain_shape, CTR):
+    """Move a looped parcel away from the inlet.
+
+    The parcel is moved five cells further along the direction from the
+    inlet to the parcel location, but not into the inlet or onto the domain
+    edges.
     """
-    nparcels = free_surf_walk_indices.shape[0]
     domain_min_x = domain_shape[0] - 2
     domain_min_y = domain_shape[1] - 2
 
-    # if the _step number is larger than the inlet length
-    if (_step > L0):
-        # loop though every parcel walk
-        for p in np.arange(nparcels):
-            new_ind = new_indices[p]  # the new index of the parcel
-            walk = free_surf_walk_indices[p, :]  # the parcel's walk
-            _walk = walk[walk > 0]
-            if (new_ind > 0):
-                has_repeat_ind = len(_walk) != len(set(_walk))
-                if has_repeat_ind:
-                    # handle when a loop is detected
+    px, py = shared_tools.custom_unravel(new_ind, domain_shape)
+
+    Fx = px - 1
+    Fy = py - CTR
+    Fw = np.sqrt(Fx**2 + Fy**2)
+    if Fw != 0:
+        px = px + int(np.round(Fx / Fw * 5.))
+        py = py + int(np.round(Fy / Fw * 5.))
+
+    # limit the new px and py to beyond the inlet, and
+    #     away from domain edges
+    px = np.minimum(domain_min_x, np.maximum(px, L0))
+    py = np.minimum(domain_min_y, np.maximum(1, py))
+
+    return shared_tools.custom_ravel((px, py), domain_shape)
+
+
+@njit
+def _route_all_water_parcels(start_indices, sampling_table, sampling_alias,
+                             sampling, cell_type, qxn, qyn, qwn, free_surf_walks,
+                             looped, free_surf_flag, iwalk, jwalk,
+                             neighbor_indices, stepmax, L0, CTR, Qp_water,
+                             dx):
+    """Route all water parcels to completion.
+
+    This function carries out the same operations as the ``while`` loop of
+    :obj:`~pyDeltaRCM.water_tools.water_tools.run_water_iteration`, but with
+    all steps of all parcels executed within a single jitted call. Parcels
+    are stepped together, in the same order as the loop, so that the random
+    numbers are drawn in the same sequence and the results are identical for
+    a given random seed.
+
+    The discharge fields are accumulated with scalar loops over the parcels,
+    rather than with the temporary arrays used by the methods of the loop,
+    but the accumulation order is preserved: at each step, all contributions
+    at the current cells are added before the contributions at the new
+    cells.
+
+    Parameters
+    ----------
+    start_indices : :obj:`ndarray`
+        Unraveled indices of the parcels at the inlet.
+
+    sampling_table, sampling_alias : :obj:`ndarray`
+        Tables to sample the step direction from at every cell, ``(LxW, 9)``
+        `ndarray`, see :obj:`_pick_direction`.
+
+    sampling : :obj:`int`
+        Sampling mode, see :obj:`_pick_direction`.
+
+    cell_type : :obj:`ndarray`
+        The cell type field.
+
+    qxn, qyn, qwn : :obj:`ndarray`
+        Discharge fields to accumulate parcel steps into. Modified in place.
+
+    free_surf_walks : :obj:`ParcelWalks`
+        Record of the parcel pathways, started from `start_indices`.
+        Modified in place, and made larger whenever more steps are needed.
+
+    looped, free_surf_flag : :obj:`ndarray`
+        Parcel status arrays. Modified in place.
+
+    iwalk, jwalk : :obj:`ndarray`
+        Flattened steps to the 9 neighbors of a cell.
+
+    neighbor_indices : :obj:`ndarray`
+        Unraveled indices of the neighbors of every cell, see
+        :obj:`~pyDeltaRCM.shared_tools.get_neighbor_indices`.
+
+    Returns
+    -------
+    qxn, qyn, qwn, looped, free_surf_flag
+        The updated discharge fields and parcel status arrays.
+    """
+    domain_shape = cell_type.shape
+    qxn_flat = qxn.reshape(-1)
+    qyn_flat = qyn.reshape(-1)
+    qwn_flat = qwn.reshape(-1)
+    Qw_step = Qp_water / dx / 2
+
+    nparcels = start_indices.shape[0]
+    current_inds = start_indices.copy()
+    new_cells = np.zeros(nparcels, dtype=np.int64)
+    new_indices = np.zeros(nparcels, dtype=np.int64)
+
+    n_cells = domain_shape[0] * domain_shape[1]
+    has_repeat = np.zeros(nparcels, dtype=np.bool_)
+    visited, n_visited = _record_visits(
+        start_indices, np.zeros(0, dtype=np.int64), 0, has_repeat, n_cells)
+
+    _step = 0
+    while (np.sum(current_inds) > 0) and (_step < stepmax):
+
+        _step += 1
+
+        # expand the pathway record if needed
+        free_surf_walks.reserve(_step)
+
+        # choose the d8 direction and the new location of each parcel
+        for p in range(nparcels):
+            ind = current_inds[p]
+            if ind != 0:
+                new_cells[p] = _pick_direction(
+                    sampling_table, sampling_alias, ind,
+                    shared_tools.get_random_uniform(1), sampling)
+            else:
+                new_cells[p] = 4
+
+            if new_cells[p] != 4:
+                new_indices[p] = neighbor_indices[ind, new_cells[p]]
+            else:
+                new_indices[p] = 0
+
+        # update the discharge fields, first at the current cells
+        for p in range(nparcels):
+            if new_cells[p] != 4:
+                istep = iwalk[new_cells[p]]
+                jstep = jwalk[new_cells[p]]
+                dist = np.sqrt(istep * istep + jstep * jstep)
+                qxn_flat[current_inds[p]] += jstep / dist
+                qyn_flat[current_inds[p]] += istep / dist
+                qwn_flat[current_inds[p]] += Qw_step
+
+        # and then at the new cells
+        for p in range(nparcels):
+            if new_cells[p] != 4:
+                istep = iwalk[new_cells[p]]
+                jstep = jwalk[new_cells[p]]
+                dist = np.sqrt(istep * istep + jstep * jstep)
+                qxn_flat[new_indices[p]] += jstep / dist
+                qyn_flat[new_indices[p]] += istep / dist
+                qwn_flat[new_indices[p]] += Qw_step
+
+        new_indices, looped, free_surf_flag = _check_for_visited_loops(
+            new_indices, has_repeat, _step, L0, looped,
+            domain_shape, CTR, free_surf_flag)
+
+        # check for the boundary and record the parcel pathways
+        for p in range(nparcels):
+            if cell_type[new_indices[p] // domain_shape[1],
+                         new_indices[p] % domain_shape[1]] == -1:
+                if free_surf_flag[p] == 0:
+                    free_surf_flag[p] = 1
+                elif free_surf_flag[p] == -1:
+                    free_surf_flag[p] = 2
+            if free_surf_flag[p] == 2:
+                new_indices[p] = 0
+
+            free_surf_walks.record(p, new_indices[p])
+
+        visited, n_visited = _record_visits(
+            new_indices, visited, n_visited, has_repeat, n_cells)
+
+        for p in range(nparcels):
+            if free_surf_flag[p] > 0:
+                current_inds[p] = 0
+            else:
+                current_inds[p] = new_indices[p]
+
+    return qxn, qyn, qwn, looped, free_surf_flag
+
+
+@shared_tools.njit_threaded
+def _route_all_water_parcels_parcelwise(start_indices, sampling_table,
+                                        sampling_alias, sampling, cell_type, qxn, qyn, qwn,
+                                        free_surf_walks, looped,
+                                        free_surf_flag, iwalk, jwalk,
+                                        neighbor_indices, stepmax, L0, CTR,
+                                        Qp_water, dx, key, n_chunks):
+    """Route all water parcels to completion, one parcel at a time.
+
+    Water parcels do not interact during an iteration, because the water
+    weights are fixed. Each parcel is therefore routed to completion on its
+    own, drawing random numbers from a counter-based generator
+    (:obj:`~pyDeltaRCM.shared_tools.get_counter_uniform`) with the parcel
+    number as the stream and the step number as the counter. The parcels are
+    split into `n_chunks` chunks, which are routed in parallel by the
+    ``threaded`` variant of the function (see
+    :obj:`~pyDeltaRCM.shared_tools.njit_threaded`).
+
+    Each chunk accumulates the parcel steps into its own integer counts of
+    straight and diagonal steps, which are summed into the discharge fields
+    at the end. Because the counts are summed exactly, and the random
+    numbers do not depend on the order parcels are routed in, the result is
+    identical for any number of chunks or threads. The result is *not* the
+    same as that of the `stepwise` routing, which draws random numbers from a
+    single sequence.
+
+    Loops are detected by stamping the cells visited by the parcel in a
+    per-chunk grid, such that the check is made in constant time per step,
+    with the same outcome as :obj:`_check_for_visited_loops`.
+
+    Parameters
+    ----------
+    key : :obj:`int`
+        Key for the counter-based random number generator, see
+        :obj:`~pyDeltaRCM.shared_tools.get_random_key`.
+
+    n_chunks : :obj:`int`
+        Number of chunks to split the parcels into.
+
+    Returns
+    -------
+    qxn, qyn, qwn, looped, free_surf_flag
+        The updated discharge fields and parcel status arrays.
+
+    Notes
+    -----
+    The other parameters are the same as :obj:`_route_all_water_parcels`,
+    but `free_surf_walks` must have capacity for at least `stepmax` steps
+    (see :obj:`ParcelWalks.reserve`), because the record cannot be made
+    larger while parcels are routed in parallel.
+    """
+    domain_shape = cell_type.shape
+    ncells = domain_shape[0] * domain_shape[1]
+    nparcels = start_indices.shape[0]
+
+    # per-chunk counts of steps into and out of each cell
+    qx_straight = np.zeros((n_chunks, ncells), dtype=np.int32)
+    qx_diagonal = np.zeros((n_chunks, ncells), dtype=np.int32)
+    qy_straight = np.zeros((n_chunks, ncells), dtype=np.int32)
+    qy_diagonal = np.zeros((n_chunks, ncells), dtype=np.int32)
+    qw_count = np.zeros((n_chunks, ncells), dtype=np.int32)
+
+    # per-chunk grid of the (parcel number + 1) to last visit each cell
+    visited = np.zeros((n_chunks, ncells), dtype=np.int64)
+
+    for c in prange(n_chunks):
+        for p in range(c * nparcels // n_chunks,
+                       (c + 1) * nparcels // n_chunks):
+
+            ind = start_indices[p]
+            visited[c, ind] = p + 1
+            has_repeat_ind = False
+
+            _step = 0
+            while (ind != 0) and (_step < stepmax):
+
+                _step += 1
+
+                # choose the d8 direction and the new location
+                new_cell = _pick_direction(
+                    sampling_table, sampling_alias, ind,
+                    shared_tools.get_counter_uniform(key, p, _step),
+                    sampling)
+                if new_cell != 4:
+                    istep = iwalk[new_cell]
+                    jstep = jwalk[new_cell]
+                    new_ind = np.int64(neighbor_indices[ind, new_cell])
+
+                    # count the step in the current and new cells
+                    if (istep != 0) and (jstep != 0):
+                        qx_diagonal[c, ind] += jstep
+                        qx_diagonal[c, new_ind] += jstep
+                        qy_diagonal[c, ind] += istep
+                        qy_diagonal[c, new_ind] += istep
+                    else:
+                        qx_straight[c, ind] += jstep
+                        qx_straight[c, new_ind] += jstep
+                        qy_straight[c, ind] += istep
+                        qy_straight[c, new_ind] += istep
+                    qw_count[c, ind] += 1
+                    qw_count[c, new_ind] += 1
+                else:
+                    new_ind = 0
+
+                # handle when a loop is detected
+                if (_step > L0) and (new_ind > 0) and has_repeat_ind:
                     looped[p] += 1
-                    px, py = shared_tools.custom_unravel(new_ind, domain_shape)
-
-                    Fx = px - 1
-                    Fy = py - CTR
-                    Fw = np.sqrt(Fx**2 + Fy**2)
-                    if Fw != 0:
-                        px = px + int(np.round(Fx / Fw * 5.))
-                        py = py + int(np.round(Fy / Fw * 5.))
-
-                    # limit the new px and py to beyond the inlet, and
-                    #     away from domain edges
-                    px = np.minimum(domain_min_x, np.maximum(px, L0))
-                    py = np.minimum(domain_min_y, np.maximum(1, py))
-
-                    nind = shared_tools.custom_ravel((px, py), domain_shape)
-                    new_indices[p] = nind
+                    new_ind = _relocate_looped_parcel(
+                        new_ind, L0, domain_shape, CTR)
                     free_surf_flag[p] = -1
-    return new_indices, looped, free_surf_flag
+
+                # check for the boundary and record the parcel pathway
+                if cell_type[new_ind // domain_shape[1],
+                             new_ind % domain_shape[1]] == -1:
+                    if free_surf_flag[p] == 0:
+                        free_surf_flag[p] = 1
+                    elif free_surf_flag[p] == -1:
+                        free_surf_flag[p] = 2
+                if free_surf_flag[p] == 2:
+                    new_ind = 0
+
+                free_surf_walks.record(p, new_ind)
+                if new_ind > 0:
+                    if visited[c, new_ind] == p + 1:
+                        has_repeat_ind = True
+                    visited[c, new_ind] = p + 1
+
+                if free_surf_flag[p] > 0:
+                    ind = 0
+                else:
+                    ind = new_ind
+
+    # sum the counts of all chunks into the discharge fields
+    qxn_flat = qxn.reshape(-1)
+    qyn_flat = qyn.reshape(-1)
+    qwn_flat = qwn.reshape(-1)
+    Qw_step = Qp_water / dx / 2
+    sqrt2 = np.sqrt(2.)
+    for c in prange(n_chunks):
+        for k in range(c * ncells // n_chunks, (c + 1) * ncells // n_chunks):
+            x_straight = 0
+            x_diagonal = 0
+            y_straight = 0
+            y_diagonal = 0
+            w_count = 0
+            for cc in range(n_chunks):
+                x_straight += qx_straight[cc, k]
+                x_diagonal += qx_diagonal[cc, k]
+                y_straight += qy_straight[cc, k]
+                y_diagonal += qy_diagonal[cc, k]
+                w_count += qw_count[cc, k]
+            qxn_flat[k] += x_straight + x_diagonal / sqrt2
+            qyn_flat[k] += y_straight + y_diagonal / sqrt2
+            qwn_flat[k] += w_count * Qw_step
+
+    return qxn, qyn, qwn, looped, free_surf_flag
 
 
 @njit
@@ -517,9 +1280,10 @@ def _update_absQfield(qfield, dist, inds, astep, Qp_water, dx):
     return qfield
 
 
-@njit
-def _accumulate_free_surface_walks(free_surf_walk_indices, looped, cell_type,
-                                   uw, ux, uy, depth, dx, u0, h0, H_SL, S0):
+@shared_tools.njit_threaded
+def _accumulate_free_surface_walks(free_surf_walks, looped, cell_type,
+                                   uw, ux, uy, depth, dx, u0, h0, H_SL, S0,
+                                   n_chunks):
     """Accumulate the free surface by walking parcel paths.
 
     This routine comprises the hydrodynamic physics-based computations.
@@ -527,10 +1291,11 @@ def _accumulate_free_surface_walks(free_surf_walk_indices, looped, cell_type,
     Algorithm is to:
         1. loop through every parcel's directed random walk in series.
 
-        2. for a parcel's walk, unravel the indices and determine whether the
-        parcel should contribute to the free surface. Parcels are considered
-        contributors if they have reached the ocean and if they are not looped
-        pathways.
+        2. for a parcel's walk, determine whether the parcel should
+        contribute to the free surface. Parcels are considered contributors
+        if they have reached the ocean and if they are not looped pathways.
+        The cells visited by contributing parcels are decoded from the
+        direction codes of the walk (see :obj:`ParcelWalks.decode`).
 
         3. then, we begin at the downstream end of the parcel's walk and
         iterate up-walk until, determining the `Hnew` for each location.
@@ -541,36 +1306,62 @@ def _accumulate_free_surface_walks(free_surf_walk_indices, looped, cell_type,
 
         4. repeat from 2, for each parcel.
 
+    The water surface `Hnew` of each cell depends only on that of the next
+    cell along the walk, so it is carried along the reversed walk as a
+    running value, rather than in a grid which must be reset for every
+    parcel. The cost is therefore proportional to the total length of the
+    walks, independent of the size of the domain.
+
+    The parcels are split into `n_chunks` chunks, which are accumulated in
+    parallel by the ``threaded`` variant of the function (see
+    :obj:`~pyDeltaRCM.shared_tools.njit_threaded`) into partial sums for
+    each chunk. With a single chunk, the surface elevations are summed in
+    the same order as walking the parcels in series; otherwise, `sfc_sum`
+    may differ by rounding error.
     """
     _shape = uw.shape
-    Hnew = np.zeros(_shape)
-    sfc_visit = np.zeros(_shape)
-    sfc_sum = np.zeros(_shape)
-
-    # for every parcel, walk the path of the parcel
-    for p, inds in enumerate(free_surf_walk_indices):
-
-        # unravel the indices of the parcel into `xs` and `ys`
-        inds_whr = inds[inds > 0]  # where the path has meaningful values
-        xs = np.zeros_like(inds_whr)  # x coordinates
-        ys = np.zeros_like(inds_whr)  # x coordinates
-        for pp, ind_whr in np.ndenumerate(inds_whr):
-            xs[pp], ys[pp] = shared_tools.custom_unravel(ind_whr, _shape)
-
-        # determine whether the pathway contributes to the free surface
-        Hnew[:] = 0
-        if ((cell_type[xs[-1], ys[-1]] == -1) and (looped[p] == 0)):
+    nparcels = looped.shape[0]
+
+    # per-chunk partial sums of the cell visits and water surface elevations
+    chunk_visit = np.zeros((n_chunks, _shape[0], _shape[1]))
+    chunk_sum = np.zeros((n_chunks, _shape[0], _shape[1]))
+
+    # per-chunk x and y coordinates of the cells visited by a parcel
+    xs = np.zeros((n_chunks, free_surf_walks.max_length() + 1),
+                  dtype=np.int64)
+    ys = np.zeros((n_chunks, free_surf_walks.max_length() + 1),
+                  dtype=np.int64)
+
+    for c in prange(n_chunks):
+        sfc_visit = chunk_visit[c]
+        sfc_sum = chunk_sum[c]
+
+        # for every parcel, walk the path of the parcel
+        for p in range(c * nparcels // n_chunks,
+                       (c + 1) * nparcels // n_chunks):
+
+            # looped pathways do not contribute to the free surface
+            if looped[p] != 0:
+                continue
+
+            # decode the path of the parcel into `xs` and `ys`
+            n = free_surf_walks.decode(p, xs[c], ys[c])
+
+            # determine whether the pathway contributes to the free surface
+            if cell_type[xs[c, n - 1], ys[c, n - 1]] != -1:
+                continue
+
             # if cell is in ocean, H = H_SL (downstream boundary condition)
-            Hnew[xs[-1], ys[-1]] = H_SL
+            Hnew = np.float64(H_SL)
 
             # counting back from last cell visited
             in_ocean = True  # whether we are in the ocean or not
-            dH = 0
-            for it in range(len(xs) - 2, -1, -1):
-                i = xs[it]
-                ip = xs[it + 1]
-                j = ys[it]
-                jp = ys[it + 1]
+            dH = 0.
+            for it in range(n - 2, -1, -1):
+                i = xs[c, it]
+                ip = xs[c, it + 1]
+                j = ys[c, it]
+                jp = ys[c, it + 1]
 
                 # if the parcel has moved at all
                 if (i != ip) or (j != jp):
@@ -583,20 +1374,27 @@ def _accumulate_free_surface_walks(free_surf_walk_indices, looped, cell_type,
                     else:
                         # if no velocity
                         if uw[i, j] == 0:
-                            dH = 0  # no change in water surface elevation
+                            dH = 0.  # no change in water surface elevation
                         else:
                             # diff between streamline and parcel path
                             dH = (S0 * (ux[i, j] * (ip - i) * dx +
                                         uy[i, j] * (jp - j) * dx) / uw[i, j])
 
                 # previous cell's surface plus difference in H
-                Hnew[i, j] = Hnew[ip, jp] + dH
+                Hnew = Hnew + dH
 
                 # add up # of cell visits
                 sfc_visit[i, j] = sfc_visit[i, j] + 1
 
                 # sum of all water surface elevations
-                sfc_sum[i, j] = sfc_sum[i, j] + Hnew[i, j]
+                sfc_sum[i, j] = sfc_sum[i, j] + Hnew
+
+    # sum the partial sums of all chunks
+    sfc_visit = chunk_visit[0]
+    sfc_sum = chunk_sum[0]
+    for c in range(1, n_chunks):
+        sfc_visit += chunk_visit[c]
+        sfc_sum += chunk_sum[c]
 
     return sfc_visit, sfc_sum
 
@@ -36,6 +36,38 @@ def test_bed_after_ten_updates(test_DeltaModel):
     assert np.all(test_DeltaModel.eta[:5, 4] == pytest.approx(_exp))
 
 
+def test_bed_after_one_update_fused(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'out_dir': tmp_path / 'out_dir',
+                                  'Length': 10.0, 'Width': 10.0, 'seed': 0,
+                                  'dx': 1.0, 'L0_meters': 1.0, 'Np_water': 10,
+                                  'N0_meters': 2.0, 'h0': 1.0, 'SLR': 0.001,
+                                  'Np_sed': 10, 'save_dt': 500,
+                                  'water_routing': 'fused'})
+    delta = DeltaModel(input_file=p)
+    delta.update()
+
+    # same expected values as the stepwise water routing
+    _exp = np.array([-1., -0.840265, -0.9976036, -1., -1.])
+    assert np.all(delta.eta[:5, 4] == pytest.approx(_exp))
+
+
+def test_bed_after_one_update_compacted(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'out_dir': tmp_path / 'out_dir',
+                                  'Length': 10.0, 'Width': 10.0, 'seed': 0,
+                                  'dx': 1.0, 'L0_meters': 1.0, 'Np_water': 10,
+                                  'N0_meters': 2.0, 'h0': 1.0, 'SLR': 0.001,
+                                  'Np_sed': 10, 'save_dt': 500,
+                                  'water_routing': 'compacted'})
+    delta = DeltaModel(input_file=p)
+    delta.update()
+
+    # same expected values as the stepwise water routing
+    _exp = np.array([-1., -0.840265, -0.9976036, -1., -1.])
+    assert np.all(delta.eta[:5, 4] == pytest.approx(_exp))
+
+
 def test_long_multi_validation(tmp_path):
     # IndexError on corner.
 
@@ -52,6 +52,15 @@ def test_cannot_support_checkpointing_subsidence(tmp_path):
     delta = DeltaModel(input_file=p)
 
 
+def test_cannot_support_streaming_strata_subsidence(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'toggle_subsidence': True,
+                                  'save_strata': True,
+                                  'stream_strata': True})
+    with pytest.raises(NotImplementedError, match='streaming'):
+        delta = DeltaModel(input_file=p)
+
+
 # tests for attrs set during yaml parsing
 
 def test_set_verbose(test_DeltaModel):
@@ -445,6 +454,166 @@ def test_stepmax_float(tmp_path):
     assert _delta.stepmax == 11
 
 
+def test_water_routing_default(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'alpha': 0.25})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.water_routing == 'stepwise'
+
+
+def test_water_routing_fused(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'water_routing': 'fused'})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.water_routing == 'fused'
+
+
+def test_water_routing_compacted(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'water_routing': 'compacted'})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.water_routing == 'compacted'
+
+
+def test_water_routing_parcelwise(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'water_routing': 'parcelwise',
+                                  'threaded': True})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.water_routing == 'parcelwise'
+    assert _delta.threaded is True
+
+
+def test_threaded_default(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'alpha': 0.25})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.threaded is False
+
+
+def test_water_routing_bad_value(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'water_routing': 'quick'})
+    with pytest.raises(ValueError):
+        _delta = DeltaModel(input_file=p)
+
+
+def test_water_sampling_default(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'alpha': 0.25})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.water_sampling == 'search'
+
+
+def test_water_sampling_alias(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'water_sampling': 'alias'})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.water_sampling == 'alias'
+
+
+def test_water_sampling_bad_value(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'water_sampling': 'table'})
+    with pytest.raises(ValueError):
+        _delta = DeltaModel(input_file=p)
+
+
+def test_sed_routing_default(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'alpha': 0.25})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.sed_routing == 'serial'
+    assert _delta.sed_batch_size == 1
+
+
+def test_sed_routing_batched(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'sed_routing': 'batched',
+                                  'sed_batch_size': 16})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.sed_routing == 'batched'
+    assert _delta.sed_batch_size == 16
+    assert len(_delta._sr_chunks) == 1
+    assert len(_delta._mr_chunks) == 1
+
+
+def test_sed_routing_speculative(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'sed_routing': 'speculative',
+                                  'sed_batch_size': 16})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.sed_routing == 'speculative'
+    assert len(_delta._sr_chunks) == 1
+    assert len(_delta._mr_chunks) == 1
+
+
+def test_sed_routing_bad_value(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'sed_routing': 'parallel'})
+    with pytest.raises(ValueError):
+        _delta = DeltaModel(input_file=p)
+
+
+def test_sed_batch_size_bad_value(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'sed_batch_size': 0})
+    with pytest.raises(ValueError):
+        _delta = DeltaModel(input_file=p)
+
+
+def test_forcing_default(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'alpha': 0.25})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.forcing is None
+    assert _delta._forcing_tables == {}
+
+
+def test_forcing_tables(tmp_path):
+    np.savetxt(tmp_path / 'configs_sea_level.txt',
+               np.array([[0, 0], [1000, 0.5]]))
+    p = utilities.yaml_from_dict(
+        tmp_path, 'input.yaml',
+        {'forcing': {'u0': {'time': [0, 100, 200], 'value': [1, 2, 1]},
+                     'H_SL': str(tmp_path / 'configs_sea_level.txt')}})
+    _delta = DeltaModel(input_file=p)
+    assert np.all(_delta._forcing_tables['u0'][0] == [0, 100, 200])
+    assert np.all(_delta._forcing_tables['u0'][1] == [1, 2, 1])
+    assert np.all(_delta._forcing_tables['H_SL'][1] == [0, 0.5])
+    assert _delta._forcing_inlet
+
+
+def test_forcing_bad_parameter(tmp_path):
+    p = utilities.yaml_from_dict(
+        tmp_path, 'input.yaml',
+        {'forcing': {'dx': {'time': [0, 100], 'value': [1, 2]}}})
+    with pytest.raises(ValueError, match='Cannot force parameter'):
+        _delta = DeltaModel(input_file=p)
+
+
+def test_forcing_times_not_increasing(tmp_path):
+    p = utilities.yaml_from_dict(
+        tmp_path, 'input.yaml',
+        {'forcing': {'u0': {'time': [0, 100, 50], 'value': [1, 2, 1]}}})
+    with pytest.raises(ValueError, match='increasing'):
+        _delta = DeltaModel(input_file=p)
+
+
+def test_diffusion_region_default(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'alpha': 0.25})
+    _delta = DeltaModel(input_file=p)
+    assert _delta.diffusion_region == 'domain'
+
+
+def test_diffusion_region_bad_value(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'diffusion_region': 'delta'})
+    with pytest.raises(ValueError):
+        _delta = DeltaModel(input_file=p)
+
+
 def test_diffusion_multiplier(tmp_path):
     p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
                                  {'u0': 0.8,
@@ -691,7 +860,7 @@ def test_looped(test_DeltaModel):
 
 
 def test_indices(test_DeltaModel):
-    assert np.any(test_DeltaModel.free_surf_walk_indices) == 0
+    assert np.any(test_DeltaModel.free_surf_walks.length) == 0
 
 
 def test_sfc_visit(test_DeltaModel):
@@ -10,6 +10,7 @@ import glob
 import netCDF4
 
 from pyDeltaRCM.model import DeltaModel
+from pyDeltaRCM import iteration_tools
 
 from utilities import test_DeltaModel
 import utilities
@@ -28,6 +29,28 @@ def test_finalize_timestep(test_DeltaModel):
     assert test_DeltaModel.H_SL == 0.3
 
 
+def test_apply_forcing_in_update(tmp_path):
+    p = utilities.yaml_from_dict(
+        tmp_path, 'input.yaml',
+        {'out_dir': tmp_path / 'out_dir', 'seed': 0,
+         'forcing': {'u0': {'time': [0, 40000], 'value': [1.5, 0.5]},
+                     'f_bedload': {'time': [0], 'value': [0.25]}}})
+    _delta = DeltaModel(input_file=p)
+    _sr = _delta._sr
+    _delta.update()  # forced at time zero
+    assert _delta.u0 == 1.5
+    assert _delta.u_max == 3
+    assert _delta.f_bedload == 0.25
+    assert _delta._sr is _sr
+    assert _sr.u_max == 3
+    assert _sr._f_bedload == 0.25
+    _time = _delta.time
+    _delta.update()  # forced at the time after the first step
+    assert _delta.u0 == pytest.approx(1.5 - _time / 40000)
+    assert _sr._u0 == pytest.approx(_delta.u0)
+    _delta.output_netcdf.close()
+
+
 def test_subsidence_in_update(tmp_path):
     p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
                                  {'toggle_subsidence': True,
@@ -46,6 +69,34 @@ def test_subsidence_in_update(tmp_path):
     _delta.output_netcdf.close()
 
 
+def test_subsidence_stratigraphy_offsets(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'out_dir': tmp_path / 'out_dir',
+                                  'toggle_subsidence': True,
+                                  'sigma_max': 1e-8,
+                                  'start_subsidence': 0,
+                                  'save_strata': True,
+                                  'save_dt': 20000,
+                                  'seed': 0})
+    _delta = DeltaModel(input_file=p)
+    for _ in range(3):
+        _delta.update()
+    assert _delta.strata_counter == 3
+    # subsidence is kept once, and not applied to the records
+    assert _delta.strata_eta.offsets.shape == (1, _delta.L * _delta.W)
+    assert np.all(_delta.strata_eta.offset_columns == [0, 1, 2])
+    _ind = np.ravel_multi_index((17, 6), _delta.eta.shape)
+    assert _delta.strata_eta.column(0, raw=True)[_ind] == 0
+    assert _delta.strata_eta.column(0)[_ind] == pytest.approx(-0.0004)
+    assert _delta.strata_eta.column(1, raw=True)[_ind] == pytest.approx(
+        -_delta.h0 - 0.0002)
+    assert _delta.strata_eta.toarray()[_ind, 1] == pytest.approx(
+        -_delta.h0 - 0.0004)
+    assert _delta.strata_eta.column(2)[_ind] == pytest.approx(
+        -_delta.h0 - 0.0004)
+    _delta.output_netcdf.close()
+
+
 def test_subsidence_in_update_delayed_start(tmp_path):
     p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
                                  {'toggle_subsidence': True,
@@ -107,9 +158,10 @@ def test_expand_stratigraphy(tmp_path):
     assert _delta.dt == 300
     assert _delta.n_steps == 10
     assert _delta.strata_counter == 0
-    assert _delta.strata_eta[:, _delta.strata_counter].getnnz() == 0
+    assert _delta.strata_eta.tocsc()[:, _delta.strata_counter].getnnz() == 0
     for _t in range(19):
-        assert _delta.strata_eta[:, _delta.strata_counter].getnnz() == 0
+        assert _delta.strata_eta.tocsc()[
+            :, _delta.strata_counter].getnnz() == 0
         _delta.update()
         assert _delta.time == _delta.dt * (_t + 1)
         assert _delta.strata_eta.shape[1] == 10
@@ -134,6 +186,205 @@ def test_expand_stratigraphy(tmp_path):
     assert _delta.strata_eta.shape[1] == 50
 
 
+def test_stream_strata_same_as_output_strata(tmp_path):
+    _strata = []
+    for _stream in [False, True]:
+        _out_dir = tmp_path / 'out_{0}'.format(_stream)
+        p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                     {'out_dir': _out_dir,
+                                      'Length': 10.0, 'Width': 10.0,
+                                      'dx': 1.0, 'L0_meters': 1.0,
+                                      'Np_water': 10, 'N0_meters': 2.0,
+                                      'h0': 1.0, 'Np_sed': 10,
+                                      'C0_percent': 0.1, 'save_dt': 600,
+                                      'save_strata': True,
+                                      'stream_strata': _stream,
+                                      'seed': 0})
+        _delta = DeltaModel(input_file=p)
+        for _ in range(6):
+            _delta.update()
+        assert _delta.strata_counter == 3
+        if _stream:
+            # written as saved, and not kept in memory
+            _nc = _delta.output_netcdf
+            assert _nc.variables['strata_depth'].shape == (3, 10, 10)
+            assert _nc.variables['strata_sand_frac'].shape == (3, 10, 10)
+            assert _delta.strata_eta.n_filled == 0
+            assert _delta.strata_sand_frac.n_filled == 0
+        _delta.finalize()
+        _ds = netCDF4.Dataset(os.path.join(_out_dir, 'pyDeltaRCM_output.nc'))
+        _strata.append({_v: _ds.variables[_v][:].data for _v in
+                        ['strata_age', 'strata_sand_frac', 'strata_depth']})
+        _ds.close()
+    for _v in _strata[0]:
+        assert _strata[0][_v].shape == _strata[1][_v].shape
+        assert np.all(_strata[0][_v] == _strata[1][_v])
+
+
+def test_strata_store_append():
+    _store = iteration_tools.StrataStore(6, 2)
+    assert _store.shape == (6, 2)
+    _store.append(np.array([1, 4]), np.array([0.5, 2.]))
+    _store.append(np.array([0, 3, 5]), np.array([1., 0., 3.]))
+    assert _store.n_filled == 2
+    assert _store.nnz == 4  # zero value is not recorded
+    with pytest.raises(IndexError):
+        _store.append(np.array([0]), np.array([1.]))
+    _store.expand(3)
+    assert _store.shape == (6, 5)
+    _store.append(np.arange(6), np.ones((6,)))
+    _expected = np.zeros((6, 5), dtype=np.float32)
+    _expected[[1, 4], 0] = [0.5, 2.]
+    _expected[[0, 5], 1] = [1., 3.]
+    _expected[:, 2] = 1
+    assert np.all(_store.toarray() == _expected)
+    assert np.all(_store.tocsr().toarray() == _expected)
+    assert np.all(_store.column(1) == _expected[:, 1])
+    assert np.all(_store.column(4) == 0)
+    assert _store.toarray().dtype == np.float32
+
+
+def test_strata_store_subtract_and_from_matrix():
+    _store = iteration_tools.StrataStore(4, 3)
+    _store.append(np.array([0, 2]), np.array([1., 2.]))
+    _store.append(np.array([1]), np.array([3.]))
+    _store.append(np.array([3]), np.array([4.]))
+    _raw = _store.toarray()
+    _offset = np.array([0., 1., 2., 0.])
+    _expected = _raw.copy()
+    _expected[:, :2] -= _offset[:, np.newaxis]
+    _store.subtract(_offset, 2)
+    assert np.all(_store.toarray() == _expected)
+    assert _store.tocsc().nnz == 5  # zeros after subtraction not recorded
+    assert np.all(_store.column(0) == _expected[:, 0])
+    assert np.all(_store.column(2) == _expected[:, 2])
+    # the records are not changed
+    assert _store.nnz == 4
+    assert np.all(_store.tocsc(raw=True).toarray() == _raw)
+    assert np.all(_store.column(0, raw=True) == _raw[:, 0])
+
+    # the same offset is only kept once
+    _expected[:, :3] -= _offset[:, np.newaxis]
+    _store.subtract(_offset, 3)
+    assert _store.offsets.shape == (1, 4)
+    assert np.all(_store.offset_columns == [2, 3])
+    assert np.all(_store.offset_ids == [0, 0])
+    assert np.all(_store.toarray() == _expected)
+
+    _loaded = iteration_tools.StrataStore.from_matrix(
+        _store.tocsr(raw=True), _store.n_filled)
+    _loaded.set_offsets(_store.offsets, _store.offset_columns,
+                        _store.offset_ids)
+    assert _loaded.shape == _store.shape
+    assert _loaded.n_filled == 3
+    assert np.all(_loaded.toarray() == _expected)
+
+
+def test_strata_store_offsets_kept_until_subtract():
+    _store = iteration_tools.StrataStore(3, 4)
+    for _ in range(4):
+        _store.append(np.array([0, 1]), np.array([1., 2.]))
+    _store.subtract(np.array([0.1, 0., 0.2]), 2)
+    _cache = _store._stacked_offsets()
+    assert _store.column(0)[0] == np.float32(1) - np.float32(0.1)
+    assert _store._stacked_offsets() is _cache
+    # offsets are rounded to the type of the store
+    assert _store.offsets.dtype == np.float32
+    assert _store.offsets[0, 0] == np.float32(0.1)
+
+    _store.subtract(np.array([0.1, 0., 0.2]), 3)
+    assert _store._stacked_offsets() is not _cache
+    _expected = np.array([[1. - 0.2, 1. - 0.2, 1. - 0.1, 1.],
+                          [2., 2., 2., 2.],
+                          [-0.4, -0.4, -0.2, 0.]], dtype=np.float32)
+    assert _store.toarray() == pytest.approx(_expected)
+    for _i in range(4):
+        assert np.all(_store.column(_i) == _store.toarray()[:, _i])
+
+
+def test_preserved_strata_same_as_minimum():
+    _rng = np.random.default_rng(0)
+    # random walk of the bed, with erosion and deposition
+    _surfaces = np.cumsum(
+        _rng.normal(0.01, 0.1, (40, 25)), axis=0).astype(np.float32)
+    _surfaces[:, 0] = 1  # never changes
+    _preserved = iteration_tools.PreservedStrata(25, block_size=2)
+    for _s in _surfaces:
+        _preserved.record(_s)
+    # preserves only the oldest surface when cross-cutting
+    _expected = np.minimum.accumulate(_surfaces[::-1], axis=0)[::-1]
+    assert _preserved.n_saves == 40
+    assert np.all(_preserved.cube() == _expected)
+    assert np.all(_preserved.surface(0) == _expected[0])
+    assert np.all(_preserved.surface(17) == _expected[17])
+    assert _preserved.stack_size[0] == 1
+    assert np.all(_preserved.stack_size ==
+                  [len(np.unique(_e)) for _e in _expected.T])
+    with pytest.raises(IndexError):
+        _preserved.surface(40)
+
+    _loaded = iteration_tools.PreservedStrata.from_arrays(
+        *_preserved.compact(), _preserved.n_saves, block_size=3)
+    assert np.all(_loaded.cube() == _expected)
+    assert np.all(_loaded.stack_size == _preserved.stack_size)
+    _loaded.record(_surfaces[-1] - 0.5)
+    _preserved.record(_surfaces[-1] - 0.5)
+    assert np.all(_loaded.cube() == _preserved.cube())
+
+
+def test_preserved_strata_clipped_count_and_subsidence():
+    _preserved = iteration_tools.PreservedStrata(3)
+    assert _preserved.record(np.array([1., 1., 1.])) == 0
+    assert _preserved.record(np.array([2., 1., 0.5])) == 1
+    assert _preserved.record(np.array([1.5, 1., 0.5])) == 1
+    assert np.all(_preserved.cube() == [[1, 1, 0.5],
+                                        [1.5, 1, 0.5],
+                                        [1.5, 1, 0.5]])
+    # subsidence of the surfaces recorded so far
+    _preserved.subtract(np.array([0., 0.5, 0.]))
+    assert _preserved.record(np.array([1.5, 0.75, 0.5])) == 0
+    assert np.all(_preserved.cube() == [[1, 0.5, 0.5],
+                                        [1.5, 0.5, 0.5],
+                                        [1.5, 0.5, 0.5],
+                                        [1.5, 0.75, 0.5]])
+
+
+def test_preserve_strata_in_update(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'out_dir': tmp_path / 'out_dir',
+                                  'Length': 10.0, 'Width': 10.0,
+                                  'dx': 1.0, 'L0_meters': 1.0,
+                                  'Np_water': 10, 'N0_meters': 2.0,
+                                  'h0': 1.0, 'Np_sed': 10,
+                                  'C0_percent': 0.1, 'save_dt': 300,
+                                  'save_strata': True,
+                                  'preserve_strata': True,
+                                  'save_checkpoint': True,
+                                  'seed': 0})
+    _delta = DeltaModel(input_file=p)
+    for _ in range(10):
+        _delta.update()
+    assert _delta.strata_preserved.n_saves == _delta.strata_counter
+    _depth = np.array([_delta.strata_eta.column(i)
+                       for i in range(_delta.strata_counter)])
+    _depth[_depth == 0] = np.tile(
+        _delta.init_eta.flatten(), (_delta.strata_counter, 1))[_depth == 0]
+    _expected = np.minimum.accumulate(_depth[::-1], axis=0)[::-1]
+    assert np.all(_delta.strata_preserved.cube() == _expected)
+
+    # the preserved surfaces are saved in the checkpoint
+    _delta.load_checkpoint()
+    assert np.all(_delta.strata_preserved.cube() == _expected)
+
+    _delta.finalize()
+    _cube = _delta.strata_preserved.cube()
+    _ds = netCDF4.Dataset(
+        os.path.join(tmp_path / 'out_dir', 'pyDeltaRCM_output.nc'))
+    _written = _ds.variables['strata_preserved_depth'][:].data
+    _ds.close()
+    assert np.all(_written.reshape(_cube.shape) == _cube)
+
+
 def test_verbose_printing_0(tmp_path, capsys):
     """
     This test should create the log, and then print nothing at all.
@@ -245,6 +245,29 @@ def test_setting_getting_channel_width(test_DeltaModel):
     assert test_DeltaModel.C0 == 0.02
 
 
+def test_setting_boundary_conditions_updates_routers(test_DeltaModel):
+    """
+    Test that changing an inlet flow condition updates the constants of
+    the existing sediment routers, as if they were constructed again
+    """
+    _delta = test_DeltaModel
+    _sr = _delta._sr
+    _mr = _delta._mr
+    _delta.channel_flow_velocity = 2
+    _delta.channel_flow_depth = 2
+    _delta.influx_sediment_concentration = 0.2
+    assert _delta._sr is _sr
+    assert _delta._mr is _mr
+
+    _delta.init_sediment_routers()
+    for _name in ['_dt', 'Vp_sed', 'u_max', 'dry_depth', 'gamma', 'qs0',
+                  '_u0', 'U_ero_sand']:
+        assert getattr(_sr, _name) == getattr(_delta._sr, _name)
+    for _name in ['_dt', 'Vp_sed', 'u_max', 'dry_depth', 'gamma',
+                  'U_dep_mud', 'U_ero_mud']:
+        assert getattr(_mr, _name) == getattr(_delta._mr, _name)
+
+
 def test_make_checkpoint(tmp_path, test_DeltaModel):
     """Test setting the checkpoint option to 'True' and saving a checkpoint."""
     test_DeltaModel.save_checkpoint = True
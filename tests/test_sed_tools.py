@@ -5,7 +5,13 @@ import pytest
 import sys
 import os
 import numpy as np
+from scipy import ndimage
+from numba import typed
 
+from pyDeltaRCM.model import DeltaModel
+from pyDeltaRCM import shared_tools
+from pyDeltaRCM import sed_tools
+import utilities
 from utilities import test_DeltaModel
 
 
@@ -13,37 +19,431 @@ def test_sed_route_padding(test_DeltaModel):
     """
     test the function sed_tools.sed_route
     """
-    test_DeltaModel.pad_cell_type = np.pad(
-        test_DeltaModel.cell_type, 1, 'edge')
-    test_DeltaModel.pad_stage = np.pad(test_DeltaModel.stage, 1, 'edge')
-    test_DeltaModel.pad_depth = np.pad(test_DeltaModel.depth, 1, 'edge')
-
-    test_DeltaModel.pad_cell_type = np.pad(
-        test_DeltaModel.cell_type, 1, 'edge')
     test_DeltaModel.sed_route()
 
     assert np.all(test_DeltaModel.pad_depth[
                   1:-1, 1:-1] == test_DeltaModel.depth)
     assert np.shape(test_DeltaModel.pad_depth) == (12, 12)
+    assert np.shares_memory(test_DeltaModel.pad_depth, test_DeltaModel.depth)
 
 
 def test_sand_route_updates(test_DeltaModel):
     # operations at top of sed_route()
-    test_DeltaModel.pad_depth = np.pad(test_DeltaModel.depth, 1, 'edge')
     test_DeltaModel.qs[:] = 0
     test_DeltaModel.Vp_dep_sand[:] = 0
     test_DeltaModel.Vp_dep_mud[:] = 0
 
-    test_DeltaModel.pad_cell_type = np.pad(
-        test_DeltaModel.cell_type, 1, 'edge')
-    test_DeltaModel.pad_stage = np.pad(test_DeltaModel.stage, 1, 'edge')
-    test_DeltaModel.pad_depth = np.pad(test_DeltaModel.depth, 1, 'edge')
-
-    # operations at the
-    test_DeltaModel.pad_cell_type = np.pad(
-        test_DeltaModel.cell_type, 1, 'edge')
-
     test_DeltaModel.route_all_sand_parcels()
 
     # simply check that the sediment transport field is updated
     assert np.any(test_DeltaModel.qs != 0)
+
+
+def _open_basin(_delta):
+    """Open the basin of the small test model to the parcels.
+
+    The cells away from the edges of the domain, where parcels stop, are
+    made open water.
+    """
+    _delta.cell_type[1:-1, 1:-1] = 0
+    return _delta
+
+
+def _assert_weight_cache_up_to_date(_delta, _sr):
+    for px, py in np.argwhere(_sr.weight_cached):
+        weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
+            _delta.stage[px, py],
+            _delta.pad_stage[px:px + 3, py:py + 3].ravel(),
+            _delta.qx[px, py], _delta.qy[px, py], _delta.ivec_flat,
+            _delta.jvec_flat, _delta.distances_flat)
+        _weights = shared_tools.get_weight_at_cell(
+            (px, py), weight_sfc, weight_int,
+            _delta.pad_depth[px:px + 3, py:py + 3].ravel(),
+            _delta.pad_cell_type[px:px + 3, py:py + 3].ravel(),
+            np.float32(_sr.dry_depth), np.float32(_sr.gamma),
+            np.float32(_sr.theta_sed))
+        assert np.all(_sr.weight_cache[px, py] == _weights)
+
+
+def test_sand_route_weight_cache(tmp_path):
+    """
+    Test that the cached weights are up to date with the depth field
+    """
+    _delta = utilities.developed_DeltaModel(tmp_path)
+    _delta.route_all_sand_parcels()
+
+    _sr = _delta._sr
+    assert _sr.n_weight_misses > 0
+    assert _sr.n_weight_hits > 0
+    assert 0 < _sr.weight_cache_hit_rate() < 1
+    _assert_weight_cache_up_to_date(_delta, _sr)
+
+
+def test_sand_route_weight_cache_small_basin(test_DeltaModel):
+    """
+    Test that depositing in a small basin invalidates the cached weights
+    around the changed cells
+    """
+    _delta = _open_basin(test_DeltaModel)
+    _sr = _delta._sr
+    _sr.run(np.array([4, 4, 4, 4]))
+
+    # the parcels deposit below the inlet, and reuse the cached weights of
+    #   the cells the deposits did not change
+    assert np.all(_delta.eta[0, 3:6] == -1)
+    assert np.any(_delta.eta[1] > -1)
+    assert _sr.n_weight_hits > 0
+    _assert_weight_cache_up_to_date(_delta, _sr)
+
+    # a change of depth invalidates the 3x3 neighborhood of the cell only
+    _sr.weight_cached[:] = True
+    _sr._invalidate_weights(5, 0)
+    _exp = np.ones((10, 10), dtype=bool)
+    _exp[4:7, 0:2] = False
+    assert np.all(_sr.weight_cached == _exp)
+
+
+def test_route_parcels_batched_size_one_same_as_serial(tmp_path):
+    """
+    Test that batches of one parcel reproduce the serial routing exactly
+    """
+    _results = []
+    for _routing in ['serial', 'batched']:
+        _delta = utilities.developed_DeltaModel(
+            tmp_path, _routing, sed_routing=_routing, sed_batch_size=1)
+        _results.append((_delta.eta.copy(), _delta.qs.copy()))
+
+    assert np.all(_results[0][0] == _results[1][0])
+    assert np.all(_results[0][1] == _results[1][1])
+
+
+def _field_copies(_delta):
+    """Copies of the fields that sediment parcels change.
+
+    Returned with the other fields, in the order of the field arguments of
+    the routing functions.
+    """
+    _pad_depth = _delta.pad_depth.copy()
+    return (_delta.eta.copy(), _delta.stage, _pad_depth[1:-1, 1:-1],
+            _delta.cell_type, _delta.uw.copy(), _delta.ux.copy(),
+            _delta.uy.copy(), _delta.pad_stage, _pad_depth,
+            _delta.pad_cell_type, _delta.Vp_dep_mud.copy(),
+            _delta.Vp_dep_sand.copy(), _delta.qw, _delta.qx, _delta.qy,
+            _delta.qs.copy())
+
+
+def _route_parcels_in_order(router, start_indices, key, fields):
+    """Route the parcels one after another, on the given fields.
+
+    Each parcel draws random numbers from its own stream, as in the
+    batched and speculative routing.
+    """
+    router.bind_fields(*fields)
+    router.rng_key = key
+    for _p in range(start_indices.shape[0]):
+        router.rng_stream = _p
+        router.rng_counter = 0
+        router._route_from_inlet(start_indices[_p])
+    router.rng_key = -1
+
+
+def test_route_parcels_batched_size_one_same_as_parcels_in_order(
+        test_DeltaModel):
+    """
+    Test that batches of one parcel are the same as routing the parcels one
+    after another, each drawing random numbers from its own stream
+    """
+    _delta = _open_basin(test_DeltaModel)
+    start_indices = np.array([4, 3, 5, 4, 4, 5, 3, 4])
+    _key = 12345
+
+    _fields = _field_copies(_delta)
+    sed_tools._route_parcels_batched(
+        typed.List([_delta._sr]), start_indices, 1, _key, *_fields)
+
+    # route and commit each parcel in turn, on a router of field copies
+    _exp = _field_copies(_delta)
+    eta, depth, uw, ux, uy = [_exp[n] for n in (0, 2, 4, 5, 6)]
+    Vp_dep_mud, Vp_dep_sand, qs = _exp[10], _exp[11], _exp[15]
+    _delta.init_sediment_routers()
+    _routers = typed.List([_delta._sr])
+    ncap = int(_delta._sr.stepmax) + 2
+    sed_tools._bind_router_copies(_routers, _key, ncap, *_exp)
+    cells = np.zeros((1, ncap), dtype=np.int64)
+    n_cells = np.zeros(1, dtype=np.int64)
+    f_32 = np.zeros((2, 1, ncap), dtype=np.float32)
+    f_64 = np.zeros((6, 1, ncap))
+    for _p in range(start_indices.shape[0]):
+        sed_tools._route_and_record_parcel(
+            _routers[0], start_indices[_p], _p, 0, cells, n_cells, f_32,
+            f_64, eta, depth, uw, ux, uy, Vp_dep_mud, Vp_dep_sand, qs)
+        for m in range(n_cells[0]):
+            i, k = divmod(cells[0, m], _delta.W)
+            sed_tools._commit_cell(0, m, i, k, f_32, f_64, eta, depth, uw,
+                                   ux, uy, Vp_dep_mud, Vp_dep_sand, qs)
+            sed_tools._restore_cell(_routers[0], i, k, eta, depth, uw, ux,
+                                    uy, Vp_dep_mud, Vp_dep_sand, qs)
+
+    assert np.any(_fields[0] != _delta.eta)  # parcels changed the bed
+    for _a, _b in zip(_fields, _exp):
+        assert np.all(_a == _b)
+
+
+def test_route_parcels_batched_any_chunks(tmp_path):
+    """
+    Test that the batched routing does not depend on the chunking
+    """
+    _delta = utilities.developed_DeltaModel(
+        tmp_path, sed_routing='batched', sed_batch_size=10)
+
+    start_indices = shared_tools.get_start_indices(
+        _delta.inlet, np.ones_like(_delta.inlet), 50)
+    _key = shared_tools.get_random_key()
+
+    _results = []
+    for _route, _n_chunks in [
+            (sed_tools._route_parcels_batched, 1),
+            (sed_tools._route_parcels_batched, 3),
+            (sed_tools._route_parcels_batched.threaded, 3)]:
+        _routers = utilities.sand_router_chunks(_delta, _n_chunks)
+        _pad_depth = _delta.pad_depth.copy()
+        _fields = (_delta.eta.copy(), _pad_depth[1:-1, 1:-1],
+                   _delta.uw.copy(), _delta.qs.copy())
+        _route(_routers, start_indices, 10, _key, _fields[0],
+               _delta.stage, _fields[1], _delta.cell_type, _fields[2],
+               _delta.ux.copy(), _delta.uy.copy(), _delta.pad_stage,
+               _pad_depth, _delta.pad_cell_type, _delta.Vp_dep_mud.copy(),
+               _delta.Vp_dep_sand.copy(), _delta.qw, _delta.qx, _delta.qy,
+               _fields[3])
+        _results.append(_fields)
+
+    assert np.any(_results[0][0] != _delta.eta)  # parcels changed the bed
+    for _a, _b, _c in zip(*_results):
+        assert np.all(_a == _b)
+        assert np.all(_a == _c)
+
+
+def test_route_parcels_speculative_any_window(tmp_path):
+    """
+    Test that the speculative routing does not depend on the window size
+    """
+    _results = []
+    for _size in [1, 16, 100]:
+        _delta = utilities.developed_DeltaModel(
+            tmp_path, str(_size), sed_routing='speculative',
+            sed_batch_size=_size)
+        _results.append((_delta.eta.copy(), _delta.qs.copy(),
+                         _delta.Vp_dep_mud.copy()))
+
+        # routing the sand parcels again is the same as routing them one
+        #   after another, each drawing random numbers from its own stream
+        _exp = _field_copies(_delta)
+        _rng_state = shared_tools.get_random_state()
+        _delta.route_all_sand_parcels()
+        shared_tools.set_random_state(_rng_state)
+        start_indices = shared_tools.sample_start_indices(
+            _delta.inlet, _delta._inlet_cumulative,
+            int(_delta.Np_sed * _delta.f_bedload))
+        _route_parcels_in_order(_delta._sr, start_indices,
+                                shared_tools.get_random_key(), _exp)
+        assert np.any(_exp[0] != _results[-1][0])  # parcels changed the bed
+        for _a, _b in zip(_field_copies(_delta), _exp):
+            assert np.all(_a == _b)
+
+    for _res in _results[1:]:
+        for _a, _b in zip(_results[0], _res):
+            assert np.all(_a == _b)
+
+
+def test_route_parcels_speculative_any_chunks(tmp_path):
+    """
+    Test that the speculative routing does not depend on the chunking
+    """
+    _delta = utilities.developed_DeltaModel(
+        tmp_path, sed_routing='speculative', sed_batch_size=10)
+
+    start_indices = shared_tools.get_start_indices(
+        _delta.inlet, np.ones_like(_delta.inlet), 50)
+    _key = shared_tools.get_random_key()
+
+    _results = []
+    _counts = []
+    for _route, _n_chunks in [
+            (sed_tools._route_parcels_speculative, 1),
+            (sed_tools._route_parcels_speculative, 3),
+            (sed_tools._route_parcels_speculative.threaded, 3)]:
+        _routers = utilities.sand_router_chunks(_delta, _n_chunks)
+        _pad_depth = _delta.pad_depth.copy()
+        _fields = (_delta.eta.copy(), _pad_depth[1:-1, 1:-1],
+                   _delta.uw.copy(), _delta.qs.copy())
+        _counts.append(_route(
+            _delta._sr, _routers, start_indices, 10, _key, _fields[0],
+            _delta.stage, _fields[1], _delta.cell_type, _fields[2],
+            _delta.ux.copy(), _delta.uy.copy(), _delta.pad_stage,
+            _pad_depth, _delta.pad_cell_type, _delta.Vp_dep_mud.copy(),
+            _delta.Vp_dep_sand.copy(), _delta.qw, _delta.qx, _delta.qy,
+            _fields[3]))
+        _results.append(_fields)
+
+    # same as routing the parcels one after another, each parcel drawing
+    #   random numbers from its own stream
+    _pad_depth = _delta.pad_depth.copy()
+    _fields = (_delta.eta.copy(), _pad_depth[1:-1, 1:-1],
+               _delta.uw.copy(), _delta.qs.copy())
+    _route_parcels_in_order(
+        _delta._sr, start_indices, _key,
+        (_fields[0], _delta.stage, _fields[1], _delta.cell_type, _fields[2],
+         _delta.ux.copy(), _delta.uy.copy(), _delta.pad_stage, _pad_depth,
+         _delta.pad_cell_type, _delta.Vp_dep_mud.copy(),
+         _delta.Vp_dep_sand.copy(), _delta.qw, _delta.qx, _delta.qy,
+         _fields[3]))
+    _results.append(_fields)
+
+    assert np.any(_results[0][0] != _delta.eta)  # parcels changed the bed
+    assert _counts[0][0] == 5  # windows
+    assert 0 < _counts[0][1] <= 50  # conflicts
+    assert _counts[0] == _counts[1] == _counts[2]
+    for _a, _b, _c, _d in zip(*_results):
+        assert np.all(_a == _b)
+        assert np.all(_a == _c)
+        assert np.all(_a == _d)
+
+
+def test_route_parcels_speculative_small_basin(test_DeltaModel):
+    """
+    Test that the speculative routing in a small basin is the same as
+    routing the parcels one after another, for any window
+    """
+    _delta = _open_basin(test_DeltaModel)
+    _delta.sed_routing = 'speculative'
+    _delta.init_sediment_routers()
+    start_indices = np.array([4, 3, 5, 4, 4, 5, 3, 4])
+    _key = 12345
+
+    _exp = _field_copies(_delta)
+    _route_parcels_in_order(_delta._sr, start_indices, _key, _exp)
+    assert np.any(_exp[0] != _delta.eta)  # parcels changed the bed
+
+    _counts = []
+    for _window in [1, 3, 8]:
+        _fields = _field_copies(_delta)
+        _counts.append(sed_tools._route_parcels_speculative(
+            _delta._sr, _delta._sr_chunks, start_indices, _window, _key,
+            *_fields))
+        for _a, _b in zip(_fields, _exp):
+            assert np.all(_a == _b)
+
+    # parcels from the same inlet conflict only within a window
+    assert _counts[0] == (8, 0)
+    assert _counts[2][0] == 1
+    assert _counts[2][1] > 0
+
+
+def test_topo_diffusion_pass_same_as_convolve(test_DeltaModel):
+    """
+    Test that the fused diffusion pass matches the convolution of the fields
+    with the diffusion kernels
+    """
+    np.random.seed(test_DeltaModel.seed)
+    eta = np.random.uniform(-2, 1, (20, 30)).astype(np.float32)
+    qs = np.random.uniform(0, 1e-3, (20, 30))
+    cell_type = np.random.choice([-2, 0, 1], (20, 30))
+
+    _exp = eta.copy()
+    for _ in range(3):
+        a = ndimage.convolve(_exp, test_DeltaModel.kernel1, mode='constant')
+        b = ndimage.convolve(qs, test_DeltaModel.kernel2, mode='constant')
+        c = ndimage.convolve(qs * _exp, test_DeltaModel.kernel2,
+                             mode='constant')
+        cf = 0.2 * (qs * a - _exp * b + c)
+        cf[cell_type == -2] = 0
+        cf[0, :] = 0
+        _exp += cf
+
+    for _diffuse, _n_chunks in [(sed_tools._topo_diffusion_pass, 1),
+                                (sed_tools._topo_diffusion_pass, 3),
+                                (sed_tools._topo_diffusion_pass.threaded, 3)]:
+        _eta = eta.copy()
+        _cf = np.zeros_like(qs)
+        for _ in range(3):
+            _diffuse(_eta, qs, cell_type, _cf, 0.2, (0, 20, 0, 30),
+                     _n_chunks)
+        assert _eta == pytest.approx(_exp)
+        assert _cf == pytest.approx(cf)
+
+
+def test_get_active_bounds():
+    qs = np.zeros((10, 12))
+    assert sed_tools._get_active_bounds(qs) == (0, 0, 0, 0)
+    qs[3, 5] = 1
+    qs[6, 2] = 1
+    assert sed_tools._get_active_bounds(qs) == (2, 8, 1, 7)
+    qs[0, 11] = 1
+    assert sed_tools._get_active_bounds(qs) == (0, 8, 1, 12)
+
+
+def test_topo_diffusion_active_same_as_domain(tmp_path):
+    """
+    Test that restricting diffusion to the active region does not change
+    the result, nor the cross-diffusion flux outside the active region
+    """
+    _results = []
+    for _region in ['domain', 'active']:
+        _delta = utilities.developed_DeltaModel(
+            tmp_path, _region, diffusion_region=_region)
+        _results.append((_delta.eta.copy(), _delta.cf.copy()))
+
+    assert np.all(_results[0][0] == _results[1][0])
+    assert np.all(_results[0][1] == _results[1][1])
+
+
+def test_topo_diffusion_active_zeroes_flux_outside(test_DeltaModel):
+    """
+    Test that the cross-diffusion flux of a previous step does not remain
+    outside the active region
+    """
+    _delta = _open_basin(test_DeltaModel)
+    _delta.qs[4:6, 3:6] = 0.5
+    _delta.eta[5, 4] = -0.5
+    _eta = _delta.eta.copy()
+    _delta.topo_diffusion()
+    _exp = _delta.cf.copy()
+    assert np.any(_exp != 0)
+
+    _delta.diffusion_region = 'active'
+    _delta.eta[:] = _eta
+    _delta.cf[:] = 1
+    _delta.topo_diffusion()
+    assert np.all(_delta.cf == _exp)
+
+
+def test_sediment_routers_bound_to_fields(test_DeltaModel):
+    """
+    Test that the sediment routers change the model fields in place
+    """
+    _delta = test_DeltaModel
+    _eta = _delta.eta
+    _delta.update()
+    assert _delta.eta is _eta
+    for _router in [_delta._sr, _delta._mr]:
+        assert np.shares_memory(_router.eta, _delta.eta)
+        assert np.shares_memory(_router.qx, _delta.qx)
+        assert np.shares_memory(_router.pad_depth, _delta.depth)
+
+
+def test_sed_route_rebinds_replaced_field(test_DeltaModel):
+    """
+    Test that a replaced field is bound to the routers before routing
+    """
+    _delta = test_DeltaModel
+    _delta.uw = _delta.uw.copy()
+    _delta.sed_route()
+    assert np.shares_memory(_delta._sr.uw, _delta.uw)
+    assert np.shares_memory(_delta._mr.uw, _delta.uw)
+
+
+def test_bind_sediment_routers_bad_dtype(test_DeltaModel):
+    _delta = test_DeltaModel
+    _delta.eta = _delta.eta.astype(np.float64)
+    with pytest.raises(TypeError, match='field `eta`'):
+        _delta.bind_sediment_routers()
@@ -5,6 +5,7 @@ import pytest
 import sys
 import os
 import numpy as np
+from numba import prange
 
 from pyDeltaRCM.model import DeltaModel
 from pyDeltaRCM import shared_tools
@@ -46,6 +47,118 @@ def test_get_steps():
     assert d == pytest.approx(d_exp)
 
 
+def test_get_counter_uniform():
+    """
+    Test for function shared_tools.get_counter_uniform
+    """
+    _u = np.array([shared_tools.get_counter_uniform(42, p, s)
+                   for p in range(50) for s in range(50)])
+    _again = np.array([shared_tools.get_counter_uniform(42, p, s)
+                       for p in range(50) for s in range(50)])
+    _other = np.array([shared_tools.get_counter_uniform(43, p, s)
+                       for p in range(50) for s in range(50)])
+    assert np.all(_u == _again)
+    assert np.all(_u != _other)
+    assert np.all((_u >= 0) & (_u < 1))
+    assert np.mean(_u) == pytest.approx(0.5, abs=0.02)
+    assert len(np.unique(_u)) == len(_u)
+
+
+def test_njit_threaded():
+    """
+    Test for decorator shared_tools.njit_threaded
+    """
+    def _sum_chunks(arr, n_chunks):
+        _sums = np.zeros(n_chunks)
+        for c in prange(n_chunks):
+            for i in range(c * len(arr) // n_chunks,
+                           (c + 1) * len(arr) // n_chunks):
+                _sums[c] += arr[i]
+        return _sums
+
+    _jitted = shared_tools.njit_threaded(_sum_chunks)
+    arr = np.arange(10.)
+    assert np.all(_jitted(arr, 3) == _sum_chunks(arr, 3))
+    assert np.all(_jitted.threaded(arr, 3) == _sum_chunks(arr, 3))
+
+
+def test_random_pick_with_uniform():
+    """
+    Test for function shared_tools.random_pick_with_uniform
+    """
+    probs = np.array([0, 0.25, 0, 0.25, 0, 0.5])
+    assert shared_tools.random_pick_with_uniform(probs, 0.1) == 1
+    assert shared_tools.random_pick_with_uniform(probs, 0.3) == 3
+    assert shared_tools.random_pick_with_uniform(probs, 0.75) == 5
+
+
+def test_pick_from_cumulative():
+    """
+    Test for function shared_tools.pick_from_cumulative
+    """
+    np.random.seed(42)
+    weights = np.random.uniform(0, 1, (20, 9))
+    weights[:, [0, 4]] = 0
+    weights = weights / weights.sum(axis=1)[:, None]
+    cumulative = shared_tools.get_cumulative_table(weights)
+    for i in range(20):
+        for u in np.random.uniform(0, 1, 50):
+            assert shared_tools.pick_from_cumulative(cumulative[i], u) == \
+                shared_tools.random_pick_with_uniform(weights[i], u)
+    # rounding past the sum picks the last index with weight
+    assert shared_tools.pick_from_cumulative(
+        np.array([0, 0.5, 0.9999, 0.9999]), 0.99999) == 2
+
+
+def test_pick_from_alias():
+    """
+    Test for functions shared_tools.get_alias_table and
+    shared_tools.pick_from_alias
+    """
+    weights = np.array([[0, 0.25, 0, 0.25, 0, 0.5],
+                        [0, 0, 0, 0, 0, 0]])
+    prob, alias = shared_tools.get_alias_table(weights)
+    _u = (np.arange(6000) + 0.5) / 6000
+    _picks = np.array([shared_tools.pick_from_alias(prob[0], alias[0], u)
+                       for u in _u])
+    assert np.all(np.bincount(_picks, minlength=6) / 6000 ==
+                  pytest.approx(weights[0], abs=1e-3))
+    # rows without weight pick the middle index
+    assert np.all([shared_tools.pick_from_alias(prob[1], alias[1], u) == 3
+                   for u in _u[::100]])
+
+
+def test_sample_start_indices_same_as_random_pick():
+    inlet = np.array([4, 5, 6, 7, 8])
+    inlet_weights = np.array([1., 0., 2., 1., 0.5])
+
+    shared_tools.set_random_seed(0)
+    _norm = inlet_weights / np.sum(inlet_weights)
+    _picked = inlet.take(
+        np.array([shared_tools.random_pick(_norm) for _ in range(500)]))
+    _after = shared_tools.get_random_uniform(1)
+
+    shared_tools.set_random_seed(0)
+    _cumulative = shared_tools.get_inlet_cumulative(inlet_weights)
+    _sampled = shared_tools.sample_start_indices(inlet, _cumulative, 500)
+
+    assert np.all(_sampled == _picked)
+    assert np.all(_sampled != 5)
+    # the generator state is the same after sampling
+    assert shared_tools.get_random_uniform(1) == _after
+
+    shared_tools.set_random_seed(0)
+    _started = shared_tools.get_start_indices(inlet, inlet_weights, 500)
+    assert np.all(_started == _picked)
+
+
+def test_sample_start_indices_none():
+    inlet = np.array([4, 5, 6])
+    _cumulative = shared_tools.get_inlet_cumulative(np.ones((3,)))
+    _sampled = shared_tools.sample_start_indices(inlet, _cumulative, 0)
+    assert _sampled.shape == (0,)
+
+
 def test_random_pick():
     """
     Test for function shared_tools.random_pick
@@ -118,6 +231,25 @@ def test_custom_unravel_exceed_error():
         x, y = shared_tools.custom_unravel(99, arr.shape)
 
 
+def test_fill_halo():
+    arr = np.arange(50.).reshape((5, 10))
+    padded = np.zeros((7, 12))
+    padded[1:-1, 1:-1] = arr
+    shared_tools.fill_halo(padded)
+    assert np.all(padded == np.pad(arr, 1, 'edge'))
+
+
+def test_get_neighbor_indices():
+    arr = np.arange(50).reshape((5, 10))
+    nbrs = shared_tools.get_neighbor_indices(arr.shape)
+    assert nbrs.shape == (50, 9)
+    assert nbrs.dtype == np.int32
+    # interior cell, same as the 3x3 neighborhood of the cell
+    assert np.all(nbrs[34] == arr[2:5, 3:6].ravel())
+    # corner cell, with neighbors outside the domain
+    assert np.all(nbrs[9] == [-1, -1, -1, 8, 9, -1, 18, 19, -1])
+
+
 def test_get_weight_sfc_int(test_DeltaModel):
 
     np.random.seed(test_DeltaModel.seed)
@@ -163,6 +295,78 @@ def test_get_weight_at_cell(test_DeltaModel):
     assert np.any(wts[[3, 6, 7, 8]] != 0)
 
 
+def test_fill_weight_at_cell(test_DeltaModel):
+    """
+    Test that shared_tools.fill_weight_at_cell gives the same weights as
+    shared_tools.get_weight_sfc_int followed by
+    shared_tools.get_weight_at_cell, in the precisions of the water and
+    sediment routing
+    """
+    np.random.seed(test_DeltaModel.seed)
+    stage = np.random.uniform(0.5, 1, (6, 8)).astype(np.float32)
+    depth = (stage - np.random.uniform(0, 0.85, (6, 8))).clip(0)
+    depth = depth.astype(np.float32)
+    cell_type = np.random.choice([-2, 0, 1], (6, 8))
+    qx = np.random.uniform(-1, 1, (6, 8))
+    qy = np.random.uniform(-1, 1, (6, 8))
+    pad_stage = np.pad(stage, 1, 'edge')
+    pad_depth = np.pad(depth, 1, 'edge')
+    pad_cell_type = np.pad(cell_type, 1, 'edge')
+    for dtype, gamma, theta in [(np.float64, 0.001962, 1.),
+                                (np.float32, np.float32(0.001962),
+                                 np.float32(2.))]:
+        ivec = test_DeltaModel.ivec_flat.astype(dtype)
+        jvec = test_DeltaModel.jvec_flat.astype(dtype)
+        dists = test_DeltaModel.distances_flat.astype(dtype)
+        weight = np.zeros(9)
+        for i in range(6):
+            for j in range(8):
+                weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
+                    stage[i, j], pad_stage[i:i + 3, j:j + 3].ravel(),
+                    qx[i, j], qy[i, j], ivec, jvec, dists)
+                _exp = shared_tools.get_weight_at_cell(
+                    (i, j), weight_sfc, weight_int,
+                    pad_depth[i:i + 3, j:j + 3].ravel(),
+                    pad_cell_type[i:i + 3, j:j + 3].ravel(), 0.1, gamma,
+                    theta)
+                shared_tools.fill_weight_at_cell(
+                    weight, i, j, stage, pad_stage, pad_depth,
+                    pad_cell_type, qx, qy, ivec, jvec, dists, 0.1, gamma,
+                    theta)
+                assert np.all(weight == _exp)
+
+
+def test_fill_weight_at_cell_nan_stage(test_DeltaModel):
+    """
+    Test that shared_tools.fill_weight_at_cell gives the same weights as
+    the array functions at a cell where the stage is nan
+    """
+    stage = np.full((3, 3), 0.5, dtype=np.float32)
+    stage[1, 1] = np.nan
+    depth = np.ones((3, 3), dtype=np.float32)
+    cell_type = np.zeros((3, 3), dtype=np.int64)
+    qx = np.ones((3, 3))
+    qy = np.zeros((3, 3))
+    pad_stage = np.pad(stage, 1, 'edge')
+    pad_depth = np.pad(depth, 1, 'edge')
+    pad_cell_type = np.pad(cell_type, 1, 'edge')
+    ivec = test_DeltaModel.ivec_flat
+    jvec = test_DeltaModel.jvec_flat
+    dists = test_DeltaModel.distances_flat
+
+    weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
+        stage[1, 1], pad_stage[1:4, 1:4].ravel(), qx[1, 1], qy[1, 1],
+        ivec, jvec, dists)
+    _exp = shared_tools.get_weight_at_cell(
+        (1, 1), weight_sfc, weight_int, pad_depth[1:4, 1:4].ravel(),
+        pad_cell_type[1:4, 1:4].ravel(), 0.1, 0.001962, 1.)
+    weight = np.zeros(9)
+    shared_tools.fill_weight_at_cell(
+        weight, 1, 1, stage, pad_stage, pad_depth, pad_cell_type, qx, qy,
+        ivec, jvec, dists, 0.1, 0.001962, 1.)
+    assert np.all(weight == _exp)
+
+
 def test_version_is_valid():
     v = shared_tools._get_version()
     assert type(v) is str
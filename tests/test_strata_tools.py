@@ -0,0 +1,108 @@
+# unit tests for strata_tools.py
+
+import pytest
+
+import sys
+import os
+import numpy as np
+import netCDF4
+
+from pyDeltaRCM.model import DeltaModel
+from pyDeltaRCM import strata_tools
+import utilities
+
+
+def _write_strata(path, strata_depth, strata_sand_frac):
+    nc = netCDF4.Dataset(path, 'w', format='NETCDF4')
+    nc.createDimension('total_strata_age', strata_depth.shape[0])
+    nc.createDimension('length', strata_depth.shape[1])
+    nc.createDimension('width', strata_depth.shape[2])
+    _dims = ('total_strata_age', 'length', 'width')
+    nc.createVariable('strata_depth', np.float32, _dims)[:] = strata_depth
+    nc.createVariable('strata_sand_frac', np.float32,
+                      _dims)[:] = strata_sand_frac
+    nc.close()
+
+
+def _expected_cube(strata_depth, strata_sand_frac, vertical_spacing,
+                   max_depth_of_section):
+    # cells filled by the oldest preserved deposit with a sand fraction
+    nz = int(max_depth_of_section / vertical_spacing)
+    strata_depth = strata_depth.astype(np.float64)
+    strata_sand_frac = strata_sand_frac.astype(np.float64)
+    strata = np.minimum.accumulate(strata_depth[::-1], axis=0)[::-1]
+    height = np.arange(nz)[::-1] * vertical_spacing - max_depth_of_section
+    cube = -1 * np.ones((nz,) + strata_depth.shape[1:], dtype=np.float32)
+    for i in np.arange(strata_depth.shape[0] - 1, -1, -1):
+        _top = np.floor((strata[i] + max_depth_of_section) / vertical_spacing)
+        _within = (np.arange(nz)[::-1, np.newaxis, np.newaxis] <= _top)
+        _fill = _within & (strata_sand_frac[i] > 0)
+        cube[_fill] = np.broadcast_to(strata_sand_frac[i], cube.shape)[_fill]
+    return cube
+
+
+def _random_strata(seed, shape):
+    _rng = np.random.default_rng(seed)
+    strata_depth = (np.cumsum(_rng.normal(0.02, 0.1, shape), axis=0)
+                    - 1).astype(np.float32)
+    strata_sand_frac = _rng.uniform(-0.5, 1, shape).astype(np.float32)
+    strata_sand_frac[strata_sand_frac < 0] = -1
+    return strata_depth, strata_sand_frac
+
+
+def test_build_cube(tmp_path):
+    strata_depth, strata_sand_frac = _random_strata(0, (30, 7, 5))
+    nc_path = os.path.join(tmp_path, 'strata.nc')
+    _write_strata(nc_path, strata_depth, strata_sand_frac)
+    npy_path = os.path.join(tmp_path, 'cube.npy')
+    cube = strata_tools.build_cube(nc_path, npy_path, vertical_spacing=0.1,
+                                   max_depth_of_section=2)
+    assert cube.shape == (20, 7, 5)
+    assert cube.dtype == np.float32
+    _expected = _expected_cube(strata_depth, strata_sand_frac, 0.1, 2)
+    assert np.all(cube == _expected)
+    # both filled and empty cells
+    assert np.any(cube == -1)
+    assert np.any(cube > 0)
+    assert np.all(np.load(npy_path) == _expected)
+
+
+def test_build_cube_any_chunks(tmp_path):
+    strata_depth, strata_sand_frac = _random_strata(1, (25, 11, 6))
+    nc_path = os.path.join(tmp_path, 'strata.nc')
+    _write_strata(nc_path, strata_depth, strata_sand_frac)
+    _cubes = []
+    for _rows, _threaded in [(16, False), (1, False), (4, True)]:
+        npy_path = os.path.join(
+            tmp_path, 'cube_{0}_{1}.npy'.format(_rows, _threaded))
+        _cubes.append(np.array(strata_tools.build_cube(
+            nc_path, npy_path, vertical_spacing=0.05,
+            max_depth_of_section=2, rows_per_chunk=_rows,
+            threaded=_threaded)))
+    assert np.all(_cubes[0] == _cubes[1])
+    assert np.all(_cubes[0] == _cubes[2])
+
+
+def test_build_cube_from_model_output(tmp_path):
+    p = utilities.yaml_from_dict(tmp_path, 'input.yaml',
+                                 {'out_dir': tmp_path / 'out_dir',
+                                  'Length': 10.0, 'Width': 10.0,
+                                  'dx': 1.0, 'L0_meters': 1.0,
+                                  'Np_water': 10, 'N0_meters': 2.0,
+                                  'h0': 1.0, 'Np_sed': 10,
+                                  'C0_percent': 0.1, 'save_dt': 300,
+                                  'save_strata': True,
+                                  'seed': 0})
+    _delta = DeltaModel(input_file=p)
+    for _ in range(5):
+        _delta.update()
+    _delta.finalize()
+    nc_path = os.path.join(tmp_path / 'out_dir', 'pyDeltaRCM_output.nc')
+    npy_path = os.path.join(tmp_path / 'out_dir', 'stratigraphy.npy')
+    cube = strata_tools.build_cube(nc_path, npy_path)
+    assert cube.shape == (100, 10, 10)
+    with netCDF4.Dataset(nc_path) as nc:
+        _expected = _expected_cube(nc.variables['strata_depth'][:].data,
+                                   nc.variables['strata_sand_frac'][:].data,
+                                   0.05, 5)
+    assert np.all(cube == _expected)
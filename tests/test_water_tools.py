@@ -7,6 +7,8 @@ import os
 import numpy as np
 
 from utilities import test_DeltaModel
+import utilities
+from pyDeltaRCM.model import DeltaModel
 from pyDeltaRCM import water_tools
 from pyDeltaRCM import shared_tools
 
@@ -66,6 +68,40 @@ def test_pad_cell_type(test_DeltaModel):
     assert a == 12
 
 
+def test_pad_fields_are_views(test_DeltaModel):
+    """
+    Test that the depth and cell type are the interior of the padded fields
+    """
+    test_DeltaModel.init_water_iteration()
+    for _field, _pad in [('depth', 'pad_depth'),
+                         ('cell_type', 'pad_cell_type')]:
+        _f = getattr(test_DeltaModel, _field)
+        _p = getattr(test_DeltaModel, _pad)
+        assert np.shares_memory(_f, _p)
+        assert np.all(_p == np.pad(_f, 1, 'edge'))
+    assert np.all(test_DeltaModel.pad_stage ==
+                  np.pad(test_DeltaModel.stage, 1, 'edge'))
+
+
+def _check_for_loops(free_surf_walk_indices, new_indices, _step,
+                     L0, looped, domain_shape, CTR, free_surf_flag):
+    """Check for loops by searching the walk of each parcel.
+
+    Reference for water_tools._check_for_visited_loops, searching the entire
+    recorded walk of each parcel for a repeated index at every step.
+    """
+    if (_step > L0):
+        for p in range(free_surf_walk_indices.shape[0]):
+            walk = free_surf_walk_indices[p, :]
+            _walk = walk[walk > 0]
+            if (new_indices[p] > 0) and (len(_walk) != len(set(_walk))):
+                looped[p] += 1
+                new_indices[p] = water_tools._relocate_looped_parcel(
+                    new_indices[p], L0, domain_shape, CTR)
+                free_surf_flag[p] = -1
+    return new_indices, looped, free_surf_flag
+
+
 def test_check_for_loops():
 
     idxs = np.array(
@@ -78,7 +114,7 @@ def test_check_for_loops():
     L0 = 1
     looped = np.array([0, 0])
 
-    nidx, looped, free = water_tools._check_for_loops(
+    nidx, looped, free = _check_for_loops(
         idxs, nidx, itt, L0, looped, (10, 10), CTR, free)
 
     assert np.all(nidx == [41, 6])
@@ -86,6 +122,140 @@ def test_check_for_loops():
     assert np.all(free == [-1, 1])
 
 
+def test_check_for_visited_loops():
+
+    idxs = np.array(
+        [[0, 11, 12, 13, 23, 22, 12],
+         [0, 1, 2, 3, 4, 5, 16]])
+    nidx = np.array([21, 6])
+    itt = 6
+    free = np.array([1, 1])
+    CTR = 4
+    L0 = 1
+    looped = np.array([0, 0])
+
+    has_repeat = np.zeros(2, dtype=np.bool_)
+    visited, n_visited = np.zeros(0, dtype=np.int64), 0
+    for _step in range(itt + 1):
+        visited, n_visited = water_tools._record_visits(
+            idxs[:, _step], visited, n_visited, has_repeat, 100)
+    assert np.all(has_repeat == [True, False])
+    assert n_visited == 11
+
+    nidx, looped, free = water_tools._check_for_visited_loops(
+        nidx, has_repeat, itt, L0, looped, (10, 10), CTR, free)
+
+    assert np.all(nidx == [41, 6])
+    assert np.all(looped == [1, 0])
+    assert np.all(free == [-1, 1])
+
+
+def test_check_for_visited_loops_same_as_check_for_loops():
+    # random walks over few cells, with some repeated indices, which stop at
+    #   the first zero index
+    np.random.seed(0)
+    walks = np.random.randint(0, 30, size=(50, 40))
+    walks[:, 0] = np.random.randint(1, 30, size=50)
+    walks *= np.cumprod(walks != 0, axis=1)
+
+    has_repeat = np.zeros(50, dtype=np.bool_)
+    visited, n_visited = water_tools._record_visits(
+        walks[:, 0], np.zeros(0, dtype=np.int64), 0, has_repeat, 100)
+    for _step in range(1, 40):
+        _recorded = np.zeros_like(walks)
+        _recorded[:, :_step] = walks[:, :_step]
+        _exp = _check_for_loops(
+            _recorded, walks[:, _step].copy(), _step, 3,
+            np.zeros(50, dtype=np.int64), (10, 10), 4,
+            np.zeros(50, dtype=np.int64))
+        _res = water_tools._check_for_visited_loops(
+            walks[:, _step].copy(), has_repeat, _step, 3,
+            np.zeros(50, dtype=np.int64), (10, 10), 4,
+            np.zeros(50, dtype=np.int64))
+        for _e, _r in zip(_exp, _res):
+            assert np.all(_e == _r)
+
+        visited, n_visited = water_tools._record_visits(
+            walks[:, _step], visited, n_visited, has_repeat, 100)
+
+    assert np.any(has_repeat)
+    assert np.any(walks[:, -1] == 0)  # some parcels stopped
+    assert n_visited == np.sum(visited >= 0)
+    assert 4 * n_visited <= 3 * visited.shape[0]
+
+
+def test_record_visits_drops_stopped_parcels():
+    # parcels take distinct steps, and all but the last parcel stop early
+    walks = np.arange(1, 4001).reshape(10, 400)
+    walks[:-1, 20:] = 0
+
+    has_repeat = np.zeros(10, dtype=np.bool_)
+    visited, n_visited = np.zeros(0, dtype=np.int64), 0
+    for _step in range(400):
+        visited, n_visited = water_tools._record_visits(
+            walks[:, _step], visited, n_visited, has_repeat, 10000)
+        assert n_visited == np.sum(visited >= 0)
+        assert 4 * n_visited <= 3 * visited.shape[0]
+    assert not np.any(has_repeat)
+
+    # only the keys of the last parcel are kept
+    assert n_visited == 400
+    assert np.all(np.sort(visited[visited >= 0]) == 9 * 10000 + walks[-1])
+    assert visited.shape[0] <= 1024
+
+
+def test_parcel_walks():
+    """
+    Test recording and decoding pathways with water_tools.ParcelWalks
+    """
+    walks = water_tools.ParcelWalks(3, (10, 10), 2, 2)
+    assert walks.capacity() == 2
+    walks.reset(np.array([44, 15, 55]))
+
+    # all 8 directions for parcel 0, one step and stop for parcel 1, and a
+    #   relocation away from the last cell for parcel 2
+    steps = np.array([[55, 16, 77],
+                      [65, 0, 78],
+                      [74, 0, 0],
+                      [73, 0, 0],
+                      [62, 0, 0],
+                      [52, 0, 0],
+                      [43, 0, 0],
+                      [44, 0, 0]])
+    for _step in range(steps.shape[0]):
+        walks.reserve(_step + 1)
+        walks.record_all(steps[_step])
+
+    assert walks.capacity() == 8
+    assert len(walks.chunks) == 4
+    assert np.all(walks.length == [8, 1, 0])
+    assert walks.max_length() == 8
+    assert np.all(walks.get_indices(0) == np.hstack((44, steps[:, 0])))
+    assert np.all(walks.get_indices(1) == [15, 16])
+    assert np.all(walks.get_indices(2) == [55])
+
+    walks.clear()
+    assert np.all(walks.length == 0)
+
+
+def _calculate_new_ind(indices, new_cells, iwalk, jwalk, domain_shape):
+    """Calculate the new location (indices) of parcels.
+
+    Reference for water_tools._get_new_ind, unraveling the index of each
+    parcel, stepping in its D8 direction, and raveling the index again.
+    """
+    newbies = []
+    for p, q in zip(indices, new_cells):
+        if q != 4:
+            ind_tuple = shared_tools.custom_unravel(p, domain_shape)
+            new_ind = (ind_tuple[0] + jwalk[q],
+                       ind_tuple[1] + iwalk[q])
+            newbies.append(shared_tools.custom_ravel(new_ind, domain_shape))
+        else:
+            newbies.append(0)
+    return np.array(newbies)
+
+
 def test_calculate_new_ind():
 
     cidx = np.array([12, 16, 16])
@@ -93,12 +263,76 @@ def test_calculate_new_ind():
     iwalk = shared_tools.get_iwalk()
     jwalk = shared_tools.get_jwalk()
 
-    nidx = water_tools._calculate_new_ind(cidx, ncel, iwalk.flatten(), jwalk.flatten(), (10, 10))
+    nidx = _calculate_new_ind(cidx, ncel, iwalk.flatten(), jwalk.flatten(), (10, 10))
+
+    nidx_exp = np.array([21, 6, 0])
+    assert np.all(nidx == nidx_exp)
+
+
+def test_get_new_ind():
+
+    cidx = np.array([12, 16, 16])
+    ncel = np.array([6, 1, 4])
+    neighbor_indices = shared_tools.get_neighbor_indices((10, 10))
+
+    nidx = water_tools._get_new_ind(cidx, ncel, neighbor_indices)
 
     nidx_exp = np.array([21, 6, 0])
     assert np.all(nidx == nidx_exp)
 
 
+def test_get_new_ind_same_as_calculate_new_ind():
+    # every direction from every cell away from the edges of the domain
+    cidx = np.repeat(np.arange(100).reshape(10, 10)[1:-1, 1:-1].ravel(), 9)
+    ncel = np.tile(np.arange(9), 64)
+    iwalk = shared_tools.get_iwalk()
+    jwalk = shared_tools.get_jwalk()
+    neighbor_indices = shared_tools.get_neighbor_indices((10, 10))
+
+    nidx = water_tools._get_new_ind(cidx, ncel, neighbor_indices)
+
+    nidx_exp = _calculate_new_ind(
+        cidx, ncel, iwalk.flatten(), jwalk.flatten(), (10, 10))
+    assert np.all(nidx == nidx_exp)
+
+
+def _choose_next_direction(inds, water_weights):
+    """Get new cell locations, based on water weights.
+
+    Reference for water_tools._choose_next_direction_from_table, picking the
+    direction of each parcel from the weights of its cell with
+    shared_tools.random_pick.
+    """
+    new_cells = []
+    for ind in inds:
+        if ind != 0:
+            new_cells.append(shared_tools.random_pick(water_weights[ind, :]))
+        else:
+            new_cells.append(4)
+    return np.array(new_cells)
+
+
+def test_choose_next_direction_from_table_same_as_choose_next_direction():
+    # normalized weights of a few cells, and parcels at some of the cells
+    np.random.seed(0)
+    weights = np.random.uniform(0, 1, (30, 9))
+    weights[weights < 0.3] = 0
+    weights = weights / weights.sum(axis=1, keepdims=True)
+    inds = np.random.randint(0, 30, size=200)
+    alias = np.zeros((0, 9), dtype=np.int64)
+
+    for table, sampling in [(weights, 0),
+                            (shared_tools.get_cumulative_table(weights), 1)]:
+        shared_tools.set_random_seed(0)
+        new_cells_exp = _choose_next_direction(inds, weights)
+        shared_tools.set_random_seed(0)
+        new_cells = water_tools._choose_next_direction_from_table(
+            inds, table, alias, sampling)
+
+        assert np.all(new_cells[inds == 0] == 4)
+        assert np.all(new_cells == new_cells_exp)
+
+
 def test_update_dirQfield(test_DeltaModel):
     """
     Test for function water_tools._update_dirQfield
@@ -129,4 +363,201 @@ def test_update_absQfield(test_DeltaModel):
     qwdiff = qwn - qw
     diffelem = test_DeltaModel.Qp_water / test_DeltaModel.dx / 2
     qwdiff_exp = np.array([diffelem, diffelem, 0])
-    assert np.all(qwdiff[3:6] == pytest.approx(qwdiff_exp))
\ No newline at end of file
+    assert np.all(qwdiff[3:6] == pytest.approx(qwdiff_exp))
+
+
+def test_route_all_water_parcels_same_as_stepwise(tmp_path):
+    """
+    Test that the fused water routing gives the same result as stepwise
+    """
+    _delta = utilities.developed_DeltaModel(tmp_path)
+
+    _rng_state = shared_tools.get_random_state()
+    _delta.init_water_iteration()
+    _delta.run_water_iteration()
+    _stepwise = [np.copy(_delta.qxn), np.copy(_delta.qyn),
+                 np.copy(_delta.qwn), np.copy(_delta.free_surf_walks.start),
+                 np.copy(_delta.free_surf_walks.length),
+                 np.copy(_delta.looped), np.copy(_delta.free_surf_flag)]
+    _stepwise_walks = [_delta.free_surf_walks.get_indices(p)
+                       for p in range(_delta.Np_water)]
+
+    shared_tools.set_random_state(_rng_state)
+    _delta.water_routing = 'fused'
+    _delta.init_water_iteration()
+    _delta.run_water_iteration()
+    _fused = [_delta.qxn, _delta.qyn, _delta.qwn,
+              _delta.free_surf_walks.start, _delta.free_surf_walks.length,
+              _delta.looped, _delta.free_surf_flag]
+    _fused_walks = [_delta.free_surf_walks.get_indices(p)
+                    for p in range(_delta.Np_water)]
+
+    for _s, _f in zip(_stepwise + _stepwise_walks, _fused + _fused_walks):
+        assert _s.shape == _f.shape
+        assert np.all(_s == _f)
+
+
+def test_run_water_iteration_compacted_same_as_stepwise(tmp_path):
+    """
+    Test that the compacted water routing gives the same result as stepwise
+    """
+    _delta = utilities.developed_DeltaModel(tmp_path)
+
+    _results = []
+    _rng_state = shared_tools.get_random_state()
+    for _water_routing in ['stepwise', 'compacted']:
+        shared_tools.set_random_state(_rng_state)
+        _delta.water_routing = _water_routing
+        _delta.init_water_iteration()
+        _delta.run_water_iteration()
+        _results.append(
+            [np.copy(_delta.qxn), np.copy(_delta.qyn), np.copy(_delta.qwn),
+             np.copy(_delta.free_surf_walks.length), np.copy(_delta.looped),
+             np.copy(_delta.free_surf_flag)] +
+            [_delta.free_surf_walks.get_indices(p)
+             for p in range(_delta.Np_water)])
+
+    assert np.any(_results[0][4] > 0)  # some parcels looped
+    for _s, _c in zip(*_results):
+        assert _s.shape == _c.shape
+        assert np.all(_s == _c)
+
+
+def test_route_all_water_parcels_parcelwise_any_chunks(tmp_path):
+    """
+    Test that the parcelwise water routing does not depend on the chunking
+    """
+    _delta = utilities.developed_DeltaModel(
+        tmp_path, water_routing='parcelwise')
+
+    _delta.init_water_iteration()
+    _delta.get_water_weight_array()
+    start_indices = shared_tools.get_start_indices(
+        _delta.inlet, np.ones_like(_delta.inlet), _delta.Np_water)
+    _key = shared_tools.get_random_key()
+
+    _results = []
+    _walks = []
+    for _route, _n_chunks in [
+            (water_tools._route_all_water_parcels_parcelwise, 1),
+            (water_tools._route_all_water_parcels_parcelwise, 3),
+            (water_tools._route_all_water_parcels_parcelwise.threaded, 3)]:
+        _walk = water_tools.ParcelWalks(
+            _delta.Np_water, _delta.eta.shape, _delta.stepmax, 10)
+        _walk.reset(start_indices)
+        _results.append(_route(
+            start_indices, _delta.water_sampling_table,
+            _delta.water_sampling_alias, 0,
+            _delta.cell_type, np.zeros_like(_delta.qxn),
+            np.zeros_like(_delta.qyn), np.zeros_like(_delta.qwn), _walk,
+            np.zeros_like(_delta.looped), np.zeros_like(_delta.looped),
+            _delta.iwalk_flat, _delta.jwalk_flat, _delta.neighbor_indices,
+            _delta.stepmax, _delta.L0, _delta.CTR, _delta.Qp_water,
+            _delta.dx, _key, _n_chunks))
+        _walks.append([_walk.get_indices(p) for p in range(_delta.Np_water)])
+
+    for _a, _b, _c in zip(*_results):
+        assert np.all(_a == _b)
+        assert np.all(_a == _c)
+    for _a, _b, _c in zip(*_walks):
+        assert np.all(_a == _b)
+        assert np.all(_a == _c)
+    assert np.any(_results[0][0] != 0)  # parcels were routed
+    assert np.all([_w[0] for _w in _walks[0]] == start_indices)
+
+
+def test_accumulate_free_surface_walks_any_chunks(tmp_path):
+    """
+    Test that the free surface accumulation does not depend on the chunking
+    """
+    _delta = utilities.developed_DeltaModel(tmp_path)
+
+    _delta.init_water_iteration()
+    _delta.run_water_iteration()
+
+    _results = []
+    for _accumulate, _n_chunks in [
+            (water_tools._accumulate_free_surface_walks, 1),
+            (water_tools._accumulate_free_surface_walks, 3),
+            (water_tools._accumulate_free_surface_walks.threaded, 3)]:
+        _results.append(_accumulate(
+            _delta.free_surf_walks, _delta.looped, _delta.cell_type,
+            _delta.uw, _delta.ux, _delta.uy, _delta.depth, _delta.dx,
+            _delta.u0, _delta.h0, _delta.H_SL, _delta.S0, _n_chunks))
+
+    assert np.any(_results[0][0] > 0)  # parcels contributed
+    for _visit, _sum in _results[1:]:
+        assert np.all(_visit == _results[0][0])
+        assert np.all(_sum == pytest.approx(_results[0][1]))
+
+
+def test_get_water_weight_array_same_as_per_cell(tmp_path):
+    """
+    Test that the whole-grid weight kernel matches the per-cell functions
+    """
+    _delta = utilities.developed_DeltaModel(tmp_path)
+
+    _delta.init_water_iteration()
+    _expected = np.zeros((_delta.L, _delta.W, 9))
+    for i in range(_delta.L):
+        for j in range(_delta.W):
+            weight_sfc, weight_int = shared_tools.get_weight_sfc_int(
+                _delta.stage[i, j],
+                _delta.pad_stage[i:i + 3, j:j + 3].ravel(),
+                _delta.qx[i, j], _delta.qy[i, j], _delta.ivec_flat,
+                _delta.jvec_flat, _delta.distances_flat)
+            _expected[i, j] = shared_tools.get_weight_at_cell(
+                (i, j), weight_sfc, weight_int,
+                _delta.pad_depth[i:i + 3, j:j + 3].ravel(),
+                _delta.pad_cell_type[i:i + 3, j:j + 3].ravel(),
+                _delta.dry_depth, _delta.gamma, _delta.theta_water)
+
+    _delta.get_water_weight_array()
+    assert np.all(_delta.water_weights == _expected)
+
+    _weights = water_tools._get_water_weight_array.threaded(
+        _delta.stage, _delta.pad_stage, _delta.pad_depth,
+        _delta.pad_cell_type, _delta.qx, _delta.qy, _delta.ivec_flat,
+        _delta.jvec_flat, _delta.distances_flat, _delta.dry_depth,
+        _delta.gamma, _delta.theta_water, 4)
+    assert np.all(_weights == _expected)
+
+
+def test_run_water_iteration_cumulative_same_as_search(tmp_path):
+    """
+    Test that sampling from cumulative weights gives identical results
+    """
+    _results = []
+    for _sampling in ['search', 'cumulative']:
+        _delta = utilities.developed_DeltaModel(
+            tmp_path, _sampling, water_sampling=_sampling)
+        _results.append((_delta.qwn.copy(), _delta.eta.copy()))
+
+    assert np.all(_results[0][0] == _results[1][0])
+    assert np.all(_results[0][1] == _results[1][1])
+
+
+def test_get_water_weight_array_alias_table(tmp_path):
+    """
+    Test that the alias table of every cell reproduces the water weights
+    """
+    _delta = utilities.developed_DeltaModel(tmp_path, water_sampling='alias')
+
+    _delta.init_water_iteration()
+    _delta.get_water_weight_array()
+    _prob = _delta.water_sampling_table
+    _alias = _delta.water_sampling_alias
+    _weights = _delta.water_weights.reshape(-1, 9)
+
+    # probability of picking each index, summed over the columns of the table
+    _picked = _prob.copy()
+    for k in range(9):
+        np.add.at(_picked, (np.arange(_prob.shape[0]), _alias[:, k]),
+                  1 - _prob[:, k])
+    _picked = _picked / 9
+    _sums = _weights.sum(axis=1)
+    _wet = _sums > 0
+    assert np.any(_wet)
+    assert _picked[_wet] == pytest.approx(
+        _weights[_wet] / _sums[_wet, None])
+    assert np.all(_picked[~_wet, 4] == 1)
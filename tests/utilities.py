@@ -3,6 +3,8 @@ import os
 import glob
 
 import pytest
+from numba import typed
+
 from pyDeltaRCM.model import DeltaModel
 
 # utilities for file writing
@@ -81,6 +83,36 @@ def test_DeltaModel(tmp_path):
     return _delta
 
 
+def developed_DeltaModel(tmp_path, name='out_dir', **kwargs):
+    """Get a 600 x 600 m model, after one update to develop the flow field.
+
+    The keyword arguments override the default parameters of the model. The
+    model is written to ``tmp_path / name``, so that several models can be
+    compared within one test.
+    """
+    _dict = {'out_dir': tmp_path / name, 'seed': 42,
+             'Length': 600., 'Width': 600., 'dx': 10,
+             'Np_water': 100, 'Np_sed': 100, 'f_bedload': 0.5}
+    _dict.update(kwargs)
+    p = yaml_from_dict(tmp_path, name + '.yaml', _dict)
+    _delta = DeltaModel(input_file=p)
+    _delta.update()
+    return _delta
+
+
+def sand_router_chunks(_delta, n_chunks):
+    """Get the sand routers of `n_chunks` chunks of the batched routings.
+
+    Each router is built by initializing the sediment routers of the model
+    again, so that it has the same parameters as the routers of the model.
+    """
+    _routers = typed.List()
+    for _ in range(n_chunks):
+        _delta.init_sediment_routers()
+        _routers.append(_delta._sr_chunks[0])
+    return _routers
+
+
 def read_endtime_from_log(log_folder):
     _logs = glob.glob(os.path.join(log_folder, '*.log'))
     assert len(_logs) == 1  # log file exists